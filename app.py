@@ -6,8 +6,11 @@ import os
 import threading
 import queue
 import datetime
+import itertools
 import json
 import argparse
+import sqlite3
+import time
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
 from flask_wtf import FlaskForm
 from wtforms import StringField, BooleanField, IntegerField, TextAreaField, SubmitField, SelectField
@@ -18,6 +21,15 @@ import ia_downloader
 parser = argparse.ArgumentParser(description='Internet Archive Downloader')
 parser.add_argument('--download-dir', dest='download_dir', default='downloads',
                     help='Directory to store downloads (default: downloads)')
+parser.add_argument('--connections', dest='connections',
+                    type=ia_downloader.check_argument_int_greater_than_one, default=5,
+                    help='Maximum simultaneous download connections across all tasks (default: 5)')
+parser.add_argument('--ratelimit', dest='ratelimit', type=ia_downloader.check_argument_rate,
+                    help="Maximum combined download rate across all tasks (e.g. '2M'); can be "
+                         "changed while running using the /api/limits endpoint")
+parser.add_argument('--prefetch', dest='prefetch', type=int, default=4,
+                    help='Number of upcoming items to fetch metadata for while an item downloads '
+                         '(default: 4)')
 args = parser.parse_args()
 
 # Initialize Flask app
@@ -40,6 +52,151 @@ download_status = {}
 status_lock = threading.Lock()
 # Worker thread reference
 worker_thread = None
+# Connection budget shared by all download tasks; each task's thread and split counts are limits
+# within this budget
+connection_budget = ia_downloader.ConnectionBudget(args.connections)
+# Bandwidth limits apply to all download tasks, and can be changed while downloads are running
+ia_downloader.bandwidth_limiter.set_limits(args.ratelimit)
+
+class TaskStore:
+    """SQLite database of download task definitions, their status and the items they have reached,
+    so that tasks (and their history) survive restarts of the web app (one connection per thread)
+
+    Credentials are not stored - they have already been saved to the internetarchive
+    library's configuration when the task was first run
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    definition TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_time REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS task_items (
+                    task_id TEXT NOT NULL,
+                    identifier TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    PRIMARY KEY (task_id, identifier)
+                ) WITHOUT ROWID;
+            """)
+
+    def connection(self):
+        """Return this thread's connection to the database, opening it if needed"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=60)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def add_task(self, task, status):
+        """Store a new task's definition and initial status"""
+        definition = {key: value for key, value in task.items() if key != 'credentials'}
+        with self.connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?)',
+                (task['id'], json.dumps(definition), self.status_json(status), time.time()))
+        self.add_task_items(task['id'], task.get('identifiers', []))
+
+    def add_task_items(self, task_id, identifiers):
+        """Add identifiers (e.g. found by a task's searches) to the end of a task's items, in one
+        transaction"""
+        with self.connection() as connection:
+            next_position = connection.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM task_items WHERE task_id = ?',
+                (task_id,)).fetchone()[0]
+            connection.executemany(
+                'INSERT OR IGNORE INTO task_items VALUES (?, ?, ?, ?)',
+                [(task_id, identifier, position, 'pending')
+                 for position, identifier in enumerate(identifiers, next_position)])
+
+    def set_item_state(self, task_id, identifier, state):
+        """Record that a task has started ('started') or finished ('completed') an item - an item
+        that has been completed stays completed if it is started again when a task resumes"""
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE task_items SET state = ? WHERE task_id = ? AND identifier = ?"
+                " AND (state != 'completed' OR ? = 'completed')",
+                (state, task_id, identifier, state))
+
+    @staticmethod
+    def status_json(status):
+        """Return a task's status as JSON - its identifiers are stored as the task's items"""
+        return json.dumps({key: value for key, value in status.items() if key != 'identifiers'})
+
+    def save_status(self, task_id, status_json):
+        """Replace the stored status of a task with a snapshot taken by status_json"""
+        with self.connection() as connection:
+            connection.execute('UPDATE tasks SET status = ? WHERE id = ?', (status_json, task_id))
+
+    def get_definition(self, task_id):
+        """Return a task's definition, or None if there is no such task"""
+        task_row = self.connection().execute(
+            'SELECT definition FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return json.loads(task_row[0]) if task_row is not None else None
+
+    def get_status(self, task_id):
+        """Return a task's status (including its items' identifiers and how many of those have
+        been completed), or None if there is no such task"""
+        task_row = self.connection().execute(
+            'SELECT status FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        if task_row is None:
+            return None
+        return self.with_items(task_id, json.loads(task_row[0]))
+
+    def get_statuses(self):
+        """Return the status of every task, keyed by task ID (oldest first)"""
+        return {
+            task_id: self.with_items(task_id, json.loads(status))
+            for task_id, status in self.connection().execute(
+                'SELECT id, status FROM tasks ORDER BY created_time')
+        }
+
+    def with_items(self, task_id, status):
+        """Add a task's items to its stored status"""
+        status['identifiers'] = []
+        status['completed_items'] = 0
+        for identifier, state in self.connection().execute(
+                'SELECT identifier, state FROM task_items WHERE task_id = ? ORDER BY position',
+                (task_id,)):
+            status['identifiers'].append(identifier)
+            if state == 'completed':
+                status['completed_items'] += 1
+        return status
+
+    def get_unfinished_items(self, task_id):
+        """Return the identifiers of a task's items that haven't been completed, in order"""
+        return [identifier for identifier, in self.connection().execute(
+            "SELECT identifier FROM task_items WHERE task_id = ? AND state != 'completed'"
+            ' ORDER BY position', (task_id,))]
+
+    def get_unfinished_tasks(self):
+        """Return (definition, status with items) of each task that was queued or running, oldest
+        first"""
+        unfinished_tasks = []
+        for task_id, definition, status in self.connection().execute(
+                'SELECT id, definition, status FROM tasks ORDER BY created_time').fetchall():
+            status = json.loads(status)
+            if status['status'] in ('queued', 'running'):
+                unfinished_tasks.append((json.loads(definition), self.with_items(task_id, status)))
+        return unfinished_tasks
+
+# Task definitions, status and history are kept in the log folder, so they survive restarts
+task_store = TaskStore(os.path.join(app.config['LOG_FOLDER'], 'tasks.sqlite3'))
+# Seconds between saves of running tasks' progress to the task store
+STATUS_SAVE_INTERVAL = 2
+# Number of search results added to a task's items in each write to the task store
+TASK_ITEM_BATCH_SIZE = 100
+# Held while a status is saved, so that an older snapshot of a task's status is never written
+# over a newer one
+save_lock = threading.Lock()
 
 class DownloadForm(FlaskForm):
     """Form for downloading Internet Archive items"""
@@ -55,6 +212,12 @@ class DownloadForm(FlaskForm):
     credentials_email = StringField('IA Email (optional)', validators=[Optional()])
     credentials_password = StringField('IA Password (optional)', validators=[Optional()])
     cache_refresh = BooleanField('Refresh Cache', default=False)
+    incremental_search = BooleanField('Only Search For New Items', default=False)
+    global_queue = BooleanField('Download Items Together', default=False)
+    max_retries = IntegerField('Max Retries', validators=[NumberRange(min=0, max=20)], default=5)
+    retry_wait = IntegerField('Initial Retry Wait (seconds)', validators=[NumberRange(min=1)], default=600)
+    breaker_threshold = IntegerField('Circuit Breaker Threshold', validators=[NumberRange(min=1)], default=3)
+    breaker_cooldown = IntegerField('Circuit Breaker Cooldown (seconds)', validators=[NumberRange(min=1)], default=300)
     submit = SubmitField('Start Download')
 
 class VerifyForm(FlaskForm):
@@ -64,8 +227,35 @@ class VerifyForm(FlaskForm):
     file_filters = StringField('File Filters (space separated)', validators=[Optional()])
     invert_file_filtering = BooleanField('Invert File Filtering', default=False)
     no_paths = BooleanField('Ignore Paths', default=False)
+    hash_processes = IntegerField('Hashing Processes', validators=[NumberRange(min=1)], default=ia_downloader.get_hash_process_count())
+    rehash_percent = IntegerField('Re-hash Percentage', validators=[NumberRange(min=0, max=100)], default=0)
+    hash_algorithm = SelectField('Hash Algorithm', choices=[('md5', 'MD5'), ('sha1', 'SHA1'), ('crc32', 'CRC32 (fast)')], default='md5')
     submit = SubmitField('Verify Downloads')
 
+def save_task_status(task_id):
+    """Save a task's current status to the task store - the status is copied while holding the
+    status lock, but written after releasing it so that downloads aren't held up by the database"""
+    with save_lock:
+        with status_lock:
+            status_json = TaskStore.status_json(download_status[task_id])
+        task_store.save_status(task_id, status_json)
+
+def status_saver():
+    """Thread that regularly saves the progress of running tasks to the task store"""
+    while True:
+        time.sleep(STATUS_SAVE_INTERVAL)
+        try:
+            with save_lock:
+                with status_lock:
+                    status_snapshots = [
+                        (task_id, TaskStore.status_json(task_status))
+                        for task_id, task_status in download_status.items()
+                        if task_status['status'] == 'running']
+                for task_id, status_json in status_snapshots:
+                    task_store.save_status(task_id, status_json)
+        except sqlite3.Error as e:
+            print(f"Unable to save task progress: {str(e)}")
+
 def download_worker():
     """Worker thread to process download tasks from the queue"""
     while True:
@@ -86,6 +276,7 @@ def download_worker():
                     'current_file_progress': 0,
                     'current_file_size': 0
                 }
+            save_task_status(task_id)
             
             try:
                 # Set up hash file if needed
@@ -96,20 +287,13 @@ def download_worker():
                 # Process identifiers
                 identifiers = task.get('identifiers', [])
                 
-                # Process search terms
-                if task.get('search_terms'):
-                    for search in task['search_terms']:
-                        # Check if task has been stopped
-                        with status_lock:
-                            if download_status[task_id]['status'] == 'stopped':
-                                break
-                                
-                        search_results = ia_downloader.get_identifiers_from_search_term(
-                            search=search,
-                            cache_parent_folder=os.path.join(app.config['LOG_FOLDER'], 'cache'),
-                            cache_refresh=task.get('cache_refresh', False)
-                        )
-                        identifiers.extend(search_results)
+                # Retry settings (and circuit breaker state) shared by all of this task's requests
+                retry_policy = ia_downloader.RetryPolicy(
+                    max_retries=task.get('max_retries', 5),
+                    initial_wait=task.get('retry_wait', 600),
+                    breaker_threshold=task.get('breaker_threshold', 3),
+                    breaker_cooldown=task.get('breaker_cooldown', 300)
+                )
                 
                 # Set credentials if provided
                 if task.get('credentials'):
@@ -122,40 +306,113 @@ def download_worker():
                         with status_lock:
                             download_status[task_id]['errors'].append(f"Authentication error: {str(e)}")
                 
-                # Process each identifier
-                for identifier in identifiers:
-                    # Check if task has been stopped
-                    with status_lock:
-                        if download_status[task_id]['status'] == 'stopped':
-                            break
-                            
-                        download_status[task_id]['current_item'] = identifier
-                    
-                    ia_downloader.download(
-                        identifier=identifier,
-                        output_folder=task['output_folder'],
-                        hash_file=hash_file_handler,
-                        thread_count=task.get('thread_count', 3),
-                        resume_flag=task.get('resume', True),
-                        verify_flag=task.get('verify', True),
-                        split_count=task.get('split_count', 1),
-                        file_filters=task.get('file_filters'),
-                        invert_file_filtering=task.get('invert_file_filtering', False),
+                # Share one connection pool across all of this task's downloads, with room for the
+                # metadata prefetch threads and search requests alongside the download connections
+                session = ia_downloader.get_download_session(connection_budget.size + max(args.prefetch, 0) + 1)
+
+                def search_identifiers():
+                    """Yield search results, adding new ones to the task's identifiers - results
+                    are stored in batches, each before it is yielded, so a resumed task has them"""
+                    known_identifiers = set(identifiers)
+                    batch = []
+                    for search in task.get('search_terms') or []:
+                        for identifier in ia_downloader.get_identifiers_from_search_term(
+                            search=search,
+                            cache_parent_folder=os.path.join(app.config['LOG_FOLDER'], 'cache'),
+                            cache_refresh=task.get('cache_refresh', False),
+                            retry_policy=retry_policy,
+                            session=session,
+                            incremental=task.get('incremental_search', False)
+                        ):
+                            # Skip results that are already task items (e.g. of a resumed task)
+                            if identifier in known_identifiers:
+                                continue
+                            known_identifiers.add(identifier)
+                            batch.append(identifier)
+                            if len(batch) >= TASK_ITEM_BATCH_SIZE:
+                                yield from add_search_results(batch)
+                                batch = []
+                    yield from add_search_results(batch)
+
+                def add_search_results(batch):
+                    """Store a batch of new search results as task items, then yield them"""
+                    if batch:
+                        task_store.add_task_items(task_id, batch)
+                        with status_lock:
+                            identifiers.extend(batch)
+                    yield from batch
+
+                def task_items():
+                    """Yield each identifier with its (prefetched) metadata until the task is stopped"""
+                    for identifier, item_files in ia_downloader.prefetch_item_file_metadata(
+                        identifiers=itertools.chain(
+                            list(task.get('unfinished_identifiers', identifiers)), search_identifiers()),
+                        prefetch_count=max(args.prefetch, 0),
+                        session=session,
                         cache_parent_folder=os.path.join(app.config['LOG_FOLDER'], 'cache'),
                         cache_refresh=task.get('cache_refresh', False),
-                        task_id=task_id,  # Pass task_id for progress tracking
-                        status_lock=status_lock,  # Pass status_lock for thread-safe updates
-                        download_status=download_status  # Pass download_status for updates
-                    )
+                        retry_policy=retry_policy
+                    ):
+                        # Check if task has been stopped
+                        with status_lock:
+                            if download_status[task_id]['status'] == 'stopped':
+                                return
+                                
+                            download_status[task_id]['current_item'] = identifier
+                            if item_files is None:
+                                download_status[task_id]['errors'].append(
+                                    f"Unable to get metadata for item '{identifier}'")
+                                continue
+                        task_store.set_item_state(task_id, identifier, 'started')
+                        save_task_status(task_id)
+                        yield identifier, item_files
+                
+                download_options = dict(
+                    output_folder=task['output_folder'],
+                    hash_file=hash_file_handler,
+                    thread_count=task.get('thread_count', 3),
+                    resume_flag=task.get('resume', True),
+                    verify_flag=task.get('verify', True),
+                    split_count=task.get('split_count', 1),
+                    file_filters=task.get('file_filters'),
+                    invert_file_filtering=task.get('invert_file_filtering', False),
+                    cache_parent_folder=os.path.join(app.config['LOG_FOLDER'], 'cache'),
+                    cache_refresh=task.get('cache_refresh', False),
+                    task_id=task_id,  # Pass task_id for progress tracking
+                    status_lock=status_lock,  # Pass status_lock for thread-safe updates
+                    download_status=download_status,  # Pass download_status for updates
+                    session=session,  # Pass session so connections are reused across items
+                    connection_budget=connection_budget,  # Limit total connections across tasks
+                    retry_policy=retry_policy,
+                    # Items are only recorded as completed once they have been downloaded and
+                    # verified (or were already); a resumed task starts the others again, skipping
+                    # their completed files using the download journal
+                    completed_item_callback=lambda identifier: task_store.set_item_state(
+                        task_id, identifier, 'completed')
+                )
+                
+                if task.get('global_queue', False):
+                    # Files from several items are downloaded at once from a single queue
+                    ia_downloader.download_items(items=task_items(), **download_options)
+                else:
+                    # Process each identifier in turn
+                    for identifier, item_files in task_items():
+                        ia_downloader.download(
+                            identifier=identifier,
+                            item_files=item_files,  # Prefetched metadata
+                            **download_options
+                        )
                 
                 if hash_file_handler:
                     hash_file_handler.close()
+                ia_downloader.log_session_stats(session)
                 
                 with status_lock:
                     # Only mark as completed if it wasn't stopped
                     if download_status[task_id]['status'] != 'stopped':
                         download_status[task_id]['status'] = 'completed'
                     download_status[task_id]['end_time'] = datetime.datetime.now().isoformat()
+                save_task_status(task_id)
             
             except Exception as e:
                 with status_lock:
@@ -164,6 +421,7 @@ def download_worker():
                         download_status[task_id]['status'] = 'failed'
                     download_status[task_id]['errors'].append(str(e))
                     download_status[task_id]['end_time'] = datetime.datetime.now().isoformat()
+                save_task_status(task_id)
             
             finally:
                 download_queue.task_done()
@@ -183,7 +441,25 @@ def ensure_worker_thread():
         worker_thread = threading.Thread(target=download_worker, daemon=True)
         worker_thread.start()
 
-# Start worker thread
+def resume_unfinished_tasks():
+    """Queue the tasks that were queued or running when the web app last stopped - items that had
+    already been downloaded are skipped using the download completion journal, and partially
+    downloaded files are resumed if the task allows"""
+    for task, task_status in task_store.get_unfinished_tasks():
+        task_status['status'] = 'queued'
+        task_status['current_item'] = None
+        # The task carries on from its stored items (including earlier search results) that
+        # weren't completed; its searches are repeated (from the cache) only to add new items
+        task['identifiers'] = task_status['identifiers']
+        task['unfinished_identifiers'] = task_store.get_unfinished_items(task['id'])
+        with status_lock:
+            download_status[task['id']] = task_status
+        save_task_status(task['id'])
+        download_queue.put(task)
+
+# Resume unfinished tasks, and start worker thread
+resume_unfinished_tasks()
+threading.Thread(target=status_saver, daemon=True).start()
 ensure_worker_thread()
 
 @app.route('/')
@@ -260,7 +536,13 @@ def download():
             'invert_file_filtering': form.invert_file_filtering.data,
             'credentials': credentials,
             'hash_file': hash_file,
-            'cache_refresh': form.cache_refresh.data
+            'cache_refresh': form.cache_refresh.data,
+            'incremental_search': form.incremental_search.data,
+            'global_queue': form.global_queue.data,
+            'max_retries': form.max_retries.data,
+            'retry_wait': form.retry_wait.data,
+            'breaker_threshold': form.breaker_threshold.data,
+            'breaker_cooldown': form.breaker_cooldown.data
         }
         
         # Initialize status
@@ -274,6 +556,8 @@ def download():
                 'current_item': None,
                 'errors': []
             }
+        # The task isn't queued yet, so its status can't change while it is stored
+        task_store.add_task(task, download_status[task_id])
         
         # Add task to queue
         download_queue.put(task)
@@ -311,7 +595,10 @@ def verify():
             cache_parent_folder=os.path.join(app.config['LOG_FOLDER'], 'cache'),
             identifiers=identifiers,
             file_filters=file_filters,
-            invert_file_filtering=form.invert_file_filtering.data
+            invert_file_filtering=form.invert_file_filtering.data,
+            hash_processes=form.hash_processes.data,
+            rehash_percent=form.rehash_percent.data,
+            hash_algorithm=form.hash_algorithm.data
         )
         
         if result:
@@ -329,8 +616,7 @@ def status_list():
     # Ensure worker thread is running
     ensure_worker_thread()
     
-    with status_lock:
-        tasks = {k: v for k, v in download_status.items()}
+    tasks = task_store.get_statuses()
     
     return render_template('status_list.html', tasks=tasks)
 
@@ -340,8 +626,7 @@ def status(task_id):
     # Ensure worker thread is running
     ensure_worker_thread()
     
-    with status_lock:
-        task = download_status.get(task_id)
+    task = task_store.get_status(task_id)
     
     if not task:
         flash(f'Task {task_id} not found', 'error')
@@ -352,8 +637,7 @@ def status(task_id):
 @app.route('/api/status/<task_id>')
 def api_status(task_id):
     """API endpoint for getting task status"""
-    with status_lock:
-        task = download_status.get(task_id)
+    task = task_store.get_status(task_id)
     
     if not task:
         return jsonify({'error': 'Task not found'}), 404
@@ -381,6 +665,7 @@ def api_stop_task(task_id):
         if 'errors' not in task:
             task['errors'] = []
         task['errors'].append('Task was manually stopped by user')
+    save_task_status(task_id)
         
     # Return success
     return jsonify({'success': True, 'message': 'Task stopped successfully'})
@@ -388,56 +673,68 @@ def api_stop_task(task_id):
 @app.route('/api/restart/<task_id>', methods=['POST'])
 def api_restart_task(task_id):
     """API endpoint for restarting a stopped task"""
+    # Read the task from the task store before taking the status lock, so that running tasks
+    # aren't held up by the database
+    task_status = task_store.get_status(task_id)
+    task = task_store.get_definition(task_id)
+    
+    if not task:
+        return jsonify({'error': 'Task not found'}), 404
+    
+    # Only allow restarting tasks that are stopped
+    if task_status['status'] != 'stopped':
+        return jsonify({'error': 'Task is not stopped'}), 400
+    
+    # Get the original task data
+    original_task_id = task_id
+    
+    # Create a new task ID
+    new_task_id = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    # Create a new task with the same parameters (search results are found again by its
+    # searches)
+    new_task = {
+        'id': new_task_id,
+        'identifiers': task.get('identifiers', []),
+        'search_terms': task.get('search_terms', []),
+        'output_folder': task.get('output_folder', os.path.join(app.config['UPLOAD_FOLDER'], 'default')),
+        'thread_count': task.get('thread_count', 3),
+        'verify': task.get('verify', True),
+        'resume': task.get('resume', True),
+        'split_count': task.get('split_count', 1),
+        'file_filters': task.get('file_filters'),
+        'invert_file_filtering': task.get('invert_file_filtering', False),
+        'credentials': None,  # Already configured when the original task ran
+        'hash_file': os.path.join(app.config['LOG_FOLDER'], f"{new_task_id}_hashes.txt"),
+        'cache_refresh': task.get('cache_refresh', False),
+        'incremental_search': task.get('incremental_search', False),
+        'global_queue': task.get('global_queue', False),
+        'max_retries': task.get('max_retries', 5),
+        'retry_wait': task.get('retry_wait', 600),
+        'breaker_threshold': task.get('breaker_threshold', 3),
+        'breaker_cooldown': task.get('breaker_cooldown', 300)
+    }
+    
+    # Initialize status for the new task
     with status_lock:
-        task = download_status.get(task_id)
-        
-        if not task:
-            return jsonify({'error': 'Task not found'}), 404
-        
-        # Only allow restarting tasks that are stopped
-        if task['status'] != 'stopped':
-            return jsonify({'error': 'Task is not stopped'}), 400
-        
-        # Get the original task data
-        original_task_id = task_id
-        
-        # Create a new task ID
-        new_task_id = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Create a new task with the same parameters
-        new_task = {
-            'id': new_task_id,
-            'identifiers': task.get('identifiers', []),
-            'search_terms': task.get('search_terms', []),
-            'output_folder': task.get('output_folder', os.path.join(app.config['UPLOAD_FOLDER'], 'default')),
-            'thread_count': task.get('thread_count', 3),
-            'verify': task.get('verify', True),
-            'resume': task.get('resume', True),
-            'split_count': task.get('split_count', 1),
-            'file_filters': task.get('file_filters'),
-            'invert_file_filtering': task.get('invert_file_filtering', False),
-            'credentials': task.get('credentials'),
-            'hash_file': os.path.join(app.config['LOG_FOLDER'], f"{new_task_id}_hashes.txt"),
-            'cache_refresh': task.get('cache_refresh', False)
-        }
-        
-        # Initialize status for the new task
         download_status[new_task_id] = {
             'status': 'queued',
             'start_time': datetime.datetime.now().isoformat(),
             'end_time': None,
-            'identifiers': task.get('identifiers', []),
-            'search_terms': task.get('search_terms', []),
+            'identifiers': new_task['identifiers'],
+            'search_terms': new_task['search_terms'],
             'current_item': None,
             'errors': [],
             'restarted_from': original_task_id
         }
-        
-        # Add task to queue
-        download_queue.put(new_task)
-        
-        # Ensure worker thread is running
-        ensure_worker_thread()
+    # The task isn't queued yet, so its status can't change while it is stored
+    task_store.add_task(new_task, download_status[new_task_id])
+    
+    # Add task to queue
+    download_queue.put(new_task)
+    
+    # Ensure worker thread is running
+    ensure_worker_thread()
         
     return jsonify({
         'success': True, 
@@ -446,6 +743,31 @@ def api_restart_task(task_id):
         'new_task_id': new_task_id
     })
 
+@app.route('/api/limits', methods=['GET', 'POST'])
+def api_limits():
+    """API endpoint for getting or changing the bandwidth limits applied to all downloads
+
+    POST a JSON object with 'rate_limit' (e.g. '2M', a number of bytes per second, or null for
+    unlimited) and optionally 'schedule' (a list of 'HH:MM-HH:MM=RATE' strings)
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        try:
+            rate_limit = data.get('rate_limit')
+            if rate_limit is not None:
+                rate_limit = ia_downloader.parse_rate(rate_limit)
+            schedule = [
+                ia_downloader.parse_rate_schedule_entry(entry)
+                for entry in data.get('schedule') or []
+            ]
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid limits: {str(e)}'}), 400
+        ia_downloader.bandwidth_limiter.set_limits(rate_limit, schedule)
+    
+    return jsonify(ia_downloader.bandwidth_limiter.get_limits())
+
 @app.route('/downloads/<path:filename>')
 def download_file(filename):
     """Serve downloaded files"""
@@ -3,21 +3,34 @@
 """Script to perform simultaneous, resumable and hash-verified downloads from Internet Archive"""
 
 import argparse
-from dataclasses import dataclass, field
+import collections
+from dataclasses import dataclass
 import datetime
+import email.utils
+import functools
 import hashlib
+import heapq
 import io
+import itertools
+import json
 import logging
+import math
 import multiprocessing
 import multiprocessing.pool
 import os
 import pathlib
 import platform
+import random
 import re
 import signal
+import socket
+import sqlite3
 import sys
+import threading
 import time
 import typing
+import urllib.parse
+import zlib
 import fnmatch
 
 dark_grey = "\x1b[90;20m"
@@ -41,6 +54,7 @@ if int(python_major) < 3 or int(python_minor) < 7:
 try:
     import internetarchive
     import requests
+    import requests.adapters
     import tqdm
 except ModuleNotFoundError:
     print(
@@ -158,6 +172,70 @@ def check_argument_int_greater_than_one(value: str) -> int:
     return ivalue
 
 
+def check_argument_percentage(value: str) -> float:
+    """Confirm percentage values provided as command line arguments are between 0 and 100"""
+    fvalue = float(value)
+    if fvalue < 0 or fvalue > 100:
+        raise argparse.ArgumentTypeError("{} is an invalid percentage value".format(value))
+    return fvalue
+
+
+# (start time, end time, bytes per second limit or None for unlimited)
+RateScheduleEntry = typing.Tuple[datetime.time, datetime.time, typing.Optional[int]]
+
+
+def parse_rate(value: str) -> typing.Optional[int]:
+    """Convert a transfer rate string - bytes per second, optionally with a K/M/G suffix (e.g.
+    '500K' or '2.5M') - to bytes per second; 'unlimited' returns None
+
+    """
+    value = str(value).strip().upper()
+    if value == "UNLIMITED":
+        return None
+    multipliers = {"K": 1024, "M": 1048576, "G": 1073741824}
+    multiplier = 1
+    if value[-1:] in multipliers:
+        multiplier = multipliers[value[-1]]
+        value = value[:-1]
+    rate = int(float(value) * multiplier)
+    if rate <= 0:
+        raise ValueError("Transfer rate must be positive")
+    return rate
+
+
+def parse_rate_schedule_entry(value: str) -> RateScheduleEntry:
+    """Convert a rate schedule string of the form 'HH:MM-HH:MM=RATE' (e.g. '08:00-18:00=1M') to a
+    tuple of (start time, end time, bytes per second)
+
+    """
+    time_range, rate = value.split("=")
+    start_time, end_time = [
+        datetime.datetime.strptime(time_str.strip(), "%H:%M").time()
+        for time_str in time_range.split("-")
+    ]
+    return start_time, end_time, parse_rate(rate)
+
+
+def check_argument_rate(value: str) -> typing.Optional[int]:
+    """Confirm transfer rates provided as command line arguments are valid"""
+    try:
+        return parse_rate(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(  # pylint: disable=raise-missing-from
+            "{} is an invalid transfer rate (e.g. '500K', '2M' or 'unlimited')".format(value)
+        )
+
+
+def check_argument_rate_schedule_entry(value: str) -> RateScheduleEntry:
+    """Confirm rate schedule entries provided as command line arguments are valid"""
+    try:
+        return parse_rate_schedule_entry(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(  # pylint: disable=raise-missing-from
+            "{} is an invalid rate schedule entry (e.g. '08:00-18:00=1M')".format(value)
+        )
+
+
 def bytes_filesize_to_readable_str(bytes_filesize: int) -> str:
     """Convert bytes integer to kilobyte/megabyte/gigabyte/terabyte equivalent string"""
     if bytes_filesize < 1024:
@@ -170,84 +248,260 @@ def bytes_filesize_to_readable_str(bytes_filesize: int) -> str:
     return "{:.1f} {}".format(num, "TB")
 
 
-def file_paths_in_folder(folder_path: str) -> typing.List[str]:
-    """Return sorted list of paths of files at a directory (and its subdirectories)"""
+def folder_contains_files(folder_path: str) -> bool:
+    """Return whether there are any files at a directory (or its subdirectories), stopping at the
+    first file found rather than listing the whole tree
+
+    """
     log = logging.getLogger(__name__)
+    folder_paths = [folder_path]
+    while len(folder_paths) > 0:
+        current_folder_path = folder_paths.pop()
+        try:
+            with os.scandir(current_folder_path) as folder_entries:
+                for entry in folder_entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        folder_paths.append(entry.path)
+                    elif entry.is_file():
+                        return True
+        except OSError:
+            log.warning(
+                (
+                    "'%s' could not be accessed during folder scanning - any contents will not be"
+                    " processed. Try running script as admin"
+                ),
+                current_folder_path,
+            )
+    return False
 
-    def walk_error(os_error: OSError) -> None:
-        """Log any errors occurring during os.walk"""
-        log.warning(
-            (
-                "'%s' could not be accessed during folder scanning - any contents will not be"
-                " processed. Try running script as admin"
-            ),
-            os_error.filename,
-        )
 
-    file_paths = []
-    for root, _, file_names in os.walk(folder_path, onerror=walk_error):
-        for name in file_names:
-            file_paths.append(os.path.join(root, name))
-    return sorted(file_paths)
+def get_hashfile_index(hash_file_path: str) -> typing.Dict[str, typing.List[typing.List[int]]]:
+    """Return the byte ranges ([start, end]) of each identifier's lines in an IA hash metadata CSV,
+    from the '[hash file].index' sidecar - which is built (or rebuilt, if the hash file has changed
+    since it was indexed) by reading the hash file once
+
+    """
+    log = logging.getLogger(__name__)
+    index_path = "{}.index".format(hash_file_path)
+    hash_file_stat = os.stat(hash_file_path)
+    try:
+        with open(index_path, "r", encoding="utf-8") as file_handler:
+            hashfile_index = json.load(file_handler)
+        if (
+            hashfile_index["size"] == hash_file_stat.st_size
+            and hashfile_index["mtime_ns"] == hash_file_stat.st_mtime_ns
+        ):
+            return hashfile_index["identifiers"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    log.debug("Building index of hash file '%s'", hash_file_path)
+    identifier_ranges = {}  # type: typing.Dict[str, typing.List[typing.List[int]]]
+    current_range = [0, 0]
+    current_identifier = None
+    with open(hash_file_path, "rb") as file_handler:
+        offset = 0
+        for line in file_handler:
+            identifier = line.split(b"|", 1)[0]
+            if identifier != current_identifier:
+                current_identifier = identifier
+                current_range = [offset, offset]
+                identifier_ranges.setdefault(identifier.decode("utf-8"), []).append(current_range)
+            offset += len(line)
+            current_range[1] = offset
+    try:
+        with open("{}.tmp".format(index_path), "w", encoding="utf-8") as file_handler:
+            json.dump(
+                {
+                    "size": hash_file_stat.st_size,
+                    "mtime_ns": hash_file_stat.st_mtime_ns,
+                    "identifiers": identifier_ranges,
+                },
+                file_handler,
+            )
+        os.replace("{}.tmp".format(index_path), index_path)
+    except OSError:
+        log.debug("Index of hash file '%s' could not be saved to '%s'", hash_file_path, index_path)
+    return identifier_ranges
 
 
-def get_metadata_from_hashfile(
+def iter_metadata_from_hashfile(
     hash_file_path: str,
     hash_flag: bool,
     identifier_filter: typing.Optional[typing.List[str]] = None,
     file_filters: typing.Optional[typing.List[str]] = None,
     invert_file_filtering: bool = False,
-) -> typing.Dict[str, str]:
-    """Return dict of file paths and associated metadata parsed from IA hash metadata CSV"""
-    results = {}  # type: typing.Dict[str, str]
-    with open(hash_file_path, "r", encoding="utf-8") as file_handler:
-        for line in file_handler:
-            identifier, file_path, size, md5, _ = line.strip().split("|")
-            if file_filters is not None:
-                if not invert_file_filtering:
-                    if not any(
-                        substring.lower() in file_path.lower() for substring in file_filters
-                    ):
-                        continue
-                else:
-                    if any(substring.lower() in file_path.lower() for substring in file_filters):
-                        continue
-            if identifier_filter is None or identifier in identifier_filter:
-                if hash_flag:
-                    results[
-                        os.path.join(identifier, os.path.normpath(file_path))
-                    ] = md5.lower().strip()
-                else:
-                    results[
-                        os.path.join(identifier, os.path.normpath(file_path))
-                    ] = size.lower().strip()
-    return results
+) -> typing.Iterator[typing.Tuple[str, str, str]]:
+    """Yield (identifier, file path, metadata) for each file listed in an IA hash metadata CSV, as
+    the file is read (raising ValueError if a line doesn't match the expected format)
 
+    If only certain identifiers are wanted, the hash file's index is used to read just their lines
+    """
 
-def get_metadata_from_files_in_folder(
-    folder_path: str,
-    hash_flag: bool,
-    relative_paths_from_ia_metadata: typing.Optional[typing.List[str]] = None,
-) -> typing.Dict[str, str]:
-    """Return dict of file paths and metadata of files at a directory (and its subdirectories)"""
+    def parse_line(line: str) -> typing.Optional[typing.Tuple[str, str, str]]:
+        """Return (identifier, file path, metadata) for a line, or None if it is filtered out"""
+        # Split from both ends, so file names containing '|' are kept intact
+        identifier, remainder = line.rstrip("\r\n").split("|", 1)
+        file_path, size, md5, _ = remainder.rsplit("|", 3)
+        if file_filters is not None:
+            if not invert_file_filtering:
+                if not any(substring.lower() in file_path.lower() for substring in file_filters):
+                    return None
+            else:
+                if any(substring.lower() in file_path.lower() for substring in file_filters):
+                    return None
+        return (
+            identifier,
+            os.path.join(identifier, os.path.normpath(file_path)),
+            md5.lower().strip() if hash_flag else size.lower().strip(),
+        )
+
+    if identifier_filter is None:
+        with open(hash_file_path, "r", encoding="utf-8") as file_handler:
+            for line in file_handler:
+                file_metadata = parse_line(line)
+                if file_metadata is not None:
+                    yield file_metadata
+        return
+
+    identifier_ranges = get_hashfile_index(hash_file_path)
+    with open(hash_file_path, "rb") as file_handler:
+        # Read the ranges in file order, so the hash file is read sequentially
+        for start, end in sorted(
+            line_range
+            for identifier in set(identifier_filter)
+            for line_range in identifier_ranges.get(identifier, [])
+        ):
+            file_handler.seek(start)
+            offset = start
+            while offset < end:
+                line = file_handler.readline()
+                if not line:
+                    break
+                offset += len(line)
+                file_metadata = parse_line(line.decode("utf-8"))
+                if file_metadata is not None:
+                    yield file_metadata
+
+
+def iter_sorted_folder_files(
+    folder_path: str, relative_parts: typing.Tuple[str, ...] = ()
+) -> typing.Iterator[typing.Tuple[typing.Tuple[str, ...], os.DirEntry]]:
+    """Yield (path components relative to the top folder, DirEntry) for each file at a directory
+    (and its subdirectories), in order of path components so that files can be merge-joined
+    against sorted metadata; only one directory listing per level is held in memory at a time
+
+    """
     log = logging.getLogger(__name__)
-    results = {}  # type: typing.Dict[str, str]
-    if relative_paths_from_ia_metadata is not None:
-        file_paths = [
-            os.path.join(folder_path, relative_path)
-            for relative_path in relative_paths_from_ia_metadata
-        ]
-    else:
-        file_paths = file_paths_in_folder(folder_path)
-    if hash_flag:
-        for file_path in tqdm.tqdm(file_paths):
-            if os.path.isfile(file_path):  # We will alert on this elsewhere if the file isn't found
-                try:
-                    md5 = md5_hash_file(file_path)
-                    results[
-                        os.path.normpath(os.path.relpath(file_path, folder_path))
-                    ] = md5.lower().strip()
-                except (PermissionError, OSError):
+    try:
+        with os.scandir(folder_path) as folder_entries:
+            entries = sorted(folder_entries, key=lambda entry: entry.name)
+    except OSError:
+        log.warning(
+            (
+                "'%s' could not be accessed during folder scanning - any contents will not be"
+                " processed. Try running script as admin"
+            ),
+            folder_path,
+        )
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_sorted_folder_files(entry.path, relative_parts + (entry.name,))
+            elif entry.is_file():
+                yield relative_parts + (entry.name,), entry
+        except OSError:
+            continue  # Entry was removed during scanning
+
+
+def merge_join_item_files(
+    data_folder: str, identifier: str, expected_files: typing.List[typing.Tuple[str, str]]
+) -> typing.Iterator[typing.Tuple[str, str, typing.Optional[os.DirEntry]]]:
+    """Yield (file path, metadata, DirEntry of the local file - or None if it wasn't found) for
+    each of an item's expected (file path, metadata), by walking the expected files (sorted by
+    path) and the item's folder in the data folder together
+
+    """
+    local_files = iter_sorted_folder_files(os.path.join(data_folder, identifier), (identifier,))
+    local_file = next(local_files, None)
+    for path_parts, file_path, value in sorted(
+        (tuple(file_path.split(os.sep)), file_path, value) for file_path, value in expected_files
+    ):
+        # Skip local files that aren't in the metadata
+        while local_file is not None and local_file[0] < path_parts:
+            local_file = next(local_files, None)
+        if local_file is not None and local_file[0] == path_parts:
+            yield file_path, value, local_file[1]
+            local_file = next(local_files, None)
+        else:
+            yield file_path, value, None
+
+
+def iter_file_hash_values(
+    files: typing.Iterable[typing.Tuple[str, os.stat_result]],
+    hash_pool: multiprocessing.pool.Pool,
+    progress_bar: tqdm.tqdm,
+    metadata_store: typing.Optional["MetadataStore"] = None,
+    rehash_percent: float = 0,
+    hash_algorithm: str = "md5",
+    batch_size: int = 1000,
+) -> typing.Iterator[typing.Tuple[str, typing.Optional[str]]]:
+    """Yield (file path, hash value - or None if the file couldn't be read) for each of the files
+    (file path, stat result), hashed in parallel by the hash pool
+
+    Files are taken from the iterable in batches, so only one batch is held in memory at a time,
+    and results for each batch are yielded in the order that hashing completes. Bytes hashed are
+    added to the progress bar, which may be shared between folders to show the aggregate hashing
+    rate. If a metadata store is provided, files that haven't changed since they were last hashed
+    use the recorded hash value, other than rehash_percent of them that are re-hashed to check for
+    silent corruption (those hashed longest ago, so that repeated runs re-read every file in turn)
+    """
+    log = logging.getLogger(__name__)
+    files = iter(files)
+    while True:
+        file_stats = dict(itertools.islice(files, batch_size))
+        if len(file_stats) == 0:
+            return
+        # Use recorded hash values for files that haven't changed since they were last hashed
+        recorded_hashes = {}  # type: typing.Dict[str, typing.Tuple[str, float]]
+        if metadata_store is not None:
+            for file_path, file_stat in file_stats.items():
+                file_hash = metadata_store.get_file_hash(file_path, file_stat, hash_algorithm)
+                if file_hash is not None:
+                    recorded_hashes[file_path] = file_hash
+        rehash_file_paths = set(
+            sorted(recorded_hashes, key=lambda file_path: recorded_hashes[file_path][1])[
+                : math.ceil(len(recorded_hashes) * rehash_percent / 100)
+            ]
+        )
+        hash_file_paths = []
+        for file_path in file_stats:
+            if file_path not in recorded_hashes or file_path in rehash_file_paths:
+                hash_file_paths.append(file_path)
+            else:
+                yield file_path, recorded_hashes[file_path][0]
+
+        with progress_bar.get_lock():
+            progress_bar.total += sum(
+                file_stats[file_path].st_size for file_path in hash_file_paths
+            )
+            progress_bar.refresh()
+        new_hashes = []  # type: typing.List[typing.Tuple[str, os.stat_result, str]]
+        try:
+            # Hash the largest files first, so that hashing isn't left waiting on one large file
+            # after the other processes have finished
+            for file_path, hash_value in hash_pool.imap_unordered(
+                functools.partial(calculate_file_hash_if_readable, hash_algorithm=hash_algorithm),
+                sorted(
+                    hash_file_paths,
+                    key=lambda file_path: file_stats[file_path].st_size,
+                    reverse=True,
+                ),
+            ):
+                with progress_bar.get_lock():
+                    progress_bar.update(file_stats[file_path].st_size)
+                if hash_value is None:
                     log.warning(
                         (
                             "PermissionError/OSError occurred when accessing file '%s' - try"
@@ -255,37 +509,799 @@ def get_metadata_from_files_in_folder(
                         ),
                         file_path,
                     )
-    else:
-        # Return file sizes if we're not checking hash values
-        for file_path in file_paths:
-            if os.path.isfile(file_path):  # We will alert on this elsewhere if the file isn't found
-                try:
-                    file_size = os.path.getsize(file_path)
-                    results[os.path.normpath(os.path.relpath(file_path, folder_path))] = str(
-                        file_size
-                    )
-                except (PermissionError, OSError):
+                elif file_path in rehash_file_paths and hash_value != recorded_hashes[file_path][0]:
                     log.warning(
                         (
-                            "PermissionError/OSError occurred when accessing file '%s' - try"
-                            " running script as admin"
+                            "'%s' file hash has changed since it was last hashed on %s, although"
+                            " its size and modification time have not - this may indicate disk"
+                            " corruption"
                         ),
                         file_path,
+                        datetime.datetime.fromtimestamp(recorded_hashes[file_path][1]).strftime(
+                            "%Y-%m-%d"
+                        ),
+                    )
+                if metadata_store is not None and hash_value is not None:
+                    new_hashes.append((file_path, file_stats[file_path], hash_value))
+                yield file_path, hash_value
+        finally:
+            if metadata_store is not None and len(new_hashes) > 0:
+                metadata_store.put_file_hashes(new_hashes, hash_algorithm)
+
+
+class MetadataStore:
+    """SQLite database caching Internet Archive item file metadata and search results, the hash
+    values of local files, and a journal of completed downloads, shared by download and verify
+    runs (one connection per thread; WAL mode allows reads alongside writes)
+
+    Replaces the timestamped '[identifier]_metadata.txt' and '[search]_items.txt' cache files used
+    by earlier versions, which are imported the first time an item or search is looked up
+    """
+
+    database_file_name = "metadata.sqlite3"
+    query_batch_size = 500  # Parameters per 'IN' clause
+
+    def __init__(self, cache_parent_folder: str) -> None:
+        self.cache_parent_folder = cache_parent_folder
+        self.database_path = os.path.join(cache_parent_folder, self.database_file_name)
+        self.local = threading.local()
+        pathlib.Path(cache_parent_folder).mkdir(parents=True, exist_ok=True)
+        with self.connection() as connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    identifier TEXT PRIMARY KEY,
+                    fetched_time REAL NOT NULL,
+                    item_last_updated INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    identifier TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    size INTEGER,
+                    md5 TEXT,
+                    crc32 TEXT,
+                    sha1 TEXT,
+                    mtime INTEGER,
+                    PRIMARY KEY (identifier, name)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS searches (
+                    search TEXT PRIMARY KEY,
+                    fetched_time REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS search_results (
+                    search TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    identifier TEXT NOT NULL,
+                    PRIMARY KEY (search, position)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS search_progress (
+                    search TEXT PRIMARY KEY,
+                    started_time REAL NOT NULL,
+                    cursor TEXT,
+                    result_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS search_added_dates (
+                    search TEXT PRIMARY KEY,
+                    newest_added_date TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS search_results_identifier
+                    ON search_results (search, identifier);
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT NOT NULL,
+                    hash_algorithm TEXT NOT NULL,
+                    device TEXT NOT NULL,
+                    inode TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    hash_value TEXT NOT NULL,
+                    hashed_time REAL NOT NULL,
+                    PRIMARY KEY (path, hash_algorithm)
+                );
+                CREATE TABLE IF NOT EXISTS completed_files (
+                    path TEXT PRIMARY KEY,
+                    identifier TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    md5_status TEXT,
+                    completed_time REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS completed_items (
+                    output_folder TEXT NOT NULL,
+                    identifier TEXT NOT NULL,
+                    metadata_version TEXT NOT NULL,
+                    folder_signature TEXT,
+                    completed_time REAL NOT NULL,
+                    PRIMARY KEY (output_folder, identifier)
+                ) WITHOUT ROWID;
+                """
+            )
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection to the database, opening it if needed"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # SQLite's lower() only handles ASCII characters - use Python's for file filters
+            connection.create_function(
+                "py_lower", 1, lambda value: value.lower() if value is not None else None
+            )
+            self.local.connection = connection
+        return connection
+
+    def put_item_files(
+        self,
+        identifier: str,
+        files: typing.List[typing.Dict[str, typing.Any]],
+        item_last_updated: typing.Optional[int] = None,
+        fetched_time: typing.Optional[float] = None,
+    ) -> None:
+        """Replace the cached file metadata for an item"""
+
+        def optional_int(value: typing.Any) -> typing.Optional[int]:
+            return int(value) if value is not None and int(value) != -1 else None
+
+        with self.connection() as connection:
+            connection.execute("DELETE FROM files WHERE identifier = ?", (identifier,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        identifier,
+                        file["name"],
+                        optional_int(file.get("size")),
+                        file.get("md5"),
+                        file.get("crc32"),
+                        file.get("sha1"),
+                        optional_int(file.get("mtime")),
                     )
-    return results
+                    for file in files
+                ),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?)",
+                (
+                    identifier,
+                    fetched_time if fetched_time is not None else time.time(),
+                    item_last_updated,
+                ),
+            )
+
+    def get_item_files(
+        self, identifier: str, max_age: typing.Optional[datetime.timedelta] = None
+    ) -> typing.Optional[typing.List[typing.Dict[str, str]]]:
+        """Return the cached file metadata for an item (in the same form as IA item metadata), or
+        None if the item isn't cached or its metadata is older than max_age
+
+        """
+        log = logging.getLogger(__name__)
+        item_details = self.get_item_details(identifier)
+        if item_details is None:
+            return None
+        fetched_time, _ = item_details
+        if max_age is not None and time.time() - fetched_time > max_age.total_seconds():
+            return None
+        log.debug(
+            "Cached data from %s will be used for item '%s'",
+            datetime.datetime.fromtimestamp(fetched_time).strftime("%Y-%m-%d %H:%M:%S"),
+            identifier,
+        )
+        files = []
+        for name, size, md5, crc32, sha1, mtime in self.connection().execute(
+            (
+                "SELECT name, size, md5, crc32, sha1, mtime FROM files WHERE identifier = ?"
+                " ORDER BY name"
+            ),
+            (identifier,),
+        ):
+            # Omit missing values, as IA metadata does
+            file = {"name": name}
+            for key, value in (
+                ("size", size),
+                ("md5", md5),
+                ("crc32", crc32),
+                ("sha1", sha1),
+                ("mtime", mtime),
+            ):
+                if value is not None:
+                    file[key] = str(value)
+            files.append(file)
+        return files
+
+    def get_item_details(
+        self, identifier: str
+    ) -> typing.Optional[typing.Tuple[float, typing.Optional[int]]]:
+        """Return the time an item's metadata was fetched (or last confirmed to be unchanged) and
+        its 'item_last_updated' value, or None if the item isn't cached
+
+        """
+        item_row = self.connection().execute(
+            "SELECT fetched_time, item_last_updated FROM items WHERE identifier = ?", (identifier,)
+        ).fetchone()
+        if item_row is None and self.import_legacy_item(identifier):
+            item_row = self.connection().execute(
+                "SELECT fetched_time, item_last_updated FROM items WHERE identifier = ?",
+                (identifier,),
+            ).fetchone()
+        return item_row
+
+    def mark_item_revalidated(self, identifier: str) -> None:
+        """Record that an item's cached metadata has been confirmed to be current"""
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE items SET fetched_time = ? WHERE identifier = ?", (time.time(), identifier)
+            )
+
+    @staticmethod
+    def in_batches(values: typing.List[typing.Any]) -> typing.Iterator[typing.List[typing.Any]]:
+        """Yield the values in batches small enough to be passed as the parameters of an 'IN'
+        clause (SQLite limits the number of parameters per query, to 999 in older versions)
+
+        """
+        for batch_start in range(0, len(values), MetadataStore.query_batch_size):
+            yield values[batch_start : batch_start + MetadataStore.query_batch_size]
+
+    def get_cached_identifiers(self, identifiers: typing.List[str]) -> typing.Set[str]:
+        """Return the subset of the provided identifiers that have cached metadata"""
+        cached_identifiers = set()  # type: typing.Set[str]
+        for identifier_batch in self.in_batches(identifiers):
+            cached_identifiers.update(
+                row[0]
+                for row in self.connection().execute(
+                    "SELECT identifier FROM items WHERE identifier IN ({})".format(
+                        ", ".join("?" * len(identifier_batch))
+                    ),
+                    identifier_batch,
+                )
+            )
+        for identifier in identifiers:
+            if identifier not in cached_identifiers and self.import_legacy_item(identifier):
+                cached_identifiers.add(identifier)
+        return cached_identifiers
+
+    def get_files(
+        self,
+        identifiers: typing.List[str],
+        file_filters: typing.Optional[typing.List[str]] = None,
+        invert_file_filtering: bool = False,
+        hash_algorithm: str = "md5",
+    ) -> typing.Iterator[typing.Tuple[str, str, typing.Optional[int], typing.Optional[str]]]:
+        """Yield (identifier, file name, size, hash value) for every cached file of the provided
+        items that matches the file filters (case insensitive substrings, as for downloads)
+
+        """
+        if hash_algorithm not in HASH_ALGORITHMS:
+            raise ValueError("Unsupported hash algorithm '{}'".format(hash_algorithm))
+        filter_query = ""
+        filter_parameters = []  # type: typing.List[str]
+        if file_filters is not None:
+            filter_clause = " OR ".join(["instr(py_lower(name), ?) > 0"] * len(file_filters))
+            filter_query = " AND {}({})".format(
+                "NOT " if invert_file_filtering else "", filter_clause or "0"
+            )
+            filter_parameters = [substring.lower() for substring in file_filters]
+        # Identifiers are queried in sorted batches, so results stay in identifier order overall
+        for identifier_batch in self.in_batches(sorted(set(identifiers))):
+            query = "SELECT identifier, name, size, {} FROM files WHERE identifier IN ({})".format(
+                hash_algorithm, ", ".join("?" * len(identifier_batch))
+            )
+            yield from self.connection().execute(
+                query + filter_query + " ORDER BY identifier, name",
+                identifier_batch + filter_parameters,
+            )
+
+    def put_search_identifiers(
+        self, search: str, identifiers: typing.List[str], fetched_time: typing.Optional[float] = None
+    ) -> None:
+        """Replace the cached identifiers returned by a search"""
+        with self.connection() as connection:
+            connection.execute("DELETE FROM search_results WHERE search = ?", (search,))
+            connection.executemany(
+                "INSERT INTO search_results VALUES (?, ?, ?)",
+                ((search, position, identifier) for position, identifier in enumerate(identifiers)),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?)",
+                (search, fetched_time if fetched_time is not None else time.time()),
+            )
+
+    def get_search_identifiers(
+        self, search: str, max_age: typing.Optional[datetime.timedelta] = None
+    ) -> typing.Optional[typing.List[str]]:
+        """Return the cached identifiers for a search, or None if the search isn't cached or its
+        results are older than max_age
+
+        """
+        log = logging.getLogger(__name__)
+        connection = self.connection()
+        search_row = connection.execute(
+            "SELECT fetched_time FROM searches WHERE search = ?", (search,)
+        ).fetchone()
+        if search_row is None and self.import_legacy_search(search):
+            search_row = connection.execute(
+                "SELECT fetched_time FROM searches WHERE search = ?", (search,)
+            ).fetchone()
+        if search_row is None:
+            return None
+        if max_age is not None and time.time() - search_row[0] > max_age.total_seconds():
+            return None
+        log.debug(
+            "Cached data from %s will be used for search term '%s'",
+            datetime.datetime.fromtimestamp(search_row[0]).strftime("%Y-%m-%d %H:%M:%S"),
+            search,
+        )
+        return list(self.iter_search_results(search))
+
+    def iter_search_results(self, search: str, start_position: int = 0) -> typing.Iterator[str]:
+        """Yield the stored identifiers for a search (complete or partially enumerated) in order"""
+        for row in self.connection().execute(
+            (
+                "SELECT identifier FROM search_results WHERE search = ? AND position >= ?"
+                " ORDER BY position"
+            ),
+            (search, start_position),
+        ):
+            yield row[0]
+
+    def get_search_progress(
+        self, search: str, max_age: typing.Optional[datetime.timedelta] = None
+    ) -> typing.Optional[typing.Tuple[typing.Optional[str], int]]:
+        """Return the paging cursor and number of stored results of an unfinished enumeration of
+        a search, or None if there isn't one (or it was started longer ago than max_age)
+
+        """
+        progress_row = self.connection().execute(
+            "SELECT started_time, cursor, result_count FROM search_progress WHERE search = ?",
+            (search,),
+        ).fetchone()
+        if progress_row is None:
+            return None
+        if max_age is not None and time.time() - progress_row[0] > max_age.total_seconds():
+            return None
+        return progress_row[1], progress_row[2]
+
+    def start_search(self, search: str) -> None:
+        """Discard any stored results for a search, ready for a new enumeration"""
+        with self.connection() as connection:
+            connection.execute("DELETE FROM search_results WHERE search = ?", (search,))
+            connection.execute("DELETE FROM searches WHERE search = ?", (search,))
+            connection.execute("DELETE FROM search_added_dates WHERE search = ?", (search,))
+            connection.execute(
+                "INSERT OR REPLACE INTO search_progress VALUES (?, ?, NULL, 0)",
+                (search, time.time()),
+            )
+
+    def add_search_page(
+        self,
+        search: str,
+        identifiers: typing.List[str],
+        cursor: typing.Optional[str],
+        newest_added_date: typing.Optional[str] = None,
+    ) -> None:
+        """Store a page of search results along with the cursor for the next page"""
+        with self.connection() as connection:
+            self.record_newest_added_date(connection, search, newest_added_date)
+            (result_count,) = connection.execute(
+                "SELECT result_count FROM search_progress WHERE search = ?", (search,)
+            ).fetchone()
+            connection.executemany(
+                "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?)",
+                (
+                    (search, result_count + page_position, identifier)
+                    for page_position, identifier in enumerate(identifiers)
+                ),
+            )
+            connection.execute(
+                "UPDATE search_progress SET cursor = ?, result_count = ? WHERE search = ?",
+                (cursor, result_count + len(identifiers), search),
+            )
+
+    def add_new_search_results(
+        self, search: str, identifiers: typing.List[str], newest_added_date: typing.Optional[str]
+    ) -> typing.List[str]:
+        """Add the identifiers that aren't already stored to a search's results, returning them"""
+        with self.connection() as connection:
+            self.record_newest_added_date(connection, search, newest_added_date)
+            new_identifiers = [
+                identifier
+                for identifier in dict.fromkeys(identifiers)
+                if connection.execute(
+                    "SELECT 1 FROM search_results WHERE search = ? AND identifier = ?",
+                    (search, identifier),
+                ).fetchone()
+                is None
+            ]
+            (next_position,) = connection.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM search_results WHERE search = ?",
+                (search,),
+            ).fetchone()
+            connection.executemany(
+                "INSERT INTO search_results VALUES (?, ?, ?)",
+                (
+                    (search, next_position + index, identifier)
+                    for index, identifier in enumerate(new_identifiers)
+                ),
+            )
+        return new_identifiers
+
+    @staticmethod
+    def record_newest_added_date(
+        connection: sqlite3.Connection, search: str, added_date: typing.Optional[str]
+    ) -> None:
+        """Raise a search's stored high-water mark of item 'addeddate' values (ISO 8601 strings,
+        so later dates sort after earlier ones)
+
+        """
+        if added_date is None:
+            return
+        added_date_row = connection.execute(
+            "SELECT newest_added_date FROM search_added_dates WHERE search = ?", (search,)
+        ).fetchone()
+        if added_date_row is None or added_date > added_date_row[0]:
+            connection.execute(
+                "INSERT OR REPLACE INTO search_added_dates VALUES (?, ?)", (search, added_date)
+            )
+
+    def get_newest_added_date(self, search: str) -> typing.Optional[str]:
+        """Return the newest 'addeddate' of the items stored for a search, if known"""
+        added_date_row = self.connection().execute(
+            "SELECT newest_added_date FROM search_added_dates WHERE search = ?", (search,)
+        ).fetchone()
+        return added_date_row[0] if added_date_row is not None else None
+
+    def finish_search(self, search: str) -> None:
+        """Record that all results for a search have been stored"""
+        with self.connection() as connection:
+            connection.execute("DELETE FROM search_progress WHERE search = ?", (search,))
+            connection.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?)", (search, time.time())
+            )
+
+    @staticmethod
+    def file_fingerprint(file_stat: os.stat_result) -> typing.Tuple[str, str, int, int]:
+        """Return the details used to tell whether a file has changed since it was hashed"""
+        # Device and inode numbers can exceed SQLite's (signed 64-bit) integers on some
+        # filesystems, so are stored as text
+        return (
+            str(file_stat.st_dev),
+            str(file_stat.st_ino),
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+        )
+
+    def get_file_hash(
+        self, file_path: str, file_stat: os.stat_result, hash_algorithm: str = "md5"
+    ) -> typing.Optional[typing.Tuple[str, float]]:
+        """Return a file's recorded hash value and when it was calculated, provided the file's
+        device, inode, size and modification time are unchanged since (otherwise None)
+
+        """
+        file_hash_row = self.connection().execute(
+            (
+                "SELECT hash_value, hashed_time FROM file_hashes"
+                " WHERE path = ? AND hash_algorithm = ? AND device = ? AND inode = ? AND size = ?"
+                " AND mtime_ns = ?"
+            ),
+            (os.path.abspath(file_path), hash_algorithm) + self.file_fingerprint(file_stat),
+        ).fetchone()
+        return (file_hash_row[0], file_hash_row[1]) if file_hash_row is not None else None
+
+    def put_file_hashes(
+        self,
+        file_hashes: typing.List[typing.Tuple[str, os.stat_result, str]],
+        hash_algorithm: str = "md5",
+    ) -> None:
+        """Record the hash values of (file path, stat result taken before hashing, hash value)"""
+        hashed_time = time.time()
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (os.path.abspath(file_path), hash_algorithm)
+                    + self.file_fingerprint(file_stat)
+                    + (hash_value, hashed_time)
+                    for file_path, file_stat, hash_value in file_hashes
+                ],
+            )
+
+    def put_completed_file(
+        self,
+        file_path: str,
+        identifier: str,
+        file_stat: os.stat_result,
+        md5_status: typing.Optional[str] = None,
+    ) -> None:
+        """Record in the completion journal that a file has finished downloading (or was found
+        already downloaded), with its size and modification time at that point and whether its MD5
+        hash value matched IA metadata ('match' or 'mismatch' - None if it hasn't been checked, or
+        'crc32_match'/'crc32_mismatch' if it was resumed from a hash checkpoint, so was checked
+        using its CRC32 instead)
+
+        """
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO completed_files VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(file_path),
+                    identifier,
+                    file_stat.st_size,
+                    file_stat.st_mtime_ns,
+                    md5_status,
+                    time.time(),
+                ),
+            )
+
+    def set_completed_file_md5_status(self, file_path: str, md5_status: str) -> None:
+        """Record the result of a completed file's MD5 hash check, once it has finished"""
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE completed_files SET md5_status = ? WHERE path = ?",
+                (md5_status, os.path.abspath(file_path)),
+            )
+
+    def get_completed_files(
+        self, file_paths: typing.List[str]
+    ) -> typing.Dict[str, typing.Tuple[int, int, typing.Optional[str]]]:
+        """Return the (size, modification time, MD5 status) recorded in the completion journal for
+        each of the files that has been recorded, keyed by absolute file path
+
+        """
+        completed_files = (
+            {}
+        )  # type: typing.Dict[str, typing.Tuple[int, int, typing.Optional[str]]]
+        absolute_paths = sorted(set(os.path.abspath(file_path) for file_path in file_paths))
+        connection = self.connection()
+        for path_batch in self.in_batches(absolute_paths):
+            for path, size, mtime_ns, md5_status in connection.execute(
+                (
+                    "SELECT path, size, mtime_ns, md5_status FROM completed_files WHERE path IN"
+                    " ({})".format(", ".join("?" * len(path_batch)))
+                ),
+                path_batch,
+            ):
+                completed_files[path] = (size, mtime_ns, md5_status)
+        return completed_files
+
+    def get_completed_item(
+        self, output_folder: str, identifier: str
+    ) -> typing.Optional[typing.Tuple[str, typing.Optional[str]]]:
+        """Return the metadata version and folder signature of an item when it was last recorded as
+        fully downloaded to an output folder, or None if it hasn't been
+
+        """
+        completed_item_row = self.connection().execute(
+            (
+                "SELECT metadata_version, folder_signature FROM completed_items"
+                " WHERE output_folder = ? AND identifier = ?"
+            ),
+            (os.path.abspath(output_folder), identifier),
+        ).fetchone()
+        return tuple(completed_item_row) if completed_item_row is not None else None
+
+    def put_completed_item(
+        self,
+        output_folder: str,
+        identifier: str,
+        metadata_version: str,
+        folder_signature: typing.Optional[str],
+    ) -> None:
+        """Record in the completion journal that an item has been fully downloaded to an output
+        folder, for the version of its metadata that was downloaded, with the signature of the
+        folders its files were downloaded to at that point
+
+        """
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO completed_items VALUES (?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(output_folder),
+                    identifier,
+                    metadata_version,
+                    folder_signature,
+                    time.time(),
+                ),
+            )
+
+    def set_completed_item_folder_signature(
+        self, output_folder: str, identifier: str, folder_signature: typing.Optional[str]
+    ) -> None:
+        """Update the folder signature recorded for a fully downloaded item"""
+        with self.connection() as connection:
+            connection.execute(
+                (
+                    "UPDATE completed_items SET folder_signature = ?"
+                    " WHERE output_folder = ? AND identifier = ?"
+                ),
+                (folder_signature, os.path.abspath(output_folder), identifier),
+            )
+
+    def newest_legacy_cache_file(
+        self, folder_name: str, file_suffix: str
+    ) -> typing.Optional[typing.Tuple[str, float]]:
+        """Return the path and timestamp of the most recent legacy text cache file in a folder"""
+        cache_folder = os.path.join(self.cache_parent_folder, folder_name)
+        if not os.path.isdir(cache_folder):
+            return None
+        cache_files = sorted(
+            [
+                f.path
+                for f in os.scandir(cache_folder)
+                if f.is_file() and f.name.endswith(file_suffix)
+            ]
+        )
+        if len(cache_files) == 0:
+            return None
+        cache_file = cache_files[-1]
+        datetime_str = "_".join(os.path.basename(cache_file).split("_", 2)[:2])
+        try:
+            file_datetime = datetime.datetime.strptime(datetime_str, "%Y%m%d_%H%M%S")
+        except ValueError:
+            return None
+        return cache_file, file_datetime.timestamp()
+
+    def import_legacy_item(self, identifier: str) -> bool:
+        """Import an item's most recent '[identifier]_metadata.txt' cache file, if there is one"""
+        log = logging.getLogger(__name__)
+        legacy_cache_file = self.newest_legacy_cache_file(identifier, "metadata.txt")
+        if legacy_cache_file is None:
+            return False
+        cache_file, fetched_time = legacy_cache_file
+        files = []
+        try:
+            with open(cache_file, "r", encoding="utf-8") as file_handler:
+                for line in file_handler:
+                    # Split from both ends, so file names containing '|' are kept intact
+                    _, remainder = line.rstrip("\n").split("|", 1)
+                    file_path, size, md5, mtime = remainder.rsplit("|", 3)
+                    files.append({"name": file_path, "size": size, "md5": md5, "mtime": mtime})
+        except (OSError, ValueError):
+            log.info(
+                "Cache file '%s' does not match expected format - it will not be used", cache_file
+            )
+            return False
+        self.put_item_files(identifier, files, fetched_time=fetched_time)
+        log.debug("Imported cache file '%s' into metadata database", cache_file)
+        return True
+
+    def import_legacy_search(self, search: str) -> bool:
+        """Import a search's most recent '[search]_items.txt' cache file, if there is one"""
+        log = logging.getLogger(__name__)
+        legacy_cache_file = self.newest_legacy_cache_file(
+            "search-{}".format(get_safe_path_name(search)), "items.txt"
+        )
+        if legacy_cache_file is None:
+            return False
+        cache_file, fetched_time = legacy_cache_file
+        try:
+            with open(cache_file, "r", encoding="utf-8") as file_handler:
+                identifiers = [line.strip() for line in file_handler if line.strip() != ""]
+        except OSError:
+            return False
+        self.put_search_identifiers(search, identifiers, fetched_time)
+        log.debug("Imported cache file '%s' into metadata database", cache_file)
+        return True
+
+
+metadata_stores = {}  # type: typing.Dict[str, MetadataStore]
+metadata_stores_lock = threading.Lock()
+
+
+def get_metadata_store(cache_parent_folder: str) -> MetadataStore:
+    """Return the metadata store for a cache folder, shared by all threads in the process"""
+    with metadata_stores_lock:
+        cache_parent_folder = os.path.abspath(cache_parent_folder)
+        if cache_parent_folder not in metadata_stores:
+            metadata_stores[cache_parent_folder] = MetadataStore(cache_parent_folder)
+        return metadata_stores[cache_parent_folder]
+
+
+# Hash algorithms that Internet Archive file metadata provides values for
+HASH_ALGORITHMS = ["md5", "sha1", "crc32"]
+
+
+def calculate_file_hash(filepath: str, hash_algorithm: str = "md5") -> str:
+    """Return str containing lowercase hash value (of an algorithm in HASH_ALGORITHMS) of file at a
+    file path
+
+    """
+    if hash_algorithm == "crc32":
+        return "{:08x}".format(hash_file_from_offset(filepath, 0, None, 0))
+    with open(filepath, "rb") as file_handler:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+; reads into a reused buffer
+            return hashlib.file_digest(file_handler, hash_algorithm).hexdigest()
+        block_size = 4096 * 1024
+        file_hash = hashlib.new(hash_algorithm)
+        while True:
+            data = file_handler.read(block_size)
+            if not data:
+                break
+            file_hash.update(data)
+    return file_hash.hexdigest()
 
 
 def md5_hash_file(filepath: str) -> str:
     """Return str containing lowercase MD5 hash value of file at a file path"""
-    block_size = 64 * 1024
-    md5 = hashlib.md5()
+    return calculate_file_hash(filepath, "md5")
+
+
+def hash_file_from_offset(
+    filepath: str, offset: int, md5: typing.Optional["hashlib._Hash"], crc32: int
+) -> int:
+    """Add the data of file at a file path (from the provided byte offset onwards) to a running
+    MD5 hash (updated in place, if provided) and CRC32 value, returning the updated CRC32 value
+
+    """
+    block_size = 4096 * 1024
     with open(filepath, "rb") as file_handler:
+        file_handler.seek(offset)
         while True:
             data = file_handler.read(block_size)
             if not data:
                 break
-            md5.update(data)
-    return md5.hexdigest()
+            if md5 is not None:
+                md5.update(data)
+            crc32 = zlib.crc32(data, crc32)
+    return crc32
+
+
+def read_hash_checkpoint(file_path: str, ia_md5: str) -> typing.Optional[typing.Tuple[int, int]]:
+    """Return (byte offset, CRC32 value) from the hash checkpoint sidecar of a partially
+    downloaded file, or None if there is no usable checkpoint
+
+    Python's hashlib objects can't be serialised, so the running hash that is checkpointed is a
+    CRC32 (which Internet Archive also records in file metadata) - a download resumed from a
+    checkpoint is verified by its CRC32 rather than its MD5. Checkpoints are discarded as
+    stale if they were made for a different version of the IA file (i.e. a different MD5 value),
+    or cover more data than the partial file now holds (e.g. the file was truncated or replaced)
+    """
+    log = logging.getLogger(__name__)
+    checkpoint_path = "{}.hashstate".format(file_path)
+    if not os.path.isfile(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as file_handler:
+            checkpoint = json.load(file_handler)
+        offset = int(checkpoint["offset"])
+        crc32 = int(checkpoint["crc32"])
+        checkpoint_ia_md5 = checkpoint["ia_md5"]
+    except (OSError, ValueError, KeyError, TypeError):
+        log.debug("Hash checkpoint '%s' could not be read - will be discarded", checkpoint_path)
+        remove_hash_checkpoint(file_path)
+        return None
+    if checkpoint_ia_md5 != ia_md5 or offset > os.path.getsize(file_path):
+        log.debug(
+            "Hash checkpoint '%s' does not match partially downloaded file - will be discarded",
+            checkpoint_path,
+        )
+        remove_hash_checkpoint(file_path)
+        return None
+    return offset, crc32
+
+
+def write_hash_checkpoint(file_path: str, offset: int, crc32: int, ia_md5: str) -> None:
+    """Record the running CRC32 value covering the first 'offset' bytes of a partially downloaded
+    file in a sidecar next to the file, so that a resumed download doesn't need to rehash them
+
+    The file's data (which must already have been flushed) is synced to disk first, so that after
+    a crash the checkpoint can't cover more data than the file actually holds
+    """
+    with open(file_path, "ab") as file_handler:
+        os.fsync(file_handler.fileno())
+    checkpoint_path = "{}.hashstate".format(file_path)
+    with open("{}.tmp".format(checkpoint_path), "w", encoding="utf-8") as file_handler:
+        json.dump({"offset": offset, "crc32": crc32, "ia_md5": ia_md5}, file_handler)
+        file_handler.flush()
+        os.fsync(file_handler.fileno())
+    os.replace("{}.tmp".format(checkpoint_path), checkpoint_path)
+
+
+def remove_hash_checkpoint(file_path: str) -> None:
+    """Delete the hash checkpoint sidecar of a file, if one exists"""
+    try:
+        os.remove("{}.hashstate".format(file_path))
+    except FileNotFoundError:
+        pass
 
 
 def get_safe_path_name(path_name: str) -> str:
@@ -308,19 +1324,43 @@ def hash_pool_initializer() -> None:
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 
-def check_hash(file_path: str, md5_value_from_ia: str) -> typing.Tuple[str, str]:
-    """Called as a separate process from the file_download function; returns results from an MD5
-    hash check of a file
+def get_hash_process_count() -> int:
+    """Return the default number of processes to use for hashing (one per CPU, leaving one free
+    for the main process where possible)
+
+    """
+    return max(multiprocessing.cpu_count() - 1, 1)
+
+
+def calculate_file_hash_if_readable(
+    file_path: str, hash_algorithm: str = "md5"
+) -> typing.Tuple[str, typing.Optional[str]]:
+    """Called as a separate process from the verify function; returns the file path with its hash
+    value, or None if the file could not be read
 
     """
     try:
-        md5_value_local = md5_hash_file(file_path)
+        return file_path, calculate_file_hash(file_path, hash_algorithm)
+    except (PermissionError, OSError):
+        return file_path, None
+
+
+def check_hash(
+    file_path: str, md5_value_from_ia: str
+) -> typing.Tuple[str, str, typing.Optional[str]]:
+    """Called as a separate process from the file_download function; returns results from an MD5
+    hash check of a file, and the file's MD5 hash value (None if the file couldn't be hashed)
+
+    """
+    try:
+        md5_value_local = md5_hash_file(file_path)
     except FileNotFoundError:
         return (
             "warning",
             "'{}' file seems to have been deleted before hashing could complete".format(
                 os.path.basename(file_path)
             ),
+            None,
         )
     except (PermissionError, OSError):
         return (
@@ -328,30 +1368,89 @@ def check_hash(file_path: str, md5_value_from_ia: str) -> typing.Tuple[str, str]
             "PermissionError/OSError when attempting to hash '{}'".format(
                 os.path.basename(file_path)
             ),
+            None,
         )
+    return compare_hash_values(file_path, md5_value_local, md5_value_from_ia) + (md5_value_local,)
+
+
+def compare_hash_values(
+    file_path: str, md5_value_local: str, md5_value_from_ia: str, hash_name: str = "hash"
+) -> typing.Tuple[str, str]:
+    """Return log level and message describing whether a locally-calculated hash (MD5 unless
+    otherwise named) matches the value from IA metadata
+
+    """
     if md5_value_local.lower().strip() == md5_value_from_ia.lower().strip():
         return (
             "debug",
-            "'{}' file hash ('{}') matches between local file and IA metadata".format(
-                os.path.basename(file_path), md5_value_local
+            "'{}' file {} ('{}') matches between local file and IA metadata".format(
+                os.path.basename(file_path), hash_name, md5_value_local
             ),
         )
     return (
         "warning",
-        "'{}' file hash does not match between local file ({}) and IA metadata ({})".format(
-            os.path.basename(file_path), md5_value_local, md5_value_from_ia
+        "'{}' file {} does not match between local file ({}) and IA metadata ({})".format(
+            os.path.basename(file_path), hash_name, md5_value_local, md5_value_from_ia
         ),
     )
 
 
-def log_update_callback(result: typing.List[typing.Tuple[str, str]]) -> None:
-    """Function invoked when a hash operation completes; takes result of check_hash and adds to
-    log
+def check_hash_in_pool(
+    file_path: str,
+    md5_value_from_ia: str,
+    hash_pool: multiprocessing.pool.Pool,
+    metadata_store: typing.Optional["MetadataStore"],
+) -> None:
+    """Log whether a file's MD5 hash value matches IA metadata - using the value recorded in the
+    metadata store if the file is unchanged since it was last hashed, or otherwise hashing it in
+    the hash pool (and recording the new value) - and record the result in the completion journal
 
     """
     log = logging.getLogger(__name__)
-    log_level, log_message = result[0]
-    getattr(log, log_level)(log_message)
+
+    def record_md5_status(md5_value_local: str) -> None:
+        """Record whether the file's MD5 hash value matched in the completion journal"""
+        if metadata_store is not None:
+            metadata_store.set_completed_file_md5_status(
+                file_path,
+                "match"
+                if md5_value_local.lower().strip() == md5_value_from_ia.lower().strip()
+                else "mismatch",
+            )
+
+    file_stat = None
+    if metadata_store is not None:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            pass  # Hashing will report the issue
+        if file_stat is not None:
+            file_hash = metadata_store.get_file_hash(file_path, file_stat)
+            if file_hash is not None:
+                log_level, log_message = compare_hash_values(
+                    file_path, file_hash[0], md5_value_from_ia
+                )
+                getattr(log, log_level)(log_message + " (recorded hash value used)")
+                record_md5_status(file_hash[0])
+                return
+
+    def log_update_callback(result: typing.List[typing.Tuple[str, str, typing.Optional[str]]]):
+        """Function invoked when the hash operation completes; takes result of check_hash and adds
+        to log
+
+        """
+        log_level, log_message, md5_value_local = result[0]
+        getattr(log, log_level)(log_message)
+        if metadata_store is not None and file_stat is not None and md5_value_local is not None:
+            try:
+                metadata_store.put_file_hashes([(file_path, file_stat, md5_value_local)])
+                record_md5_status(md5_value_local)
+            except sqlite3.Error as exception:
+                log.debug("'%s' hash value could not be recorded: %s", file_path, exception)
+
+    hash_pool.starmap_async(
+        check_hash, iterable=[(file_path, md5_value_from_ia)], callback=log_update_callback
+    )
 
 
 def does_file_have_416_issue(file_path: str) -> bool:
@@ -376,28 +1475,1029 @@ def does_file_have_416_issue(file_path: str) -> bool:
     return False
 
 
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that keeps count of requests and new connections made through its connection
+    pools (including pools that have since been evicted), so that keep-alive reuse can be reported
+
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.stats_lock = threading.Lock()
+        self.evicted_request_count = 0
+        self.evicted_connection_count = 0
+        super(PooledHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        dispose_func = self.poolmanager.pools.dispose_func
+
+        def record_and_dispose(pool) -> None:
+            with self.stats_lock:
+                self.evicted_request_count += pool.num_requests
+                self.evicted_connection_count += pool.num_connections
+            dispose_func(pool)
+
+        self.poolmanager.pools.dispose_func = record_and_dispose
+
+    def connection_stats(self) -> typing.Tuple[int, int]:
+        """Return tuple of (requests made, new connections opened) across all pools"""
+        with self.stats_lock:
+            request_count = self.evicted_request_count
+            connection_count = self.evicted_connection_count
+        for pool_key in self.poolmanager.pools.keys():
+            pool = self.poolmanager.pools.get(pool_key)
+            if pool is not None:
+                request_count += pool.num_requests
+                connection_count += pool.num_connections
+        return request_count, connection_count
+
+
+def get_download_session(pool_size: int) -> requests.Session:
+    """Return an Internet Archive session with a keep-alive connection pool large enough for
+    pool_size simultaneous connections; intended to be shared by all download threads in a run
+
+    """
+    session = internetarchive.get_session()
+    # The internetarchive package asks for every connection to be closed after one request, which
+    # would leave nothing in the pool to reuse
+    session.headers["Connection"] = "keep-alive"
+    adapter = PooledHTTPAdapter(
+        pool_connections=max(pool_size, 10), pool_maxsize=pool_size, max_retries=0
+    )
+    # Downloads are redirected from archive.org to individual datanodes, so mount on the bare
+    # protocol prefixes as well as replacing the internetarchive package's archive.org adapter
+    for prefix in ["https://", "http://", "{}//{}".format(session.protocol, session.host)]:
+        session.mount(prefix, adapter)
+    return session
+
+
+def log_session_stats(session: requests.Session) -> None:
+    """Log how often connections in the session's pools were reused rather than newly opened"""
+    log = logging.getLogger(__name__)
+    request_count = 0
+    connection_count = 0
+    for adapter in set(session.adapters.values()):
+        if isinstance(adapter, PooledHTTPAdapter):
+            adapter_request_count, adapter_connection_count = adapter.connection_stats()
+            request_count += adapter_request_count
+            connection_count += adapter_connection_count
+    if request_count > 0:
+        log.info(
+            (
+                "Connection pool stats: %s requests made using %s connections (%s pool hits, %s"
+                " pool misses, %.1f%% reuse rate)"
+            ),
+            request_count,
+            connection_count,
+            max(request_count - connection_count, 0),
+            connection_count,
+            (max(request_count - connection_count, 0) / request_count) * 100,
+        )
+
+
+def get_file_download_url(session: requests.Session, identifier: str, ia_file_name: str) -> str:
+    """Return the download URL for a file within an Internet Archive item, built from item
+    metadata in the same way as the internetarchive package's File objects
+
+    """
+    return "{}//{}/download/{}/{}".format(
+        session.protocol,  # type: ignore
+        session.host,  # type: ignore
+        identifier,
+        urllib.parse.quote(ia_file_name.encode("utf-8")),
+    )
+
+
+def get_item_last_updated(session: requests.Session, identifier: str) -> typing.Optional[int]:
+    """Return an item's 'item_last_updated' timestamp using the metadata API's sub-item endpoint
+    (a few bytes, rather than the item's full metadata), or None if IA doesn't report one
+
+    """
+    response = session.get(
+        "{}//{}/metadata/{}/item_last_updated".format(
+            session.protocol, session.host, identifier  # type: ignore
+        ),
+        timeout=12,
+    )
+    response.raise_for_status()
+    result = response.json().get("result")
+    return int(result) if result is not None else None
+
+
+def get_item_metadata(session: requests.Session, identifier: str) -> typing.Dict[str, typing.Any]:
+    """Return an item's full metadata from the metadata API, requested on the download session
+    itself so that a failed response (and any Retry-After header) is available to the caller
+
+    """
+    response = session.get(
+        "{}//{}/metadata/{}".format(session.protocol, session.host, identifier),  # type: ignore
+        auth=get_session_auth(session),
+        timeout=12,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def get_session_auth(session: requests.Session) -> typing.Optional[requests.auth.AuthBase]:
+    """Return S3 auth for the session's Internet Archive account if keys are configured (cookie
+    based logins are already carried by the session itself)
+
+    """
+    access_key = getattr(session, "access_key", None)
+    secret_key = getattr(session, "secret_key", None)
+    if access_key and secret_key:
+        return internetarchive.auth.S3Auth(access_key, secret_key)
+    return None
+
+
+def preallocate_file(file_path: str, file_size: int) -> None:
+    """Create a file at a file path with space for file_size bytes allocated up front (or a sparse
+    file of that size, where the platform/filesystem doesn't support preallocation)
+
+    """
+    with open(file_path, "wb") as file_handler:
+        try:
+            os.posix_fallocate(file_handler.fileno(), 0, file_size)  # type: ignore
+        except (AttributeError, OSError):
+            file_handler.truncate(file_size)
+
+
+def write_at_offset(file_handler: typing.BinaryIO, data: bytes, offset: int) -> None:
+    """Write data at a byte offset of an (unbuffered) file handler, using a positional write where
+    the platform supports it so that multiple threads can write to the same file independently
+
+    """
+    if hasattr(os, "pwrite"):
+        data_view = memoryview(data)
+        while len(data_view) > 0:
+            bytes_written = os.pwrite(file_handler.fileno(), data_view, offset)
+            data_view = data_view[bytes_written:]
+            offset += bytes_written
+    else:
+        file_handler.seek(offset)
+        file_handler.write(data)
+
+
+class ConnectionBudget:
+    """Limits the number of simultaneous download connections across all file download threads
+    and split file range threads in a run
+
+    Each file download holds one connection while it runs; the additional range threads of a split
+    download wait for connections with priority over new file downloads, so large files gain extra
+    connections as they are freed while small files fill the remaining slots
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.condition = threading.Condition()
+        self.in_use = 0
+        self.priority_waiting = 0
+
+    def acquire(self, priority: bool = False, timeout: typing.Optional[float] = None) -> bool:
+        """Take a connection from the budget, waiting (up to timeout seconds, if provided) for one
+        to become free; returns False if the timeout expired first
+
+        """
+        with self.condition:
+            if priority:
+                self.priority_waiting += 1
+            try:
+                acquired = self.condition.wait_for(
+                    lambda: self.in_use < self.size
+                    and (priority or self.priority_waiting == 0),
+                    timeout=timeout,
+                )
+                if acquired:
+                    self.in_use += 1
+                return acquired
+            finally:
+                if priority:
+                    self.priority_waiting -= 1
+                    # Waiting file downloads may now be allowed to proceed
+                    self.condition.notify_all()
+
+    def release(self) -> None:
+        """Return a connection to the budget"""
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify_all()
+
+
+class BandwidthLimiter:
+    """Token bucket limiting the combined transfer rate of all downloads in the process (file
+    download threads, split file range threads and concurrent web app tasks)
+
+    The limit can be changed at any time, including by a time-of-day schedule; waiting threads
+    pick up a new limit within a second
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.rate_limit = None  # type: typing.Optional[int]
+        self.schedule = []  # type: typing.List[RateScheduleEntry]
+        self.tokens = 0.0
+        self.last_refill_time = time.monotonic()
+
+    def set_limits(
+        self,
+        rate_limit: typing.Optional[int],
+        schedule: typing.Optional[typing.List[RateScheduleEntry]] = None,
+    ) -> None:
+        """Set the default rate limit (bytes per second, or None for unlimited) and the schedule of
+        (start time, end time, rate limit) entries that override it during the day
+
+        """
+        with self.lock:
+            self.rate_limit = rate_limit
+            self.schedule = list(schedule) if schedule is not None else []
+
+    def get_limits(self) -> typing.Dict[str, typing.Any]:
+        """Return the current limits as a JSON-serialisable dict"""
+        with self.lock:
+            return {
+                "rate_limit": self.rate_limit,
+                "schedule": [
+                    {
+                        "start": start_time.strftime("%H:%M"),
+                        "end": end_time.strftime("%H:%M"),
+                        "rate_limit": rate_limit,
+                    }
+                    for start_time, end_time, rate_limit in self.schedule
+                ],
+                "current_rate_limit": self.current_rate_limit(),
+            }
+
+    def current_rate_limit(self) -> typing.Optional[int]:
+        """Return the rate limit in effect now (lock must be held)"""
+        now = datetime.datetime.now().time()
+        for start_time, end_time, rate_limit in self.schedule:
+            if start_time <= end_time:
+                if start_time <= now < end_time:
+                    return rate_limit
+            elif now >= start_time or now < end_time:  # Entry runs past midnight
+                return rate_limit
+        return self.rate_limit
+
+    def consume(self, byte_count: int) -> None:
+        """Account for byte_count bytes having been downloaded, blocking until the transfer rate
+        is back within the limit
+
+        """
+        while True:
+            with self.lock:
+                rate_limit = self.current_rate_limit()
+                now = time.monotonic()
+                if rate_limit is None:
+                    self.tokens = 0.0
+                    self.last_refill_time = now
+                    return
+                # Allow bursts of up to a second's worth of data
+                self.tokens = min(
+                    float(rate_limit), self.tokens + (now - self.last_refill_time) * rate_limit
+                )
+                self.last_refill_time = now
+                if self.tokens > 0:
+                    self.tokens -= byte_count
+                    return
+                wait_time = -self.tokens / rate_limit
+            time.sleep(min(wait_time, 1))
+
+
+# Shared by every download in the process
+bandwidth_limiter = BandwidthLimiter()
+
+
+class SegmentScheduler:
+    """Schedules the byte range segments of a split download between download threads, and keeps
+    a progress map recording how much of each segment has been written to the partial file
+    (persisted as JSON alongside the partial file so that an interrupted download can be resumed)
+
+    Segments are handed out dynamically: when no unassigned segments remain, an idle thread takes
+    over a segment that has stopped making progress, or otherwise splits the largest remaining
+    segment in two and takes the second half - so one slow connection doesn't hold up completion
+    of the whole file. A segment whose request fails with a temporary error is returned to the
+    pool unowned, so that it can be picked up by whichever thread is next free
+    """
+
+    save_interval = 67108864  # 64MB
+    min_segment_size = 4194304  # 4MB
+    # Seconds without data before a segment is handed to another thread (kept below the 12 second
+    # read timeout of range requests, so that a stalled connection is taken over before it errors;
+    # the stalled connection is then aborted, rather than being left to time out)
+    stall_timeout = 8
+    # Temporary errors in a row before a range thread gives up and leaves its work to the others
+    max_consecutive_failures = 3
+
+    def __init__(
+        self,
+        progress_file_path: str,
+        file_size: int,
+        ia_md5: str,
+        segments: typing.List[typing.List[int]],
+    ) -> None:
+        self.progress_file_path = progress_file_path
+        self.file_size = file_size
+        self.ia_md5 = ia_md5
+        # Each segment is [first byte, last byte, next byte to be written]
+        self.segments = segments
+        self.lock = threading.Lock()
+        self.unsaved_size = 0
+        self.segment_owners = {}  # type: typing.Dict[int, int]
+        self.segment_progress_times = {}  # type: typing.Dict[int, float]
+        # Segments whose thread is waiting on the bandwidth limiter rather than the server
+        self.throttled_segments = set()  # type: typing.Set[int]
+        # The response each segment's owner is currently reading, so it can be aborted if the
+        # segment is taken over
+        self.segment_responses = {}  # type: typing.Dict[int, requests.Response]
+        # A thread that has run out of work stays to take over any segment that stalls
+        self.standby_thread = None  # type: typing.Optional[int]
+        self.failed_segments = set()  # type: typing.Set[int]
+        # (segment index, bytes downloaded, seconds taken) for each completed segment
+        self.segment_stats = []  # type: typing.List[typing.Tuple[int, int, float]]
+        self.segment_start_details = {}  # type: typing.Dict[int, typing.Tuple[int, float]]
+
+    @classmethod
+    def create(
+        cls, progress_file_path: str, file_size: int, ia_md5: str, split_count: int
+    ) -> "SegmentScheduler":
+        """Return a new scheduler with the file divided into small segments (several per download
+        thread, so that faster threads naturally take on more of the file)
+
+        """
+        segment_count = max(
+            1, min(split_count * 4, file_size // SegmentScheduler.min_segment_size)
+        )
+        segments = []
+        for segment_index in range(segment_count):
+            lower_bytes_range = (file_size * segment_index) // segment_count
+            upper_bytes_range = ((file_size * (segment_index + 1)) // segment_count) - 1
+            segments.append([lower_bytes_range, upper_bytes_range, lower_bytes_range])
+        return cls(progress_file_path, file_size, ia_md5, segments)
+
+    @classmethod
+    def load(
+        cls, progress_file_path: str, part_file_path: str, file_size: int, ia_md5: str
+    ) -> typing.Optional["SegmentScheduler"]:
+        """Return a scheduler from the saved progress map for a partial file, or None if it is
+        missing or doesn't match the partial file and the IA file it's being downloaded from
+
+        """
+        log = logging.getLogger(__name__)
+        try:
+            with open(progress_file_path, "r", encoding="utf-8") as file_handler:
+                progress = json.load(file_handler)
+            segments = [[int(value) for value in segment] for segment in progress["segments"]]
+            if (
+                progress["file_size"] != file_size
+                or progress["ia_md5"] != ia_md5
+                or os.path.getsize(part_file_path) != file_size
+            ):
+                raise ValueError("Progress map does not match partially downloaded file")
+        except (OSError, ValueError, KeyError, TypeError):
+            log.debug(
+                "Progress map '%s' is missing or stale - split download will be restarted",
+                progress_file_path,
+            )
+            return None
+        return cls(progress_file_path, file_size, ia_md5, segments)
+
+    def save(self) -> None:
+        """Write the progress map to disk"""
+        temp_file_path = "{}.tmp".format(self.progress_file_path)
+        with self.lock:
+            with open(temp_file_path, "w", encoding="utf-8") as file_handler:
+                json.dump(
+                    {
+                        "file_size": self.file_size,
+                        "ia_md5": self.ia_md5,
+                        "segments": self.segments,
+                    },
+                    file_handler,
+                )
+            os.replace(temp_file_path, self.progress_file_path)
+            self.unsaved_size = 0
+
+    def save_due(self) -> bool:
+        """Return True if enough data has been written since the last save that the progress map
+        should be saved again
+
+        """
+        with self.lock:
+            return self.unsaved_size >= self.save_interval
+
+    def assign_segment(self, segment_index: int, thread_number: int) -> None:
+        """Assign a segment to a thread (lock must be held)"""
+        now = time.monotonic()
+        if self.standby_thread == thread_number:
+            self.standby_thread = None
+        self.segment_owners[segment_index] = thread_number
+        self.segment_progress_times[segment_index] = now
+        self.throttled_segments.discard(segment_index)
+        self.segment_start_details[segment_index] = (self.segments[segment_index][2], now)
+
+    def acquire_segment(self, thread_number: int) -> typing.Optional[int]:
+        """Return the index of the next segment the thread should download, or None if there is
+        no work left for it
+
+        """
+        log = logging.getLogger(__name__)
+        with self.lock:
+            incomplete_segments = [
+                segment_index
+                for segment_index, segment in enumerate(self.segments)
+                if segment[2] <= segment[1] and segment_index not in self.failed_segments
+            ]
+            # Unassigned segments first, in file order
+            for segment_index in incomplete_segments:
+                if segment_index not in self.segment_owners:
+                    self.assign_segment(segment_index, thread_number)
+                    return segment_index
+            # Then take over any segment whose thread has stopped receiving data (time spent
+            # waiting on the bandwidth limiter isn't counted as a stall)
+            now = time.monotonic()
+            for segment_index in incomplete_segments:
+                if (
+                    segment_index not in self.throttled_segments
+                    and now - self.segment_progress_times[segment_index] > self.stall_timeout
+                ):
+                    log.debug(
+                        "Segment %s has stalled (no data for %s seconds) - reassigning",
+                        segment_index,
+                        self.stall_timeout,
+                    )
+                    stalled_response = self.segment_responses.pop(segment_index, None)
+                    if stalled_response is not None:
+                        abort_response(stalled_response)
+                    self.assign_segment(segment_index, thread_number)
+                    return segment_index
+            # Otherwise split the segment with the most data remaining
+            if len(incomplete_segments) > 0:
+                largest_segment_index = max(
+                    incomplete_segments,
+                    key=lambda segment_index: (
+                        self.segments[segment_index][1] - self.segments[segment_index][2]
+                    ),
+                )
+                largest_segment = self.segments[largest_segment_index]
+                remaining_size = largest_segment[1] - largest_segment[2] + 1
+                if remaining_size >= self.min_segment_size * 2:
+                    split_point = largest_segment[2] + (remaining_size // 2)
+                    self.segments.append([split_point, largest_segment[1], split_point])
+                    largest_segment[1] = split_point - 1
+                    self.assign_segment(len(self.segments) - 1, thread_number)
+                    return len(self.segments) - 1
+            return None
+
+    def wait_for_stall(self, thread_number: int) -> bool:
+        """Return True if a thread that has run out of work should wait to take over a segment
+        that stalls - one thread waits while segments are still being downloaded by others, and
+        the rest finish
+
+        """
+        with self.lock:
+            if not any(
+                self.segments[segment_index][2] <= self.segments[segment_index][1]
+                for segment_index in self.segment_owners
+            ):
+                self.standby_thread = None
+                return False
+            if self.standby_thread is None:
+                self.standby_thread = thread_number
+            return self.standby_thread == thread_number
+
+    def release_segment(
+        self, segment_index: int, thread_number: int, failed: bool
+    ) -> typing.Optional[typing.Tuple[int, float]]:
+        """Release a thread's ownership of a segment; if the thread completed the segment, return
+        the number of bytes it downloaded and the time taken. An incomplete segment is left for
+        another thread to pick up, unless failed is True (i.e. it can't be downloaded at all)
+
+        """
+        with self.lock:
+            if self.segment_owners.get(segment_index) != thread_number:
+                return None
+            del self.segment_owners[segment_index]
+            self.throttled_segments.discard(segment_index)
+            self.segment_responses.pop(segment_index, None)
+            segment = self.segments[segment_index]
+            if failed:
+                self.failed_segments.add(segment_index)
+            elif segment[2] > segment[1]:
+                start_offset, start_time = self.segment_start_details[segment_index]
+                segment_size = segment[2] - start_offset
+                duration = time.monotonic() - start_time
+                self.segment_stats.append((segment_index, segment_size, duration))
+                return segment_size, duration
+            return None
+
+    def segment_position(
+        self, segment_index: int, thread_number: int
+    ) -> typing.Optional[typing.Tuple[int, int]]:
+        """Return the next byte to be written and the last byte of a segment, or None if the
+        segment is complete or has been reassigned to another thread
+
+        """
+        with self.lock:
+            segment = self.segments[segment_index]
+            if self.segment_owners.get(segment_index) != thread_number or segment[2] > segment[1]:
+                return None
+            return segment[2], segment[1]
+
+    def set_response(
+        self, segment_index: int, thread_number: int, response: requests.Response
+    ) -> None:
+        """Record the response a segment's thread is reading the segment's data from"""
+        with self.lock:
+            if self.segment_owners.get(segment_index) == thread_number:
+                self.segment_responses[segment_index] = response
+
+    def owns_segment(self, segment_index: int, thread_number: int) -> bool:
+        """Return True if the thread still owns the segment (i.e. it hasn't been taken over)"""
+        with self.lock:
+            return self.segment_owners.get(segment_index) == thread_number
+
+    def set_throttled(self, segment_index: int, thread_number: int, throttled: bool) -> None:
+        """Mark whether a segment's thread is waiting on the bandwidth limiter, so that the wait
+        isn't mistaken for a stalled connection
+
+        """
+        with self.lock:
+            if self.segment_owners.get(segment_index) != thread_number:
+                return
+            if throttled:
+                self.throttled_segments.add(segment_index)
+            else:
+                self.throttled_segments.discard(segment_index)
+                self.segment_progress_times[segment_index] = time.monotonic()
+
+    def record(self, segment_index: int, thread_number: int, next_offset: int) -> bool:
+        """Record that a segment has been written up to (but not including) next_offset; returns
+        True if the thread should continue writing this segment (i.e. it still owns the segment,
+        and the segment hasn't been completed or shortened by another thread splitting it)
+
+        """
+        with self.lock:
+            if self.segment_owners.get(segment_index) != thread_number:
+                return False
+            segment = self.segments[segment_index]
+            next_offset = min(next_offset, segment[1] + 1)
+            self.unsaved_size += next_offset - segment[2]
+            segment[2] = next_offset
+            self.segment_progress_times[segment_index] = time.monotonic()
+            return segment[2] <= segment[1]
+
+    def downloaded_size(self) -> int:
+        """Return the total number of bytes written across all segments"""
+        with self.lock:
+            return sum(segment[2] - segment[0] for segment in self.segments)
+
+    def work_remaining(self) -> bool:
+        """Return True if any segment is still incomplete and hasn't failed"""
+        with self.lock:
+            return any(
+                segment[2] <= segment[1] and segment_index not in self.failed_segments
+                for segment_index, segment in enumerate(self.segments)
+            )
+
+    def is_complete(self) -> bool:
+        """Return True if every segment has been completely written"""
+        with self.lock:
+            return all(segment[2] > segment[1] for segment in self.segments)
+
+    def throughput_summary(self) -> typing.Optional[str]:
+        """Return a summary of per-segment throughput for segments completed in this session"""
+        with self.lock:
+            rates = sorted(
+                (segment_size / 1048576) / max(duration, 0.001)
+                for _, segment_size, duration in self.segment_stats
+                if segment_size > 0
+            )
+        if len(rates) == 0:
+            return None
+        return (
+            "{} segments downloaded; throughput per segment min {:.2f}MB/s, median {:.2f}MB/s, max"
+            " {:.2f}MB/s".format(len(rates), rates[0], rates[len(rates) // 2], rates[-1])
+        )
+
+
+def abort_response(response: requests.Response) -> None:
+    """Shut down the connection a streamed response is being read from, so that a read blocked in
+    another thread fails straight away rather than waiting for its read timeout
+
+    (Closing the response itself would wait for the blocked read, so the socket is shut down
+    instead - if it can't be reached, the read is left to time out)
+    """
+    try:
+        response.raw._fp.fp.raw._sock.shutdown(socket.SHUT_RDWR)  # type: ignore
+    except (AttributeError, OSError):
+        pass
+
+
+def get_url_host(url: str) -> str:
+    """Return the host name of a URL (or of a bare host name)"""
+    return urllib.parse.urlsplit(url if "//" in url else "//{}".format(url)).netloc.lower()
+
+
+def get_exception_host(exception: BaseException, url: str) -> str:
+    """Return the host that a requests exception occurred for (after any redirects, e.g. to an
+    Internet Archive datanode), falling back to the host of the requested URL
+
+    """
+    request = getattr(exception, "request", None)
+    if request is not None and getattr(request, "url", None):
+        return get_url_host(request.url)
+    return get_url_host(url)
+
+
+class RetryPolicy:
+    """Retry settings for file downloads, item metadata requests and searches: exponential backoff
+    with jitter (or the wait given by a Retry-After header on 429/503 responses), and a per-host
+    circuit breaker
+
+    After breaker_threshold consecutive failures for a host (e.g. a struggling datanode), the
+    breaker trips and requests to that host are paused for breaker_cooldown seconds, rather than
+    every download thread finding the problem on its own; the next success closes the breaker
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        initial_wait: float = 600,
+        backoff_factor: float = 2,
+        jitter: float = 0.1,
+        breaker_threshold: int = 3,
+        breaker_cooldown: float = 300,
+    ) -> None:
+        self.max_retries = max_retries
+        self.initial_wait = initial_wait
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.lock = threading.Lock()
+        self.host_failure_counts = {}  # type: typing.Dict[str, int]
+        self.host_paused_until = {}  # type: typing.Dict[str, float]
+
+    def wait_time(
+        self, retry_count: int, response: typing.Optional[requests.Response] = None
+    ) -> float:
+        """Return the number of seconds to wait before a retry, given the number of retries
+        already made (and the failed response, if there was one)
+
+        """
+        if response is not None and response.status_code in (429, 503):
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        wait_time = self.initial_wait * (self.backoff_factor**retry_count)
+        return wait_time * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def host_wait_time(self, host: str) -> float:
+        """Return the number of seconds until requests to a host are allowed again by the circuit
+        breaker (0 if they are allowed now)
+
+        """
+        with self.lock:
+            return max(self.host_paused_until.get(get_url_host(host), 0) - time.monotonic(), 0)
+
+    def wait_for_host(self, host: str) -> None:
+        """Block until requests to a host are allowed by the circuit breaker"""
+        log = logging.getLogger(__name__)
+        host_wait_time = self.host_wait_time(host)
+        if host_wait_time > 0:
+            log.info(
+                "Requests to '%s' are paused - waiting %s seconds", host, int(host_wait_time)
+            )
+            time.sleep(host_wait_time)
+
+    def record_success(self, host: str) -> None:
+        """Record a successful request to a host, closing its circuit breaker if it had tripped"""
+        log = logging.getLogger(__name__)
+        host = get_url_host(host)
+        with self.lock:
+            failure_count = self.host_failure_counts.pop(host, 0)
+            self.host_paused_until.pop(host, None)
+        if failure_count >= self.breaker_threshold:
+            log.info("Host '%s' has recovered - circuit breaker closed", host)
+
+    def record_failure(self, host: str) -> None:
+        """Record a failed request to a host, tripping its circuit breaker (pausing requests to the
+        host) if the host has failed breaker_threshold times in a row
+
+        """
+        log = logging.getLogger(__name__)
+        host = get_url_host(host)
+        with self.lock:
+            failure_count = self.host_failure_counts.get(host, 0) + 1
+            self.host_failure_counts[host] = failure_count
+            if failure_count < self.breaker_threshold:
+                return
+            now = time.monotonic()
+            # Don't extend an existing pause for failures of requests made before it began
+            if self.host_paused_until.get(host, 0) > now:
+                return
+            self.host_paused_until[host] = now + self.breaker_cooldown
+        log.warning(
+            (
+                "Host '%s' has failed %s times in a row - circuit breaker tripped; requests to this"
+                " host are paused for %s seconds"
+            ),
+            host,
+            failure_count,
+            int(self.breaker_cooldown),
+        )
+
+
+def parse_retry_after(value: typing.Optional[str]) -> typing.Optional[float]:
+    """Return the number of seconds given by a Retry-After header value (either a number of
+    seconds or an HTTP date), or None if it is missing or invalid
+
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_datetime = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_datetime is None:
+        return None
+    if retry_datetime.tzinfo is None:
+        retry_datetime = retry_datetime.replace(tzinfo=datetime.timezone.utc)
+    return max(
+        (retry_datetime - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0
+    )
+
+
+@dataclass
+class DownloadRetry:
+    """Retry state for a file download that failed because of a temporary server or connection
+    issue - rather than a download thread sleeping until the retry is due, the file is queued
+    again by the download function once due_time (a time.monotonic() value) has passed
+
+    """
+
+    due_time: float = 0.0
+    connection_retry_count: int = 0
+    size_retry_count: int = 0
+    # Host of the last failed request (e.g. a datanode), checked against the circuit breaker
+    host: typing.Optional[str] = None
+    # Hashes of the data downloaded so far, so that it doesn't need to be re-read on retry
+    inline_md5: typing.Optional[typing.Any] = None
+    inline_crc32: typing.Optional[int] = None
+    inline_hash_offset: int = 0
+
+    def defer(self, wait_time: float) -> "DownloadRetry":
+        """Schedule the download to be attempted again after wait_time seconds, without counting
+        this as a retry
+
+        """
+        self.due_time = time.monotonic() + wait_time
+        return self
+
+    def schedule_connection_retry(self, wait_time: float) -> "DownloadRetry":
+        """Schedule a retry after a connection error (or temporary server error)"""
+        self.connection_retry_count += 1
+        return self.defer(wait_time)
+
+    def schedule_size_retry(self, wait_time: float) -> "DownloadRetry":
+        """Schedule a retry after a 416 status or incomplete download"""
+        self.size_retry_count += 1
+        return self.defer(wait_time)
+
+
+def file_range_download(
+    range_details: typing.Tuple[
+        requests.Session,
+        str,
+        str,
+        str,
+        int,
+        SegmentScheduler,
+        typing.Optional[ConnectionBudget],
+        RetryPolicy,
+        typing.Optional[str],
+        typing.Optional[object],
+        typing.Optional[dict],
+    ]
+) -> bool:
+    """Called as separate threads from the file_download function when a file download is split;
+    repeatedly takes a segment of the file from the scheduler and downloads it, writing the data
+    at its offset in the partial file. Returns True if the thread stopped because of a temporary
+    server or connection issue (so the file download should be retried later if the other range
+    threads couldn't finish the file either)
+
+    A segment that fails with a temporary error is released back to the scheduler for any free
+    thread to continue; this thread retries with another segment after a connection error, but
+    stops after repeated errors or when the server asks for requests to be slowed down
+
+    The first range thread uses the connection already held by the file download; other range
+    threads are passed the connection budget, and only start once a connection is free for them
+    """
+    log = logging.getLogger(__name__)
+    (
+        session,
+        url,
+        part_file_path,
+        dest_file_name,
+        thread_number,
+        segment_scheduler,
+        connection_budget,
+        retry_policy,
+        task_id,
+        status_lock,
+        download_status,
+    ) = range_details
+    retry_flag = False
+    consecutive_failures = 0
+    # Hosts this thread's requests go to (including the datanode the download is redirected to)
+    request_hosts = {get_url_host(url)}
+    if connection_budget is not None:
+        # Give up waiting if the other range threads finish the file first
+        while not connection_budget.acquire(priority=True, timeout=1):
+            if not segment_scheduler.work_remaining():
+                return retry_flag
+    try:
+        with open(part_file_path, "r+b", buffering=0) as file_handler:
+            while True:
+                # If the circuit breaker has paused requests to the host, leave the remaining
+                # segments for the file download to be retried later
+                if any(retry_policy.host_wait_time(host) > 0 for host in request_hosts):
+                    return True
+                segment_index = segment_scheduler.acquire_segment(thread_number)
+                if segment_index is None:
+                    if segment_scheduler.wait_for_stall(thread_number):
+                        time.sleep(1)
+                        continue
+                    return retry_flag
+                segment_failed = False
+                stop_flag = False
+                while True:
+                    segment_position = segment_scheduler.segment_position(
+                        segment_index, thread_number
+                    )
+                    if segment_position is None:
+                        break
+                    lower_bytes_range, upper_bytes_range = segment_position
+                    try:
+                        response = session.get(
+                            url,
+                            headers={
+                                "Range": "bytes={}-{}".format(lower_bytes_range, upper_bytes_range)
+                            },
+                            auth=get_session_auth(session),
+                            timeout=12,
+                            stream=True,
+                        )
+                        if response.status_code != 206:
+                            response.close()
+                            if response.status_code in (429, 503):
+                                retry_policy.record_failure(response.url)
+                                log.info(
+                                    (
+                                        "%s status returned for segment %s of '%s' - the IA"
+                                        " server is temporarily unavailable"
+                                    ),
+                                    response.status_code,
+                                    segment_index,
+                                    dest_file_name,
+                                )
+                                retry_flag = True
+                                stop_flag = True
+                            elif response.status_code == 416:
+                                # Rather than waiting in this thread, leave the segment for
+                                # another thread, or the whole file download to be retried later
+                                log.info(
+                                    (
+                                        "416 status returned for segment %s of '%s' - indicating"
+                                        " that the IA server cannot proceed with the download at"
+                                        " this time"
+                                    ),
+                                    segment_index,
+                                    dest_file_name,
+                                )
+                                retry_flag = True
+                                stop_flag = True
+                            else:
+                                log.warning(
+                                    "Unexpected status code %s returned for segment %s of '%s'",
+                                    response.status_code,
+                                    segment_index,
+                                    dest_file_name,
+                                )
+                                segment_failed = True
+                            break
+                        retry_policy.record_success(response.url)
+                        consecutive_failures = 0
+                        segment_scheduler.set_response(segment_index, thread_number, response)
+                        request_hosts.add(get_url_host(response.url))
+                        offset = lower_bytes_range
+                        for download_chunk in response.iter_content(chunk_size=1000000):
+                            if download_chunk:
+                                # Never write beyond the end of the requested range
+                                download_chunk = download_chunk[: upper_bytes_range - offset + 1]
+                                write_at_offset(file_handler, download_chunk, offset)
+                                offset += len(download_chunk)
+                                segment_scheduler.set_throttled(segment_index, thread_number, True)
+                                try:
+                                    bandwidth_limiter.consume(len(download_chunk))
+                                finally:
+                                    segment_scheduler.set_throttled(
+                                        segment_index, thread_number, False
+                                    )
+                                continue_flag = segment_scheduler.record(
+                                    segment_index, thread_number, offset
+                                )
+                                if segment_scheduler.save_due():
+                                    # Make sure data is on disk before the progress map says it is
+                                    os.fsync(file_handler.fileno())
+                                    segment_scheduler.save()
+                                if task_id and status_lock and download_status:
+                                    downloaded_size = segment_scheduler.downloaded_size()
+                                    with status_lock:
+                                        download_status[task_id]['progress']['current_file_progress'] = downloaded_size
+                                # Stop if the segment is complete, has been shortened by another
+                                # thread taking over its second half, or has been reassigned
+                                if not continue_flag:
+                                    response.close()
+                                    break
+                    except (
+                        requests.exceptions.ConnectionError,
+                        requests.exceptions.ReadTimeout,
+                        requests.exceptions.ChunkedEncodingError,
+                        ConnectionError,
+                    ) as exception:
+                        if not segment_scheduler.owns_segment(segment_index, thread_number):
+                            # The segment stalled and was taken over by another thread, which
+                            # aborted this connection - not a failure of the host
+                            log.debug(
+                                "'%s' - connection for segment %s was aborted after it stalled",
+                                dest_file_name,
+                                segment_index,
+                            )
+                            break
+                        retry_policy.record_failure(get_exception_host(exception, url))
+                        log.info(
+                            "ConnectionError/ReadTimeout occurred for segment %s of '%s'",
+                            segment_index,
+                            dest_file_name,
+                        )
+                        retry_flag = True
+                        consecutive_failures += 1
+                        stop_flag = (
+                            consecutive_failures >= SegmentScheduler.max_consecutive_failures
+                        )
+                        break
+                segment_stats = segment_scheduler.release_segment(
+                    segment_index, thread_number, segment_failed
+                )
+                if segment_stats is not None:
+                    log.debug(
+                        "'%s' - segment %s (%s) downloaded in %.1f seconds (%.2fMB/s)",
+                        dest_file_name,
+                        segment_index,
+                        bytes_filesize_to_readable_str(segment_stats[0]),
+                        segment_stats[1],
+                        (segment_stats[0] / 1048576) / max(segment_stats[1], 0.001),
+                    )
+                if segment_failed or stop_flag:
+                    return retry_flag
+    finally:
+        if connection_budget is not None:
+            connection_budget.release()
+
+
 def file_download(
     download_details: typing.Tuple[
         str,
         str,
         int,
         str,
+        str,
         int,
         str,
         typing.Optional[multiprocessing.pool.Pool],
         bool,
         int,
-        typing.Optional[typing.Tuple[int, int]],
-        typing.Optional[int],
         typing.Optional[str],
         typing.Optional[object],
         typing.Optional[dict],
-    ]
-) -> None:
-    """Called as separate threads from the download function; takes one of the files to be
-    downloaded from the download_queue and downloads, with subsequent (optional) MD5 hash
-    verification
-
+        requests.Session,
+        RetryPolicy,
+        typing.Optional[MetadataStore],
+        ConnectionBudget,
+    ],
+    retry: typing.Optional[DownloadRetry] = None,
+) -> typing.Optional[DownloadRetry]:
+    """Called as separate threads from the download function (via budgeted_file_download, so one
+    connection from the budget is held); takes one of the files to be downloaded from the
+    download_queue and downloads, with subsequent (optional) MD5 hash verification
+
+    If the download fails because of a temporary issue, returns a DownloadRetry (to be passed
+    back in when the file is downloaded again once the retry is due)
     """
     log = logging.getLogger(__name__)
     (
@@ -405,30 +2505,55 @@ def file_download(
         ia_file_name,
         ia_file_size,
         ia_md5,
+        ia_crc32,
         ia_mtime,
         output_folder,
         hash_pool,
         resume_flag,
         split_count,
-        bytes_range,
-        chunk_number,
         task_id,
         status_lock,
         download_status,
+        session,
+        retry_policy,
+        metadata_store,
+        connection_budget,
     ) = download_details
+    retrying_flag = retry is not None
+    if retry is None:
+        retry = DownloadRetry()
     start_time = datetime.datetime.now()
     file_size_split_limit = 10485760  # 10MB
     dest_file_path = os.path.join(os.path.join(output_folder, identifier), ia_file_name)
     dest_file_name = ia_file_name
     expected_file_size = ia_file_size
-    # If our thread is part of a file split, update expectations on file paths/names and sizes
-    if bytes_range is not None and chunk_number is not None:
-        dest_file_path += ".{}".format(chunk_number)
-        dest_file_name = os.path.basename(dest_file_path)
-        expected_file_size = bytes_range[1] - bytes_range[0] + 1
+    # If user has opted to verify downloads, the MD5 hash is calculated as data is written (rather
+    # than re-reading the file from disk afterwards); split downloads are hashed by the hash_pool
+    # once complete. Don't hash the [identifier]_files.xml file, as this regularly gives false
+    # positives (see README Known Issues)
+    hash_inline = hash_pool is not None and dest_file_name != "{}_files.xml".format(identifier)
+    inline_md5 = retry.inline_md5
+    inline_crc32 = retry.inline_crc32
+    inline_hash_offset = retry.inline_hash_offset
+    # When resuming is enabled, the running CRC32 is periodically checkpointed alongside the
+    # partially downloaded file, so a later resume (e.g. after the script is restarted) can
+    # continue hashing from the checkpoint rather than re-reading the whole prefix
+    hash_checkpoint_flag = hash_inline and resume_flag
+    hash_checkpoint_interval = 67108864  # 64MB
+
+    def record_completed_file(md5_status: typing.Optional[str] = None) -> None:
+        """Record the file in the completion journal, so later runs can skip the item"""
+        if metadata_store is None:
+            return
+        try:
+            metadata_store.put_completed_file(
+                dest_file_path, identifier, os.stat(dest_file_path), md5_status
+            )
+        except (OSError, sqlite3.Error) as exception:
+            log.debug("'%s' could not be recorded as completed: %s", dest_file_path, exception)
     
     # Update progress to show current file
-    if task_id and status_lock and download_status and chunk_number is None:
+    if task_id and status_lock and download_status:
         with status_lock:
             download_status[task_id]['progress']['current_file'] = ia_file_name
             download_status[task_id]['progress']['current_file_size'] = expected_file_size
@@ -454,6 +2579,15 @@ def file_download(
                 if task_id and status_lock and download_status:
                     with status_lock:
                         download_status[task_id]['progress']['completed_files'] += 1
+                record_completed_file()
+                # Files that were already present haven't been streamed through an inline hash, so
+                # are hashed separately by the hash_pool
+                if hash_inline:
+                    if hash_checkpoint_flag:
+                        remove_hash_checkpoint(dest_file_path)
+                    check_hash_in_pool(
+                        dest_file_path, ia_md5, hash_pool, metadata_store  # type: ignore
+                    )
                 return
             else:
                 if initial_file_size < expected_file_size:
@@ -468,7 +2602,7 @@ def file_download(
                             (1 - (initial_file_size / expected_file_size)) * 100,
                         )
                         # Update progress with initial file size for resumed downloads
-                        if task_id and status_lock and download_status and chunk_number is None:
+                        if task_id and status_lock and download_status:
                             with status_lock:
                                 download_status[task_id]['progress']['current_file_progress'] = initial_file_size
 
@@ -503,38 +2637,99 @@ def file_download(
                 dest_file_path,
             )
 
+    # If the circuit breaker has paused requests to Internet Archive (or to the datanode that this
+    # file's last attempt failed on), come back to the file once the pause is over - this isn't
+    # counted as a retry
+    host_wait_time = max(
+        retry_policy.host_wait_time(host) for host in [session.host, retry.host] if host
+    )
+    if host_wait_time > 0:
+        log.debug(
+            "'%s' - requests to host are paused; download will be attempted in %s seconds",
+            dest_file_name,
+            int(host_wait_time),
+        )
+        return retry.defer(host_wait_time)
+
     # If this thread is expected to create new threads for split file downloading, first need to
     # check that the web server returns a 206 status code with a 'Range' request, indicating the
     # requested can be split
-    if split_count > 1 and ia_file_size > file_size_split_limit:
-        response_list = internetarchive.download(
-            identifier,
-            files=[ia_file_name],  # type: ignore
-            destdir=output_folder,
-            on_the_fly=True,
-            return_responses=True,
-        )
-        if isinstance(response_list[0], requests.Response):
-            thread_test_response = response_list[0]  # type: requests.Response
-            thread_test_request = thread_test_response.request  # type: requests.PreparedRequest
-            headers = thread_test_request.headers
+    # (a partially downloaded file from a previous non-split download will be resumed as-is)
+    if (
+        split_count > 1
+        and ia_file_size > file_size_split_limit
+        and not (resume_flag and initial_file_size > 0)
+    ):
+        try:
             # We're just testing this connection, so don't need the whole byte range
-            headers["Range"] = "bytes={}-{}".format(0, 10)
-
-            if thread_test_request.url is not None:
-                new_response = requests.get(
-                    thread_test_request.url, headers=headers, timeout=12, stream=True
+            new_response = session.get(
+                get_file_download_url(session, identifier, ia_file_name),
+                headers={"Range": "bytes={}-{}".format(0, 10)},
+                auth=get_session_auth(session),
+                timeout=12,
+                stream=True,
+            )
+            if new_response.status_code == 206:
+                # Read the (tiny) body so the connection is released back to the pool
+                new_response.content  # pylint: disable=pointless-statement
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ReadTimeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as exception:
+            retry_policy.record_failure(get_exception_host(exception, session.host))
+            log.info(
+                (
+                    "'%s' - ConnectionError/ReadTimeout occurred when testing file splitting -"
+                    " download will be attempted without splitting"
+                ),
+                ia_file_name,
+            )
+            split_count = 1
+        else:
+            if new_response.status_code == 206:
+                retry_policy.record_success(new_response.url)
+                log.debug(
+                    (
+                        "'%s' - returns a 206 status when requesting a Range - can therefore split"
+                        " download"
+                    ),
+                    ia_file_name,
                 )
-
-                if new_response.status_code == 206:
-                    log.debug(
+            else:
+                # Don't read the body here - a 200 status would mean reading the entire file
+                new_response.close()
+                if new_response.status_code in (429, 503):
+                    retry_policy.record_failure(new_response.url)
+                    retry.host = get_url_host(new_response.url)
+                    if retry.connection_retry_count < retry_policy.max_retries:
+                        # Honours any Retry-After header sent with the response
+                        wait_time = retry_policy.wait_time(
+                            retry.connection_retry_count, new_response
+                        )
+                        log.info(
+                            (
+                                "'%s' - %s status returned when testing file splitting - the IA"
+                                " server is temporarily unavailable - will retry in %s minutes"
+                                " (will retry %s more times)"
+                            ),
+                            ia_file_name,
+                            new_response.status_code,
+                            int(wait_time / 60),
+                            retry_policy.max_retries - retry.connection_retry_count,
+                        )
+                        return retry.schedule_connection_retry(wait_time)
+                    log.warning(
                         (
-                            "'%s' - returns a 206 status when requesting a Range - can therefore"
-                            " split download"
+                            "Persistent %s statuses returned for IA file '%s' (being downloaded as"
+                            " file '%s') - download not completed"
                         ),
+                        new_response.status_code,
                         ia_file_name,
+                        dest_file_name,
                     )
-                elif new_response.status_code == 200:
+                    return
+                if new_response.status_code == 200:
                     log.debug(
                         (
                             "'%s' - returns a 200 status when requesting a Range - download will"
@@ -542,7 +2737,6 @@ def file_download(
                         ),
                         ia_file_name,
                     )
-                    split_count = 1
                 else:
                     log.info(
                         (
@@ -552,439 +2746,442 @@ def file_download(
                         ia_file_name,
                         new_response.status_code,
                     )
-                    split_count = 1
-            else:
-                log.info(
-                    "Unexpected response data returned from internetarchive package; download will"
-                    " not be split"
-                )
                 split_count = 1
-        else:
-            log.info(
-                "Unexpected response data returned from internetarchive package; download will not"
-                " be split"
-            )
-            split_count = 1
-
-    # Perform file download splitting
-    if split_count > 1 and ia_file_size > file_size_split_limit:
-        download_queue = []
-        chunk_sizes = {}
 
-        # Create byte ranges that will be used in each chunk thread, and create the download_queue
-        # the thread pool will take download from
-        for chunk_counter in range(split_count):
-            if chunk_counter == 0:
-                lower_bytes_range = 0
-            else:
-                lower_bytes_range = ((ia_file_size // split_count) * chunk_counter) + 1
-            if chunk_counter == split_count - 1:  # For the last chunk, make sure we get everything
-                upper_bytes_range = ia_file_size - 1
-            else:
-                upper_bytes_range = (ia_file_size // split_count) * (chunk_counter + 1)
-
-            download_queue.append(
-                (
-                    identifier,
-                    ia_file_name,
-                    ia_file_size,
-                    ia_md5,
-                    ia_mtime,
-                    output_folder,
-                    hash_pool,
-                    resume_flag,
-                    1,  # split_count
-                    (lower_bytes_range, upper_bytes_range),
-                    chunk_counter,
-                    task_id,  # task_id for progress tracking
-                    status_lock,  # status_lock for thread-safe updates
-                    download_status  # download_status for updates
+    # Perform file download splitting - each range thread writes its part of the file directly
+    # into a single preallocated partial file (so no chunk files need to be merged afterwards),
+    # and a progress map records which data has been written so the download can be resumed.
+    # split_count is the most connections the file may use; the first range thread uses this
+    # file's connection, and the others join as further connections in the budget become free
+    if (
+        split_count > 1
+        and ia_file_size > file_size_split_limit
+        and not (resume_flag and initial_file_size > 0)
+    ):
+        part_file_path = "{}.part".format(dest_file_path)
+        progress_file_path = "{}.progress".format(part_file_path)
+        segment_scheduler = None
+        # The partial file is always continued when retrying within this run
+        if (resume_flag or retrying_flag) and os.path.isfile(part_file_path):
+            segment_scheduler = SegmentScheduler.load(
+                progress_file_path, part_file_path, ia_file_size, ia_md5
+            )
+            if segment_scheduler is not None:
+                log.info(
+                    (
+                        "'%s' - partially downloaded split file '%s' will be resumed (%.1f%%"
+                        " remaining)"
+                    ),
+                    dest_file_name,
+                    part_file_path,
+                    (1 - (segment_scheduler.downloaded_size() / ia_file_size)) * 100,
                 )
+        if segment_scheduler is None:
+            pathlib.Path(os.path.dirname(dest_file_path)).mkdir(parents=True, exist_ok=True)
+            preallocate_file(part_file_path, ia_file_size)
+            segment_scheduler = SegmentScheduler.create(
+                progress_file_path, ia_file_size, ia_md5, split_count
             )
-            chunk_sizes[chunk_counter] = upper_bytes_range - lower_bytes_range + 1
+            segment_scheduler.save()
 
+        url = get_file_download_url(session, identifier, ia_file_name)
+        download_queue = [
+            (
+                session,
+                url,
+                part_file_path,
+                dest_file_name,
+                thread_number,
+                segment_scheduler,
+                connection_budget if thread_number > 0 else None,
+                retry_policy,
+                task_id,
+                status_lock,
+                download_status,
+            )
+            for thread_number in range(split_count)
+        ]
+
+        log.info("%s'%s'%s - beginning download", bold_grey, dest_file_name, blue)
         with multiprocessing.pool.ThreadPool(split_count) as download_pool:
-            # Chunksize 1 used to ensure downloads occur in filename order
-            log.info("'%s' - will be downloaded in %s parts", ia_file_name, split_count)
-            download_pool.map(file_download, download_queue, chunksize=1)
+            log.info(
+                "'%s' - will be downloaded in %s parts (using up to %s connections)",
+                ia_file_name,
+                len(segment_scheduler.segments),
+                split_count,
+            )
+            retry_flags = download_pool.map(file_range_download, download_queue, chunksize=1)
             download_pool.close()
             download_pool.join()
-
-        # When file chunk downloads have finished in above thread pool, check the chunks are the
-        # expected size
-        failed_indicator = False
-        for chunk_counter in range(split_count):
-            chunk_file_path = "{}.{}".format(dest_file_path, chunk_counter)
-
-            if not os.path.isfile(chunk_file_path):
-                log.warning(
-                    "'%s' - chunk %s (sub-file '%s') cannot be found",
-                    ia_file_name,
-                    chunk_counter,
-                    chunk_file_path,
+        segment_scheduler.save()
+        throughput_summary = segment_scheduler.throughput_summary()
+        if throughput_summary is not None:
+            log.debug("'%s' - %s", ia_file_name, throughput_summary)
+
+        if not segment_scheduler.is_complete():
+            if any(retry_flags) and retry.connection_retry_count < retry_policy.max_retries:
+                wait_time = max(
+                    retry_policy.wait_time(retry.connection_retry_count),
+                    retry_policy.host_wait_time(session.host),
                 )
-                failed_indicator = True
-            elif os.path.getsize(chunk_file_path) != chunk_sizes[chunk_counter]:
-                log.warning(
+                log.info(
                     (
-                        "'%s' - chunk %s (sub-file '%s') is not the expected size (expected size"
-                        " %s, actual size %s)"
+                        "'%s' - not all parts of the file could be downloaded due to a temporary"
+                        " server or connection issue - will retry in %s minutes (will retry %s"
+                        " more times)"
                     ),
                     ia_file_name,
-                    chunk_counter,
-                    chunk_file_path,
-                    chunk_sizes[chunk_counter],
-                    os.path.getsize(chunk_file_path),
+                    int(wait_time / 60),
+                    retry_policy.max_retries - retry.connection_retry_count,
                 )
-                failed_indicator = True
-
-        if failed_indicator:
+                return retry.schedule_connection_retry(wait_time)
             log.warning(
                 (
-                    "'%s' - error occurred with file chunks - file could not be reconstructed"
-                    " and has therefore not been downloaded successfully"
+                    "'%s' - not all parts of the file could be downloaded - file has therefore not"
+                    " been downloaded successfully%s"
                 ),
                 ia_file_name,
+                " (download can be resumed using the '-r' flag)" if resume_flag else "",
             )
-        else:
-            # Merge the chunks into the final file and delete each chunk as we go
-            block_size = 4096 * 1024
-            with open(dest_file_path, "wb") as output_file_handler:
-                for chunk_counter in range(split_count):
-                    chunk_file_path = "{}.{}".format(dest_file_path, chunk_counter)
-                    with open(chunk_file_path, "rb") as input_file_handler:
-                        while True:
-                            data = input_file_handler.read(block_size)
-                            if not data:
-                                break
-                            output_file_handler.write(data)
-                    os.remove(chunk_file_path)
+            return
+        os.replace(part_file_path, dest_file_path)
+        os.remove(progress_file_path)
+        try:
+            if ia_mtime != -1:  # -1 denotes that IA metadata does not contain mtime info
+                os.utime(dest_file_path, (0, ia_mtime))
+        except OSError:
+            pass
     else:
         # In testing, downloads can timeout occasionally with requests.exceptions.ConnectionError
-        # raised; catch and attempt download five times before giving up
-        connection_retry_counter = 0
-        size_retry_counter = 0
-        MAX_RETRIES = 5
-        connection_wait_timer = 600
-        size_wait_timer = 600
-        while True:
-            try:
-                if not resume_flag and chunk_number is None:
-                    log.info("%s'%s'%s - beginning download", bold_grey, dest_file_name, blue)
-                    while True:
-                        try:
-                            internetarchive.download(
-                                identifier,
-                                files=[ia_file_name],  # type: ignore
-                                destdir=output_folder,
-                                on_the_fly=True,
-                            )
-                            break
-                        except requests.exceptions.HTTPError as http_error:
-                            status_code = http_error.response.status_code
-                            if status_code == 403:
-                                log.warning(
-                                    (
-                                        "'%s' - 403 Forbidden error occurred - an account login may"
-                                        " be required to access this file (account details can be"
-                                        " passed using the '-c' flag) - note that download may not"
-                                        " be possible even when logged in, if the file is within a"
-                                        " restricted access item (e.g. books in the lending program"
-                                        " or 'stream only' videos)"
-                                    ),
-                                    ia_file_name,
-                                )
-                            else:
-                                log.warning(
-                                    "'%s' - %s error status returned when attempting download",
-                                    ia_file_name,
-                                    status_code,
-                                )
-                            return
-                        except FileExistsError:
-                            log.debug(
-                                (
-                                    "FileExistsError for '%s' occurred - this seems to happen"
-                                    " occasionally on Windows and Ubuntu, but a retry seems to fix"
-                                ),
-                                ia_file_name,
-                            )
-                            time.sleep(2)
-                else:
-                    partial_file_size = 0
-                    if os.path.isfile(dest_file_path):
-                        if ia_file_size == -1 or not resume_flag:
-                            # If we don't have size metadata from IA (i.e. if file_size == -1), then
-                            # perform a full re-download. (Although we could run a hash check
-                            # instead, in testing it seems that any IA file that lacks size metadata
-                            # will also give different hash values per download - so would be
-                            # wasting time to calc hash as there'll always be a mismatch requiring
-                            # a full re-download)
-                            log.info(
-                                "%s'%s'%s - beginning re-download", bold_grey, dest_file_name, blue
-                            )
-                            file_write_mode = "wb"
-                        elif resume_flag:
-                            log.info(
-                                "%s'%s'%s - resuming download", bold_grey, dest_file_name, blue
-                            )
-                            file_write_mode = "ab"
-                            partial_file_size = os.path.getsize(dest_file_path)
-                    else:
-                        log.info("%s'%s'%s - beginning download", bold_grey, dest_file_name, blue)
-                        file_write_mode = "wb"
-                        pathlib.Path(os.path.dirname(dest_file_path)).mkdir(
-                            parents=True, exist_ok=True
-                        )
-
-                    # If we're wanting to be able to resume file transfers, we will use the
-                    # internetarchive.download function to just return the PreparedResponse object
-                    # with which we can make a new Request
-                    # (We are doing this as internetarchive.download will otherwise delete a
-                    # partially-downloaded file if a ConnectionError occurs, meaning we would have
-                    # nothing left to try and resume)
-                    try:
-                        response_list = internetarchive.download(
-                            identifier,
-                            files=[ia_file_name],  # type: ignore
-                            destdir=output_folder,
-                            on_the_fly=True,
-                            return_responses=True,
-                        )
-                    except requests.exceptions.HTTPError as http_error:
-                        status_code = http_error.response.status_code
-                        if status_code == 403:
-                            log.warning(
-                                (
-                                    "'%s' - 403 Forbidden error occurred - an account login may be"
-                                    " required to access this file (account details can be passed"
-                                    " using the '-c' flag) - note that download may not be possible"
-                                    " even when logged in, if the file is within a restricted"
-                                    " access item (e.g. books in the lending program)"
-                                ),
-                                ia_file_name,
-                            )
-                        else:
-                            log.warning(
-                                "'%s' - %s error status returned", ia_file_name, status_code
-                            )
-                        return
-                    if not isinstance(response_list[0], requests.Response):
-                        raise ConnectionError(response_list[0])  # This should be an error message
-                    response = response_list[0]  # type: requests.Response
-                    request = response.request  # type: requests.PreparedRequest
-                    headers = request.headers
-
-                    updated_bytes_range = None
-                    if file_write_mode == "ab":
-                        # If we don't have bytes_range, this download isn't a file chunk, so just
-                        # download all the remaining file data
-                        if bytes_range is None:
-                            updated_bytes_range = (partial_file_size, ia_file_size - 1)
-                        # Otherwise, this is a file chunk, so only download up to the final amount
-                        # needed for this chunk
-                        else:
-                            lower_bytes_range = bytes_range[0] + partial_file_size
-                            updated_bytes_range = (lower_bytes_range, bytes_range[1])
-                    elif bytes_range is not None:
-                        updated_bytes_range = bytes_range
-
-                    # Set the bytes range if we're either resuming a download or downloading a file
-                    # chunk
-                    if updated_bytes_range is not None:
-                        headers["Range"] = "bytes={}-{}".format(
-                            updated_bytes_range[0], updated_bytes_range[1]
-                        )
+        # raised; rather than this thread waiting to retry, the download is handed back to the
+        # download function to be queued again later (up to five times before giving up)
+        try:
+            partial_file_size = 0
+            if os.path.isfile(dest_file_path):
+                if ia_file_size == -1 or not resume_flag:
+                    # If we don't have size metadata from IA (i.e. if file_size == -1), then
+                    # perform a full re-download. (Although we could run a hash check
+                    # instead, in testing it seems that any IA file that lacks size metadata
+                    # will also give different hash values per download - so would be
+                    # wasting time to calc hash as there'll always be a mismatch requiring
+                    # a full re-download)
+                    log.info("%s'%s'%s - beginning re-download", bold_grey, dest_file_name, blue)
+                    file_write_mode = "wb"
+                elif resume_flag:
+                    log.info("%s'%s'%s - resuming download", bold_grey, dest_file_name, blue)
+                    file_write_mode = "ab"
+                    partial_file_size = os.path.getsize(dest_file_path)
+            else:
+                log.info("%s'%s'%s - beginning download", bold_grey, dest_file_name, blue)
+                file_write_mode = "wb"
+                pathlib.Path(os.path.dirname(dest_file_path)).mkdir(parents=True, exist_ok=True)
+
+            updated_bytes_range = None
+            if file_write_mode == "ab":
+                # Download all the remaining file data
+                updated_bytes_range = (partial_file_size, ia_file_size - 1)
+
+            if hash_inline:
+                if file_write_mode == "wb":
+                    inline_md5 = hashlib.md5()
+                    inline_crc32 = 0
+                    inline_hash_offset = 0
+                    if hash_checkpoint_flag:
+                        remove_hash_checkpoint(dest_file_path)
+                elif inline_crc32 is None or inline_hash_offset != partial_file_size:
+                    hash_checkpoint = None
+                    if hash_checkpoint_flag and ia_crc32:
+                        hash_checkpoint = read_hash_checkpoint(dest_file_path, ia_md5)
+                    if hash_checkpoint is not None:
+                        # Continue the checkpointed CRC32 (only reading any data written
+                        # after the checkpoint was made); the MD5 can't be recovered without
+                        # reading the prefix, so the completed file is verified by its CRC32
+                        inline_md5 = None
+                        inline_hash_offset, inline_crc32 = hash_checkpoint
                         log.debug(
-                            "'%s' - range to be requested (being downloaded as file '%s') is %s-%s",
-                            ia_file_name,
+                            "'%s' - resuming hash from checkpoint at byte %s",
                             dest_file_name,
-                            updated_bytes_range[0],
-                            updated_bytes_range[1],
-                        )
-
-                    if request.url is not None:
-                        new_response = requests.get(
-                            request.url, headers=headers, timeout=12, stream=True
+                            inline_hash_offset,
                         )
                     else:
-                        log.warning(
-                            "Unexpected response data returned from internetarchive package;"
-                            " download not completed"
+                        # Hash the already-downloaded prefix once
+                        inline_md5 = hashlib.md5()
+                        inline_crc32 = 0
+                        inline_hash_offset = 0
+                    if inline_hash_offset < partial_file_size:
+                        inline_crc32 = hash_file_from_offset(
+                            dest_file_path, inline_hash_offset, inline_md5, inline_crc32
                         )
-                        return
+                        inline_hash_offset = partial_file_size
+                # Otherwise the hashes from the previous attempt in this thread already cover
+                # the partially downloaded data; subsequent data will be added to the hashes as
+                # it's written
+
+            # Set the bytes range if we're resuming a download
+            headers = {}
+            if updated_bytes_range is not None:
+                headers["Range"] = "bytes={}-{}".format(
+                    updated_bytes_range[0], updated_bytes_range[1]
+                )
+                log.debug(
+                    "'%s' - range to be requested (being downloaded as file '%s') is %s-%s",
+                    ia_file_name,
+                    dest_file_name,
+                    updated_bytes_range[0],
+                    updated_bytes_range[1],
+                )
 
-                    log.debug(
-                        "'%s' - %s status for request (being downloaded as file '%s')",
-                        ia_file_name,
-                        new_response.status_code,
-                        dest_file_name,
-                    )
+            # The download URL is built directly from the item metadata (rather than asking
+            # the internetarchive package to prepare a request, which re-fetches the whole
+            # item's metadata on every call), so only one request is made per byte range
+            new_response = session.get(
+                get_file_download_url(session, identifier, ia_file_name),
+                headers=headers,
+                auth=get_session_auth(session),
+                timeout=12,
+                stream=True,
+            )
 
-                    if new_response.status_code == 200 or new_response.status_code == 206:
-                        file_download_write_block_size = 1000000
-                        with open(dest_file_path, file_write_mode) as file_handler:
-                            downloaded_size = partial_file_size
-                            for download_chunk in new_response.iter_content(
-                                chunk_size=file_download_write_block_size
-                            ):
-                                if download_chunk:
-                                    file_handler.write(download_chunk)
-                                    downloaded_size += len(download_chunk)
-                                    
-                                    # Update progress
-                                    if task_id and status_lock and download_status and chunk_number is None:
-                                        with status_lock:
-                                            download_status[task_id]['progress']['current_file_progress'] = downloaded_size
-
-                        try:
-                            if (
-                                ia_mtime != -1
-                            ):  # -1 denotes that IA metadata does not contain mtime info
-                                os.utime(dest_file_path, (0, ia_mtime))
-                        except OSError:
-                            # Probably file-like object, e.g. sys.stdout.
-                            pass
-                    elif new_response.status_code == 416:
-                        if os.path.isfile(dest_file_path):
-                            if does_file_have_416_issue(dest_file_path):
-                                log.info(
-                                    (
-                                        "416 error message has been embedded in partially"
-                                        " downloaded file '%s', causing file corruption; the"
-                                        " partially downloaded file will be deleted"
-                                    ),
-                                    dest_file_name,
-                                )
-                                os.remove(dest_file_path)
-                        if size_retry_counter < MAX_RETRIES:
-                            log.info(
-                                (
-                                    "416 status returned for request for IA file '%s' (being"
-                                    " downloaded as file '%s') - indicating that the IA server"
-                                    " cannot proceed with resumed download at this time - waiting"
-                                    " %s minutes before retrying (will retry %s more times)"
-                                ),
-                                ia_file_name,
-                                dest_file_name,
-                                int(size_wait_timer / 60),
-                                MAX_RETRIES - size_retry_counter,
-                            )
+            log.debug(
+                "'%s' - %s status for request (being downloaded as file '%s')",
+                ia_file_name,
+                new_response.status_code,
+                dest_file_name,
+            )
 
-                            time.sleep(size_wait_timer)
-                            size_retry_counter += 1
-                            size_wait_timer *= (
-                                2  # Add some delay for each retry in case connection issue is
-                                # ongoing
-                            )
-                            continue
-                        log.warning(
-                            (
-                                "Persistent 416 statuses returned for IA file '%s' (being"
-                                " downloaded as file '%s') - server may be having temporary issues;"
-                                " download not completed"
-                            ),
-                            ia_file_name,
-                            dest_file_name,
-                        )
-                        return
-                    else:
-                        log.warning(
+            if new_response.status_code == 200 or new_response.status_code == 206:
+                retry_policy.record_success(new_response.url)
+                file_download_write_block_size = 1000000
+                with open(dest_file_path, file_write_mode) as file_handler:
+                    downloaded_size = partial_file_size
+                    hash_checkpoint_offset = inline_hash_offset
+                    for download_chunk in new_response.iter_content(
+                        chunk_size=file_download_write_block_size
+                    ):
+                        if download_chunk:
+                            file_handler.write(download_chunk)
+                            downloaded_size += len(download_chunk)
+                            bandwidth_limiter.consume(len(download_chunk))
+                            if inline_crc32 is not None:
+                                if inline_md5 is not None:
+                                    inline_md5.update(download_chunk)
+                                inline_crc32 = zlib.crc32(download_chunk, inline_crc32)
+                                inline_hash_offset += len(download_chunk)
+                                if (
+                                    hash_checkpoint_flag
+                                    and inline_hash_offset - hash_checkpoint_offset
+                                    >= hash_checkpoint_interval
+                                ):
+                                    # Flush first, so the checkpoint never covers more data
+                                    # than has been written to the file
+                                    file_handler.flush()
+                                    write_hash_checkpoint(
+                                        dest_file_path, inline_hash_offset, inline_crc32, ia_md5
+                                    )
+                                    hash_checkpoint_offset = inline_hash_offset
+                                
+                            # Update progress
+                            if task_id and status_lock and download_status:
+                                with status_lock:
+                                    download_status[task_id]['progress']['current_file_progress'] = downloaded_size
+
+                try:
+                    if (
+                        ia_mtime != -1
+                    ):  # -1 denotes that IA metadata does not contain mtime info
+                        os.utime(dest_file_path, (0, ia_mtime))
+                except OSError:
+                    # Probably file-like object, e.g. sys.stdout.
+                    pass
+            elif new_response.status_code == 403:
+                new_response.close()
+                log.warning(
+                    (
+                        "'%s' - 403 Forbidden error occurred - an account login may be required"
+                        " to access this file (account details can be passed using the '-c'"
+                        " flag) - note that download may not be possible even when logged in,"
+                        " if the file is within a restricted access item (e.g. books in the"
+                        " lending program or 'stream only' videos)"
+                    ),
+                    ia_file_name,
+                )
+                return
+            elif new_response.status_code == 416:
+                new_response.close()
+                if os.path.isfile(dest_file_path):
+                    if does_file_have_416_issue(dest_file_path):
+                        log.info(
                             (
-                                "Unexpected status code %s returned for IA file '%s' (being"
-                                " downloaded as file '%s') - download not completed"
+                                "416 error message has been embedded in partially"
+                                " downloaded file '%s', causing file corruption; the"
+                                " partially downloaded file will be deleted"
                             ),
-                            new_response.status_code,
-                            ia_file_name,
                             dest_file_name,
                         )
-                        return
-
-            except (
-                requests.exceptions.ConnectionError,
-                requests.exceptions.ReadTimeout,
-                ConnectionError,
-            ):
-                if connection_retry_counter < MAX_RETRIES:
+                        os.remove(dest_file_path)
+                        if hash_checkpoint_flag:
+                            remove_hash_checkpoint(dest_file_path)
+                if retry.size_retry_count < retry_policy.max_retries:
+                    wait_time = retry_policy.wait_time(retry.size_retry_count)
+                    log.info(
+                        (
+                            "416 status returned for request for IA file '%s' (being"
+                            " downloaded as file '%s') - indicating that the IA server"
+                            " cannot proceed with resumed download at this time - will retry"
+                            " in %s minutes (will retry %s more times)"
+                        ),
+                        ia_file_name,
+                        dest_file_name,
+                        int(wait_time / 60),
+                        retry_policy.max_retries - retry.size_retry_count,
+                    )
+                    return retry.schedule_size_retry(wait_time)
+                log.warning(
+                    (
+                        "Persistent 416 statuses returned for IA file '%s' (being"
+                        " downloaded as file '%s') - server may be having temporary issues;"
+                        " download not completed"
+                    ),
+                    ia_file_name,
+                    dest_file_name,
+                )
+                return
+            elif new_response.status_code in (429, 503):
+                new_response.close()
+                retry_policy.record_failure(new_response.url)
+                retry.host = get_url_host(new_response.url)
+                if retry.connection_retry_count < retry_policy.max_retries:
+                    # Honours any Retry-After header sent with the response
+                    wait_time = retry_policy.wait_time(retry.connection_retry_count, new_response)
                     log.info(
                         (
-                            "ConnectionError/ReadTimeout occurred for '%s', waiting %s minutes"
-                            " before retrying (will retry %s more times)"
+                            "%s status returned for request for IA file '%s' (being downloaded as"
+                            " file '%s') - the IA server is temporarily unavailable - will retry in"
+                            " %s minutes (will retry %s more times)"
                         ),
+                        new_response.status_code,
+                        ia_file_name,
                         dest_file_name,
-                        int(connection_wait_timer / 60),
-                        MAX_RETRIES - connection_retry_counter,
+                        int(wait_time / 60),
+                        retry_policy.max_retries - retry.connection_retry_count,
                     )
-                    time.sleep(connection_wait_timer)
-                    connection_retry_counter += 1
-                    connection_wait_timer *= (
-                        2  # Add some delay for each retry in case connection issue is ongoing
+                    return retry.schedule_connection_retry(wait_time)
+                log.warning(
+                    (
+                        "Persistent %s statuses returned for IA file '%s' (being downloaded as"
+                        " file '%s') - download not completed"
+                    ),
+                    new_response.status_code,
+                    ia_file_name,
+                    dest_file_name,
+                )
+                return
+            else:
+                new_response.close()
+                log.warning(
+                    (
+                        "Unexpected status code %s returned for IA file '%s' (being"
+                        " downloaded as file '%s') - download not completed"
+                    ),
+                    new_response.status_code,
+                    ia_file_name,
+                    dest_file_name,
+                )
+                return
+
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ReadTimeout,
+            requests.exceptions.ChunkedEncodingError,
+            ConnectionError,
+        ) as exception:
+            retry.host = get_exception_host(exception, session.host)
+            retry_policy.record_failure(retry.host)
+            # Checkpoint the hash of the data received so far, in case the download is only
+            # resumed after the script is restarted
+            if hash_checkpoint_flag and inline_crc32 is not None and inline_hash_offset > 0:
+                write_hash_checkpoint(dest_file_path, inline_hash_offset, inline_crc32, ia_md5)
+            if retry.connection_retry_count < retry_policy.max_retries:
+                wait_time = retry_policy.wait_time(retry.connection_retry_count)
+                log.info(
+                    (
+                        "ConnectionError/ReadTimeout occurred for '%s', will retry in %s minutes"
+                        " (will retry %s more times)"
+                    ),
+                    dest_file_name,
+                    int(wait_time / 60),
+                    retry_policy.max_retries - retry.connection_retry_count,
+                )
+                # Keep the hashes of the data received so far for the retry
+                retry.inline_md5 = inline_md5
+                retry.inline_crc32 = inline_crc32
+                retry.inline_hash_offset = inline_hash_offset
+                return retry.schedule_connection_retry(wait_time)
+            else:
+                log.warning(
+                    (
+                        "'%s' - download timed out %s times; this file has not been downloaded"
+                        " successfully"
+                    ),
+                    dest_file_name,
+                    retry_policy.max_retries,
+                )
+                return
+
+        else:
+            downloaded_file_size = os.path.getsize(dest_file_path)
+            # In testing, have seen rare instances of the file not being fully downloaded
+            # despite the response object not reporting any more data to write.
+            # This appears associated with the server suddenly throwing a 416 status -
+            # this can be seen by the partially downloaded file having a tail with content
+            # content similar to:
+            #   <html><head><title>416 Requested Range Not Satisfiable</title></head>
+            #   <body><center><h1>416 Requested Range Not Satisfiable</h1></center>
+            #   <hr><center>nginx/1.18.0 (Ubuntu)</center></body></html>
+            # In testing, can't just remove this tail and resume the download, as when diffing
+            # a completed verified file against a partially downloaded '416' file, the file
+            # data deviates not at the tail but much earlier in the file.
+            # So, let's delete the partially downloaded file in this situation and begin again
+            if ia_file_size != -1 and downloaded_file_size < expected_file_size:
+                if retry.size_retry_count < retry_policy.max_retries:
+                    wait_time = retry_policy.wait_time(retry.size_retry_count)
+                    log.info(
+                        (
+                            "File '%s' download concluded but file size is not as expected"
+                            " (file size is %s bytes, expected %s bytes). %s - partially"
+                            " downloaded file will be deleted. Will retry in %s minutes (will"
+                            " retry %s more times)"
+                        ),
+                        dest_file_name,
+                        downloaded_file_size,
+                        expected_file_size,
+                        "The server raised a 416 status error, causing file corruption"
+                        if does_file_have_416_issue(dest_file_path)
+                        else "In this situation the file is likely corrupt",
+                        int(wait_time / 60),
+                        retry_policy.max_retries - retry.size_retry_count,
                     )
+                    os.remove(dest_file_path)
+                    if hash_checkpoint_flag:
+                        remove_hash_checkpoint(dest_file_path)
+                    return retry.schedule_size_retry(wait_time)
                 else:
                     log.warning(
                         (
-                            "'%s' - download timed out %s times; this file has not been downloaded"
-                            " successfully"
+                            "Failed to increase downloaded file '%s' to expected file size"
+                            " (final file size is %s, expected %s; this file has not been"
+                            " downloaded successfully"
                         ),
                         dest_file_name,
-                        MAX_RETRIES,
+                        downloaded_file_size,
+                        expected_file_size,
                     )
                     return
 
+            # If no further errors, the download is complete
             else:
-                downloaded_file_size = os.path.getsize(dest_file_path)
-                # In testing, have seen rare instances of the file not being fully downloaded
-                # despite the response object not reporting any more data to write.
-                # This appears associated with the server suddenly throwing a 416 status -
-                # this can be seen by the partially downloaded file having a tail with content
-                # content similar to:
-                #   <html><head><title>416 Requested Range Not Satisfiable</title></head>
-                #   <body><center><h1>416 Requested Range Not Satisfiable</h1></center>
-                #   <hr><center>nginx/1.18.0 (Ubuntu)</center></body></html>
-                # In testing, can't just remove this tail and resume the download, as when diffing
-                # a completed verified file against a partially downloaded '416' file, the file
-                # data deviates not at the tail but much earlier in the file.
-                # So, let's delete the partially downloaded file in this situation and begin again
-                if ia_file_size != -1 and downloaded_file_size < expected_file_size:
-                    if size_retry_counter < MAX_RETRIES:
-                        log.info(
-                            (
-                                "File '%s' download concluded but file size is not as expected"
-                                " (file size is %s bytes, expected %s bytes). %s - partially"
-                                " downloaded file will be deleted. Waiting %s minutes before"
-                                " retrying (will retry %s more times)"
-                            ),
-                            dest_file_name,
-                            downloaded_file_size,
-                            expected_file_size,
-                            "The server raised a 416 status error, causing file corruption"
-                            if does_file_have_416_issue(dest_file_path)
-                            else "In this situation the file is likely corrupt",
-                            int(size_wait_timer / 60),
-                            MAX_RETRIES - size_retry_counter,
-                        )
-                        os.remove(dest_file_path)
-                        time.sleep(size_wait_timer)
-                        size_retry_counter += 1
-                        size_wait_timer *= (
-                            2  # Add some delay for each retry in case connection issue is ongoing
-                        )
-                    else:
-                        log.warning(
-                            (
-                                "Failed to increase downloaded file '%s' to expected file size"
-                                " (final file size is %s, expected %s; this file has not been"
-                                " downloaded successfully"
-                            ),
-                            dest_file_name,
-                            downloaded_file_size,
-                            expected_file_size,
-                        )
-                        return
-
-                # If no further errors, break from the True loop
-                else:
-                    break
+                if hash_checkpoint_flag:
+                    remove_hash_checkpoint(dest_file_path)
 
     complete_time = datetime.datetime.now()
     duration = complete_time - start_time
@@ -1004,173 +3201,528 @@ def file_download(
     )
     
     # Update progress for completed files
-    if task_id and status_lock and download_status and chunk_number is None:
+    if task_id and status_lock and download_status:
         with status_lock:
             download_status[task_id]['progress']['completed_files'] += 1
             download_status[task_id]['progress']['current_file'] = None
             download_status[task_id]['progress']['current_file_size'] = 0
             download_status[task_id]['progress']['current_file_progress'] = 0
     
-    # If user has opted to verify downloads, add the task to the hash_pool
-    if chunk_number is None:  # Only hash if we're in a thread that isn't downloading a file chunk
-        if hash_pool is not None:
-            # Don't hash the [identifier]_files.xml file, as this regularly gives false
-            # positives (see README Known Issues)
-            if dest_file_name != "{}_files.xml".format(identifier):
-                hash_pool.starmap_async(  # type: ignore
-                    check_hash, iterable=[(dest_file_path, ia_md5)], callback=log_update_callback
+    md5_status = None  # type: typing.Optional[str]
+    if hash_inline and inline_md5 is not None:
+        md5_status = "match" if inline_md5.hexdigest() == ia_md5.lower().strip() else "mismatch"
+    elif hash_inline and inline_crc32 is not None and ia_crc32:
+        # Resumed from a hash checkpoint - the CRC32 covering the whole file is the check result
+        md5_status = (
+            "crc32_match"
+            if "{:08x}".format(inline_crc32) == ia_crc32.lower().strip()
+            else "crc32_mismatch"
+        )
+    record_completed_file(md5_status)
+
+    # If user has opted to verify downloads, the hash has been calculated while the data was
+    # written - compare it against IA metadata now; fall back to the hash_pool if not available
+    if hash_inline:
+        if inline_md5 is not None:
+            log_level, log_message = compare_hash_values(
+                dest_file_path, inline_md5.hexdigest(), ia_md5
+            )
+            getattr(log, log_level)(log_message)
+            # Record the hash value, so that later verification doesn't need to re-read the file
+            if metadata_store is not None:
+                try:
+                    metadata_store.put_file_hashes(
+                        [(dest_file_path, os.stat(dest_file_path), inline_md5.hexdigest())]
+                    )
+                except OSError:
+                    pass
+        elif inline_crc32 is not None and ia_crc32:
+            # Download was resumed from a hash checkpoint, so only the CRC32 covers the whole file;
+            # it is used as the file's verification result rather than re-reading the file for
+            # its MD5 (use the verify mode to check the MD5 later if needed)
+            log_level, log_message = compare_hash_values(
+                dest_file_path, "{:08x}".format(inline_crc32), ia_crc32, "CRC32 hash"
+            )
+            getattr(log, log_level)(log_message)
+            if metadata_store is not None:
+                try:
+                    metadata_store.put_file_hashes(
+                        [
+                            (
+                                dest_file_path,
+                                os.stat(dest_file_path),
+                                "{:08x}".format(inline_crc32),
+                            )
+                        ],
+                        "crc32",
+                    )
+                except OSError:
+                    pass
+        else:
+            check_hash_in_pool(dest_file_path, ia_md5, hash_pool, metadata_store)  # type: ignore
+
+
+def budgeted_file_download(
+    download_details: typing.Tuple[typing.Any, ...],
+    retry: typing.Optional[DownloadRetry] = None,
+) -> typing.Optional[DownloadRetry]:
+    """Called as separate threads from the download function; waits for a connection from the
+    connection budget (the last element of download_details), then runs file_download
+
+    """
+    connection_budget = download_details[-1]
+    connection_budget.acquire()
+    try:
+        return file_download(download_details, retry)  # type: ignore
+    finally:
+        connection_budget.release()
+
+
+class FileDownloadQueue:
+    """Runs file downloads (from one or more items) on a pool of download threads
+
+    A file whose download fails because of a temporary issue is put on a retry queue and queued
+    again once its retry is due, so that download threads are never left waiting; once all of an
+    item's files have finished, the item's completion callback is run by the thread calling wait
+    """
+
+    def __init__(self, thread_count: int) -> None:
+        self.download_pool = multiprocessing.pool.ThreadPool(thread_count)
+        self.condition = threading.Condition()
+        # Heap of (due time, sequence number, item key, download details, retry)
+        self.retry_queue = []  # type: typing.List[typing.Tuple[typing.Any, ...]]
+        self.sequence_numbers = itertools.count()
+        self.active_download_count = 0
+        self.item_remaining_counts = {}  # type: typing.Dict[int, int]
+        self.item_callbacks = {}  # type: typing.Dict[int, typing.Callable[[], None]]
+        self.completed_items = []  # type: typing.List[int]
+
+    def __enter__(self) -> "FileDownloadQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # Running under context management lets the user ctrl+c out and not get a
+        # "ResourceWarning: unclosed running multiprocessing pool" error
+        self.download_pool.terminate()
+
+    def add_item(
+        self,
+        download_queue: typing.List[typing.Tuple[typing.Any, ...]],
+        item_complete_callback: typing.Callable[[], None],
+    ) -> None:
+        """Queue the downloads for an item's files (in the order provided)"""
+        with self.condition:
+            item_key = next(self.sequence_numbers)
+            self.item_remaining_counts[item_key] = len(download_queue)
+            self.item_callbacks[item_key] = item_complete_callback
+            for download_details in download_queue:
+                self.queue_download(item_key, download_details)
+            if len(download_queue) == 0:
+                self.completed_items.append(item_key)
+                self.condition.notify()
+
+    def queue_download(
+        self,
+        item_key: int,
+        download_details: typing.Tuple[typing.Any, ...],
+        retry: typing.Optional[DownloadRetry] = None,
+    ) -> None:
+        """Queue a file download (condition must be held)"""
+        self.active_download_count += 1
+        self.download_pool.apply_async(
+            budgeted_file_download,
+            (download_details, retry),
+            callback=lambda result: self.download_done(item_key, download_details, result),
+            error_callback=lambda exception: self.download_failed(item_key, exception),
+        )
+
+    def download_done(
+        self,
+        item_key: int,
+        download_details: typing.Tuple[typing.Any, ...],
+        retry: typing.Optional[DownloadRetry],
+    ) -> None:
+        with self.condition:
+            self.active_download_count -= 1
+            if retry is not None:
+                sequence_number = next(self.sequence_numbers)
+                heapq.heappush(
+                    self.retry_queue,
+                    (retry.due_time, sequence_number, item_key, download_details, retry),
                 )
+            else:
+                self.file_finished(item_key)
+            self.condition.notify()
 
+    def download_failed(self, item_key: int, exception: BaseException) -> None:
+        log = logging.getLogger(__name__)
+        log.error(
+            "Exception occurred during file download:",
+            exc_info=(type(exception), exception, exception.__traceback__),
+        )
+        with self.condition:
+            self.active_download_count -= 1
+            self.file_finished(item_key)
+            self.condition.notify()
+
+    def file_finished(self, item_key: int) -> None:
+        """Record that one of an item's files will not be downloaded again (condition must be
+        held)
+
+        """
+        self.item_remaining_counts[item_key] -= 1
+        if self.item_remaining_counts[item_key] == 0:
+            del self.item_remaining_counts[item_key]
+            self.completed_items.append(item_key)
+
+    def wait(self, max_active_count: int = 0) -> None:
+        """Queue retries as they become due, and run completion callbacks for finished items,
+        until no more than max_active_count file downloads are in progress - or, if
+        max_active_count is 0, until every download (including retries) has finished
+
+        """
+        while True:
+            with self.condition:
+                while len(self.retry_queue) > 0 and self.retry_queue[0][0] <= time.monotonic():
+                    _, _, item_key, download_details, retry = heapq.heappop(self.retry_queue)
+                    self.queue_download(item_key, download_details, retry)
+                item_complete_callbacks = [
+                    self.item_callbacks.pop(item_key) for item_key in self.completed_items
+                ]
+                self.completed_items = []
+                if len(item_complete_callbacks) == 0:
+                    if self.active_download_count <= max_active_count and (
+                        max_active_count > 0 or len(self.retry_queue) == 0
+                    ):
+                        return
+                    # Wait for a download to finish, or for the next retry to be due
+                    self.condition.wait(
+                        self.retry_queue[0][0] - time.monotonic()
+                        if len(self.retry_queue) > 0
+                        else None
+                    )
+                    continue
+            # Run callbacks without holding the condition, so downloads can keep finishing
+            for item_complete_callback in item_complete_callbacks:
+                item_complete_callback()
 
-def download(
-    identifier: str,
-    output_folder: str,
-    hash_file: typing.Optional[io.TextIOWrapper],
-    thread_count: int,
-    resume_flag: bool,
-    verify_flag: bool,
-    split_count: int,
-    file_filters: typing.Optional[typing.List[str]],
-    invert_file_filtering: bool,
-    cache_parent_folder: str,
-    cache_refresh: bool,
-    task_id: typing.Optional[str] = None,
-    status_lock: typing.Optional[object] = None,
-    download_status: typing.Optional[dict] = None
-) -> None:
-    """Download files associated with an Internet Archive identifier"""
+    def close(self) -> None:
+        """Wait for the download threads to finish"""
+        self.download_pool.close()
+        self.download_pool.join()
+
+
+def log_recent_item_update(identifier: str, item_last_updated: int) -> None:
+    """Warn if an item was updated recently enough that its files may still be changing"""
     log = logging.getLogger(__name__)
-    PROCESSES = multiprocessing.cpu_count() - 1
-    MAX_RETRIES = 5
+    item_updated_time = datetime.datetime.fromtimestamp(item_last_updated)
+    if item_updated_time > (datetime.datetime.now() - datetime.timedelta(weeks=1)):
+        log.warning(
+            (
+                "Internet Archive item '%s' was updated within the last week (last updated on %s)"
+                " - verification/corruption issues may occur if files are being updated by the"
+                " uploader. If such errors occur when resuming a download, recommend using the"
+                " '--cacherefresh' flag"
+            ),
+            identifier,
+            item_updated_time.strftime("%Y-%m-%d %H:%M:%S"),
+        )
 
-    # Create output folder if it doesn't already exist
-    pathlib.Path(output_folder).mkdir(parents=True, exist_ok=True)
 
-    log.info("'%s' contents will be downloaded to '%s'", identifier, output_folder)
+def revalidate_cached_item(
+    session: requests.Session,
+    metadata_store: MetadataStore,
+    identifier: str,
+    retry_policy: RetryPolicy,
+) -> bool:
+    """Return True if an item's cached metadata can be used, checking with IA whether the item
+    has changed since it was cached rather than refetching its full metadata
 
-    # If user has set to verify, create a new multiprocessing.Pool whose reference will be passed
-    # to each download thread to allow for non-blocking hashing
-    hash_pool = None
-    if verify_flag:
-        hash_pool = multiprocessing.Pool(PROCESSES, initializer=hash_pool_initializer)
+    Cached metadata without an 'item_last_updated' value (or if the check can't be made) is used
+    if it is less than a week old
 
-    # See if the items exist in the cache
-    cache_folder = os.path.join(cache_parent_folder, identifier)
-    cached_item = None
+    """
+    log = logging.getLogger(__name__)
+    item_details = metadata_store.get_item_details(identifier)
+    if item_details is None:
+        return False
+    fetched_time, cached_item_last_updated = item_details
+    if cached_item_last_updated is not None:
+        item_last_updated = None
+        if retry_policy.host_wait_time(session.host) == 0:
+            try:
+                item_last_updated = get_item_last_updated(session, identifier)
+                retry_policy.record_success(session.host)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                retry_policy.record_failure(session.host)
+            except (requests.exceptions.HTTPError, ValueError):
+                pass
+        if item_last_updated == cached_item_last_updated:
+            log.debug("'%s' is unchanged since its metadata was cached", identifier)
+            metadata_store.mark_item_revalidated(identifier)
+            log_recent_item_update(identifier, item_last_updated)
+            return True
+        if item_last_updated is not None:
+            log.info(
+                "'%s' has been updated since its metadata was cached - metadata will be refreshed",
+                identifier,
+            )
+            return False
+        log.debug("Unable to check whether '%s' has been updated since it was cached", identifier)
+    return time.time() - fetched_time <= datetime.timedelta(weeks=1).total_seconds()
 
-    @dataclass
-    class CacheDict:
-        """Using this simply to allow for a custom attribute (item_metadata) if we use cache"""
 
-        item_metadata: typing.Dict[str, typing.Any] = field(default_factory=dict)
+def get_item_file_metadata(
+    identifier: str,
+    session: requests.Session,
+    cache_parent_folder: str,
+    cache_refresh: bool,
+    retry_policy: RetryPolicy,
+) -> typing.Optional[typing.List[typing.Dict[str, typing.Any]]]:
+    """Return metadata for an item's files, from the cache if it is current or otherwise from IA
+    (storing it in the cache); returns None if IA couldn't be reached
 
-    if not cache_refresh and os.path.isdir(cache_folder):
-        cache_files = sorted(
-            [
-                f.path
-                for f in os.scandir(cache_folder)
-                if f.is_file() and f.name.endswith("metadata.txt")
-            ]
-        )
-        if len(cache_files) > 0:
-            cache_file = cache_files[-1]  # Get the most recent cache file
-            # Get datetime from filename
-            datetime_str = "_".join(os.path.basename(cache_file).split("_", 2)[:2])
-            file_datetime = datetime.datetime.strptime(datetime_str, "%Y%m%d_%H%M%S")
-            now_datetime = datetime.datetime.now()
-            if now_datetime - datetime.timedelta(weeks=1) <= file_datetime <= now_datetime:
-                log.debug(
-                    "Cached data from %s will be used for item '%s'", datetime_str, identifier
+    """
+    log = logging.getLogger(__name__)
+    # See if the item exists in the cache
+    metadata_store = get_metadata_store(cache_parent_folder)
+    if not cache_refresh and revalidate_cached_item(
+        session, metadata_store, identifier, retry_policy
+    ):
+        cached_files = metadata_store.get_item_files(identifier)
+        if cached_files is not None:
+            return cached_files
+
+    item_metadata = None
+    connection_retry_counter = 0
+    while True:
+        retry_policy.wait_for_host(session.host)
+        failed_response = None
+        try:
+            # Get Internet Archive metadata for the provided identifier
+            item_metadata = get_item_metadata(session, identifier)
+            retry_policy.record_success(session.host)
+            if "item_last_updated" in item_metadata:
+                log_recent_item_update(identifier, int(item_metadata["item_last_updated"]))
+            # If no further errors, break from the True loop
+            break
+        except requests.exceptions.HTTPError as exception:
+            failed_response = exception.response
+            if failed_response is None or (
+                failed_response.status_code != 429 and failed_response.status_code < 500
+            ):
+                log.warning(
+                    (
+                        "%s when getting info for item '%s' from Internet Archive - download of"
+                        " item has failed"
+                    ),
+                    exception,
+                    identifier,
                 )
+                return None
+            error_description = "{} status returned".format(failed_response.status_code)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            error_description = "ConnectionError occurred (is internet connection active?)"
+        except ValueError:
+            log.warning(
+                (
+                    "Invalid metadata returned by Internet Archive for item '%s' - download of"
+                    " item has failed"
+                ),
+                identifier,
+            )
+            return None
+        retry_policy.record_failure(session.host)
+        if connection_retry_counter < retry_policy.max_retries:
+            # Honours any Retry-After header sent with a 429/503 response
+            wait_time = retry_policy.wait_time(connection_retry_counter, failed_response)
+            log.info(
+                (
+                    "%s when attempting to connect to Internet Archive to get info for item '%s'"
+                    " - waiting %s minutes before retrying (will retry %s more times)"
+                ),
+                error_description,
+                identifier,
+                int(wait_time / 60),
+                retry_policy.max_retries - connection_retry_counter,
+            )
+            time.sleep(wait_time)
+            connection_retry_counter += 1
+        else:
+            log.warning(
+                (
+                    "%s persistently when attempting to connect to Internet Archive - download of"
+                    " item '%s' has failed"
+                ),
+                error_description,
+                identifier,
+            )
+            return None
 
-                cached_item = CacheDict()
-                cached_item.item_metadata["files"] = []
-                with open(cache_file, "r", encoding="utf-8") as file_handler:
-                    try:
-                        for line in file_handler:
-                            _, file_path, size, md5, mtime = line.strip().split("|")
-                            item_dict = {}
-                            item_dict["name"] = file_path
-                            item_dict["size"] = size
-                            item_dict["md5"] = md5
-                            item_dict["mtime"] = mtime
-                            cached_item.item_metadata["files"].append(item_dict)
-                    except ValueError:
-                        log.info(
-                            (
-                                "Cache file '%s' does not match expected format - cache data will"
-                                " be redownloaded"
-                            ),
-                            cache_file,
-                        )
-                        cached_item = None
+    if "files" not in item_metadata:
+        return []
+    item_last_updated = item_metadata.get("item_last_updated")
+    metadata_store.put_item_files(
+        identifier,
+        item_metadata["files"],
+        int(item_last_updated) if item_last_updated is not None else None,
+    )
+    return item_metadata["files"]
 
-    live_item = None
-    if cached_item is None:
-        connection_retry_counter = 0
-        connection_wait_timer = 600
-        while True:
-            try:
-                # Get Internet Archive metadata for the provided identifier
-                live_item = internetarchive.get_item(identifier)
-                if live_item is not None and "item_last_updated" in live_item.item_metadata:
-                    item_updated_time = datetime.datetime.fromtimestamp(
-                        int(live_item.item_metadata["item_last_updated"])
-                    )
-                    if item_updated_time > (datetime.datetime.now() - datetime.timedelta(weeks=1)):
-                        log.warning(
-                            (
-                                "Internet Archive item '%s' was updated within the last week (last"
-                                " updated on %s) - verification/corruption issues may occur if"
-                                " files are being updated by the uploader. If such errors occur"
-                                " when resuming a download, recommend using the '--cacherefresh'"
-                                " flag"
-                            ),
-                            identifier,
-                            item_updated_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        )
-            except requests.exceptions.ConnectionError:
-                if connection_retry_counter < MAX_RETRIES:
-                    log.info(
-                        (
-                            "ConnectionError occurred when attempting to connect to Internet"
-                            " Archive to get info for item '%s' - is internet connection active?"
-                            " Waiting %s minutes before retrying (will retry %s more times)"
-                        ),
-                        identifier,
-                        int(connection_wait_timer / 60),
-                        MAX_RETRIES - connection_retry_counter,
-                    )
-                    time.sleep(connection_wait_timer)
-                    connection_retry_counter += 1
-                    connection_wait_timer *= (
-                        2  # Add some delay for each retry in case connection issue is ongoing
-                    )
-                else:
-                    log.warning(
-                        (
-                            "ConnectionError persisted when attempting to connect to Internet"
-                            " Archive - is internet connection active? Download of item '%s' has"
-                            " failed"
-                        ),
+
+def prefetch_item_file_metadata(
+    identifiers: typing.Iterable[str],
+    prefetch_count: int,
+    session: requests.Session,
+    cache_parent_folder: str,
+    cache_refresh: bool,
+    retry_policy: RetryPolicy,
+) -> typing.Iterator[
+    typing.Tuple[str, typing.Optional[typing.List[typing.Dict[str, typing.Any]]]]
+]:
+    """Yield (identifier, file metadata) for each identifier in order, while metadata for up to
+    prefetch_count of the following identifiers is fetched in the background - so that the next
+    item's downloads can start as soon as the current item's downloads finish
+
+    The file metadata is None if it couldn't be fetched; if prefetch_count is 0, metadata is
+    fetched as each identifier is reached
+    """
+    if prefetch_count < 1:
+        for identifier in identifiers:
+            yield identifier, get_item_file_metadata(
+                identifier, session, cache_parent_folder, cache_refresh, retry_policy
+            )
+        return
+    with multiprocessing.pool.ThreadPool(prefetch_count) as prefetch_pool:
+        identifier_iterator = iter(identifiers)
+        pending_results = collections.deque()  # type: typing.Deque[typing.Tuple[str, typing.Any]]
+
+        def prefetch_next() -> None:
+            identifier = next(identifier_iterator, None)
+            if identifier is not None:
+                pending_results.append(
+                    (
                         identifier,
+                        prefetch_pool.apply_async(
+                            get_item_file_metadata,
+                            (identifier, session, cache_parent_folder, cache_refresh, retry_policy),
+                        ),
                     )
-                    live_item = None
-                    break
-            # If no further errors, break from the True loop
-            else:
-                break
+                )
 
-    if cached_item is None and live_item is None:
-        return
+        for _ in range(prefetch_count):
+            prefetch_next()
+        while len(pending_results) > 0:
+            identifier, result = pending_results.popleft()
+            item_files = result.get()
+            prefetch_next()
+            yield identifier, item_files
+
+
+def item_metadata_version(files: typing.Iterable[typing.Tuple[str, int, str]]) -> str:
+    """Return a digest of the (file name, size, MD5) of an item's files to be downloaded - which
+    changes if the item's files are updated on Internet Archive, or file filters select different
+    files - to tell whether a completed download recorded in the journal is still current
+
+    """
+    return hashlib.sha1(json.dumps(sorted(files)).encode("utf-8")).hexdigest()
+
+
+def item_folder_signature(file_paths: typing.Iterable[str]) -> typing.Optional[str]:
+    """Return a digest of the modification times of the folders containing an item's files, or
+    None if a folder can't be accessed - which changes if any of the files are deleted, renamed or
+    replaced, so that an unchanged signature shows the files are still in place without having to
+    stat each of them
+
+    """
+    folder_mtimes = []
+    for folder_path in sorted(set(os.path.dirname(file_path) for file_path in file_paths)):
+        try:
+            folder_mtimes.append((folder_path, os.stat(folder_path).st_mtime_ns))
+        except OSError:
+            return None
+    return hashlib.sha1(json.dumps(folder_mtimes).encode("utf-8")).hexdigest()
+
+
+def completed_item_unchanged(
+    metadata_store: MetadataStore,
+    output_folder: str,
+    identifier: str,
+    metadata_version: str,
+    file_paths: typing.List[str],
+) -> bool:
+    """Return True if the completion journal records that this version of an item has been fully
+    downloaded to the output folder, none of its files failed their hash check, and its files are
+    still in place - checked using the signature of the folders containing them, and only if that
+    has changed, by checking that each file still has its recorded size and modification time
+
+    """
+    log = logging.getLogger(__name__)
+    completed_item = metadata_store.get_completed_item(output_folder, identifier)
+    if completed_item is None or completed_item[0] != metadata_version:
+        return False
+    completed_files = metadata_store.get_completed_files(file_paths)
+    for file_path in file_paths:
+        completed_file = completed_files.get(os.path.abspath(file_path))
+        if completed_file is None:
+            return False
+        if completed_file[2] in ("mismatch", "crc32_mismatch"):
+            log.debug(
+                "'%s' failed its hash check when it was downloaded - files will be checked",
+                file_path,
+            )
+            return False
+    folder_signature = item_folder_signature(file_paths)
+    if folder_signature is not None and folder_signature == completed_item[1]:
+        return True
+    for file_path in file_paths:
+        recorded_size, recorded_mtime_ns, _ = completed_files[os.path.abspath(file_path)]
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return False
+        if (file_stat.st_size, file_stat.st_mtime_ns) != (recorded_size, recorded_mtime_ns):
+            return False
+    # The files are unchanged but their folders have been modified (e.g. other files were added),
+    # so record the current signature to skip the per-file check next time
+    metadata_store.set_completed_item_folder_signature(output_folder, identifier, folder_signature)
+    return True
+
+
+def queue_item_downloads(
+    identifier: str,
+    item_files: typing.List[typing.Dict[str, typing.Any]],
+    output_folder: str,
+    hash_file: typing.Optional[io.TextIOWrapper],
+    resume_flag: bool,
+    split_count: int,
+    file_filters: typing.Optional[typing.List[str]],
+    invert_file_filtering: bool,
+    cache_parent_folder: str,
+    task_id: typing.Optional[str],
+    status_lock: typing.Optional[object],
+    download_status: typing.Optional[dict],
+    session: requests.Session,
+    connection_budget: ConnectionBudget,
+    retry_policy: RetryPolicy,
+    hash_pool: typing.Optional[multiprocessing.pool.Pool],
+    file_download_queue: FileDownloadQueue,
+    completed_item_callback: typing.Optional[typing.Callable[[str], None]] = None,
+) -> None:
+    """Add the files of an Internet Archive item to a file download queue (unless the item has
+    already been downloaded), with a basic verification of the item once its files have finished
+
+    completed_item_callback is called with the item's identifier if the item is found to be already
+    downloaded, or once its files have been downloaded and verified
+    """
+    log = logging.getLogger(__name__)
+    log.info("'%s' contents will be downloaded to '%s'", identifier, output_folder)
 
     # Write metadata for files associated with IA identifier to a file, and populate
     # download_queue with this metadata
     item_file_count = 0
     item_total_size = 0
     item_filtered_files_size = 0
-
-    item = live_item if live_item is not None else cached_item
     
     # Update total files count for progress tracking
     if task_id and status_lock and download_status:
@@ -1187,17 +3739,6 @@ def download(
             
             # Count files that match our filters
             filtered_files_count = 0
-            # Handle both live_item.files and cached_item.item_metadata["files"]
-            item_files = []
-            if isinstance(item, CacheDict):
-                if "files" in item.item_metadata:
-                    item_files = item.item_metadata["files"]
-            else:
-                if hasattr(item, 'files'):
-                    item_files = item.files
-                elif hasattr(item, 'item_metadata') and "files" in item.item_metadata:
-                    item_files = item.item_metadata["files"]
-            
             for ia_file in item_files:
                 ia_file_name = ia_file.get("name", "")
                 # Skip files that don't match our filters
@@ -1212,25 +3753,13 @@ def download(
             
             download_status[task_id]['progress']['total_files'] += filtered_files_count
     
-    if item is not None and "files" in item.item_metadata:
-        # Create cache folder for item if it doesn't already exist
-        pathlib.Path(cache_folder).mkdir(parents=True, exist_ok=True)
-
+    if len(item_files) > 0:
+        # Completed files are recorded in the metadata store's completion journal; if verifying,
+        # hash values of local files are also recorded in (and, for files that were already
+        # present, looked up from) the metadata store
+        metadata_store = get_metadata_store(cache_parent_folder)
         download_queue = []
-        # If the 'item' is our custom CacheDict, then we built it from cache - so don't need to
-        # write another metadata file
-        if not isinstance(item, CacheDict):
-            cache_file_handler = open(
-                os.path.join(
-                    cache_folder,
-                    "{}_{}_metadata.txt".format(
-                        datetime.datetime.now().strftime("%Y%m%d_%H%M%S"), identifier
-                    ),
-                ),
-                "w",
-                encoding="utf-8",
-            )
-        for file in item.item_metadata["files"]:
+        for file in item_files:
             item_file_count += 1
             if "size" in file:
                 item_total_size += int(file["size"])
@@ -1245,8 +3774,6 @@ def download(
             log_write_str = "{}|{}|{}|{}|{}\n".format(
                 identifier, file["name"], file["size"], file["md5"], file["mtime"]
             )
-            if not isinstance(item, CacheDict):
-                cache_file_handler.write(log_write_str)
             if file_filters is not None:
                 if not invert_file_filtering:
                     if not any(
@@ -1267,28 +3794,49 @@ def download(
                     file["name"],
                     int(file["size"]),
                     file["md5"],
+                    file.get("crc32", ""),
                     int(file["mtime"]),
                     output_folder,
                     hash_pool,
                     resume_flag,
                     split_count,
-                    None,  # bytes_range
-                    None,  # chunk_number
                     task_id,  # task_id for progress tracking
                     status_lock,  # status_lock for thread-safe updates
-                    download_status  # download_status for updates
+                    download_status,  # download_status for updates
+                    session,
+                    retry_policy,
+                    metadata_store,
+                    connection_budget,
                 )
             )
 
-        if not isinstance(item, CacheDict):
-            cache_file_handler.close()
+        # Skip the item without scanning its folder if the completion journal records that this
+        # version of its files has already been downloaded to the output folder, and its files are
+        # still as the journal recorded them
+        identifier_output_folder = os.path.join(output_folder, identifier)
+        metadata_version = item_metadata_version(
+            (details[1], details[2], details[3]) for details in download_queue
+        )
+        queued_file_paths = [
+            os.path.join(identifier_output_folder, details[1]) for details in download_queue
+        ]
+        if len(download_queue) > 0 and completed_item_unchanged(
+            metadata_store, output_folder, identifier, metadata_version, queued_file_paths
+        ):
+            log.info(
+                "'%s' is recorded as fully downloaded in folder '%s' - skipping",
+                identifier,
+                output_folder,
+            )
+            if completed_item_callback is not None:
+                completed_item_callback(identifier)
+            return
 
-        # Check if the output folder already seems to have all the files we expect
+        # Otherwise, check if the output folder already seems to have all the files we expect
         # Check if files in download queue equal files in folder
-        identifier_output_folder = os.path.join(output_folder, identifier)
         if (
             os.path.isdir(identifier_output_folder)
-            and len(file_paths_in_folder(identifier_output_folder)) > 0
+            and folder_contains_files(identifier_output_folder)
         ):
             size_verification = verify(
                 hash_file=None,
@@ -1302,11 +3850,25 @@ def download(
                 quiet=True,
             )
             if size_verification:
+                # Journal the files as they are now, so later runs can skip the item straight away
+                for file_path in queued_file_paths:
+                    try:
+                        metadata_store.put_completed_file(file_path, identifier, os.stat(file_path))
+                    except OSError:
+                        pass
+                metadata_store.put_completed_item(
+                    output_folder,
+                    identifier,
+                    metadata_version,
+                    item_folder_signature(queued_file_paths),
+                )
                 log.info(
                     "'%s' appears to have been fully downloaded in folder '%s' - skipping",
                     identifier,
                     output_folder,
                 )
+                if completed_item_callback is not None:
+                    completed_item_callback(identifier)
                 return
 
         if file_filters is not None:
@@ -1366,35 +3928,20 @@ def download(
                 bytes_filesize_to_readable_str(item_total_size),
             )
 
-        # Running under context management here lets the user ctrl+c out and not get a
-        # "ResourceWarning: unclosed running multiprocessing pool
-        # <multiprocessing.pool.ThreadPool ..." error
-        with multiprocessing.pool.ThreadPool(thread_count) as download_pool:
-            # Chunksize 1 used to ensure downloads occur in filename order
-            download_pool.map(file_download, download_queue, chunksize=1)
-            log.debug("Waiting for download pool to complete")
-            download_pool.close()
-            download_pool.join()  # Blocks until download threads are complete
-
-        # Do a 'basic' verification of data (just checking file sizes and paths, not hash
-        # values) - this is separate to hash checks that will be performed as downloads
-        # complete if the user has opted to '--verify'
-        log.info("Download phase complete for item '%s'", identifier)
-        # Ensure hash file is written to disk to use in verify function
-        if hash_file is not None:
-            hash_file.flush()
-            os.fsync(hash_file.fileno())
-        verify(
-            hash_file=None,
-            data_folders=[output_folder],
-            no_paths_flag=False,
-            hash_flag=False,
-            cache_parent_folder=cache_parent_folder,
-            identifiers=[identifier],
-            file_filters=file_filters,
-            invert_file_filtering=invert_file_filtering,
+        file_download_queue.add_item(
+            download_queue,
+            lambda: finish_item_download(
+                identifier,
+                output_folder,
+                hash_file,
+                cache_parent_folder,
+                file_filters,
+                invert_file_filtering,
+                metadata_version,
+                queued_file_paths,
+                completed_item_callback,
+            ),
         )
-
     else:
         log.warning(
             (
@@ -1403,10 +3950,202 @@ def download(
             ),
             identifier,
         )
+
+
+def finish_item_download(
+    identifier: str,
+    output_folder: str,
+    hash_file: typing.Optional[io.TextIOWrapper],
+    cache_parent_folder: str,
+    file_filters: typing.Optional[typing.List[str]],
+    invert_file_filtering: bool,
+    metadata_version: str,
+    file_paths: typing.List[str],
+    completed_item_callback: typing.Optional[typing.Callable[[str], None]] = None,
+) -> None:
+    """Called once all of an item's queued files have finished downloading; if the item verifies,
+    it is recorded in the completion journal (for the version of its metadata that was downloaded,
+    with the signature of the folders containing file_paths) and completed_item_callback is called
+    with its identifier
+
+    """
+    log = logging.getLogger(__name__)
+    # Do a 'basic' verification of data (just checking file sizes and paths, not hash
+    # values) - this is separate to hash checks that will be performed as downloads
+    # complete if the user has opted to '--verify'
+    log.info("Download phase complete for item '%s'", identifier)
+    # Ensure hash file is written to disk to use in verify function
+    if hash_file is not None:
+        hash_file.flush()
+        os.fsync(hash_file.fileno())
+    if verify(
+        hash_file=None,
+        data_folders=[output_folder],
+        no_paths_flag=False,
+        hash_flag=False,
+        cache_parent_folder=cache_parent_folder,
+        identifiers=[identifier],
+        file_filters=file_filters,
+        invert_file_filtering=invert_file_filtering,
+    ):
+        get_metadata_store(cache_parent_folder).put_completed_item(
+            output_folder, identifier, metadata_version, item_folder_signature(file_paths)
+        )
+        if completed_item_callback is not None:
+            completed_item_callback(identifier)
+
+
+def download(
+    identifier: str,
+    output_folder: str,
+    hash_file: typing.Optional[io.TextIOWrapper],
+    thread_count: int,
+    resume_flag: bool,
+    verify_flag: bool,
+    split_count: int,
+    file_filters: typing.Optional[typing.List[str]],
+    invert_file_filtering: bool,
+    cache_parent_folder: str,
+    cache_refresh: bool,
+    task_id: typing.Optional[str] = None,
+    status_lock: typing.Optional[object] = None,
+    download_status: typing.Optional[dict] = None,
+    session: typing.Optional[requests.Session] = None,
+    connection_budget: typing.Optional[ConnectionBudget] = None,
+    retry_policy: typing.Optional[RetryPolicy] = None,
+    item_files: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None,
+    completed_item_callback: typing.Optional[typing.Callable[[str], None]] = None,
+) -> None:
+    """Download files associated with an Internet Archive identifier
+
+    thread_count (files downloaded simultaneously) and split_count (connections per split file)
+    are upper limits; the connection budget, if shared between calls, caps the total connections.
+    item_files is the item's file metadata if it has already been fetched (e.g. by
+    prefetch_item_file_metadata); completed_item_callback is called with the identifier if the item
+    is fully downloaded and verified (or was already)
+    """
+    download_items(
+        [(identifier, item_files)],
+        output_folder,
+        hash_file,
+        thread_count,
+        resume_flag,
+        verify_flag,
+        split_count,
+        file_filters,
+        invert_file_filtering,
+        cache_parent_folder,
+        cache_refresh,
+        task_id,
+        status_lock,
+        download_status,
+        session,
+        connection_budget,
+        retry_policy,
+        completed_item_callback,
+    )
+
+
+def download_items(
+    items: typing.Iterable[
+        typing.Tuple[str, typing.Optional[typing.List[typing.Dict[str, typing.Any]]]]
+    ],
+    output_folder: str,
+    hash_file: typing.Optional[io.TextIOWrapper],
+    thread_count: int,
+    resume_flag: bool,
+    verify_flag: bool,
+    split_count: int,
+    file_filters: typing.Optional[typing.List[str]],
+    invert_file_filtering: bool,
+    cache_parent_folder: str,
+    cache_refresh: bool,
+    task_id: typing.Optional[str] = None,
+    status_lock: typing.Optional[object] = None,
+    download_status: typing.Optional[dict] = None,
+    session: typing.Optional[requests.Session] = None,
+    connection_budget: typing.Optional[ConnectionBudget] = None,
+    retry_policy: typing.Optional[RetryPolicy] = None,
+    completed_item_callback: typing.Optional[typing.Callable[[str], None]] = None,
+) -> None:
+    """Download files from several Internet Archive items using one queue of files, served by a
+    single pool of download threads - so that items with only a few files are downloaded
+    concurrently rather than one after another
+
+    items yields (identifier, file metadata) - the file metadata is fetched if it is None. Items
+    are added to the queue as download threads become free, and each item is verified as soon as
+    its own files have finished (then completed_item_callback, if given, is called with the
+    identifier of each item that was fully downloaded, or had been already)
+    """
+    log = logging.getLogger(__name__)
+
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+
+    # If a connection budget hasn't been provided for the run, allow every file thread to use its
+    # full split count
+    if connection_budget is None:
+        connection_budget = ConnectionBudget(thread_count * split_count)
+
+    # If a session hasn't been provided for the run, create one for these items' downloads (with
+    # room in the pool for the item metadata requests made alongside them)
+    owned_session = session is None
+    if session is None:
+        session = get_download_session(connection_budget.size + 1)
+
+    # Create output folder if it doesn't already exist
+    pathlib.Path(output_folder).mkdir(parents=True, exist_ok=True)
+
+    # If user has set to verify, create a new multiprocessing.Pool whose reference will be passed
+    # to each download thread to allow for non-blocking hashing
+    hash_pool = None
+    if verify_flag:
+        hash_pool = multiprocessing.Pool(
+            get_hash_process_count(), initializer=hash_pool_initializer
+        )
+
+    download_thread_count = min(thread_count, connection_budget.size)
+    with FileDownloadQueue(download_thread_count) as file_download_queue:
+        for identifier, item_files in items:
+            # Get metadata for the item's files, unless it has already been prefetched
+            if item_files is None:
+                item_files = get_item_file_metadata(
+                    identifier, session, cache_parent_folder, cache_refresh, retry_policy
+                )
+            if item_files is not None:
+                queue_item_downloads(
+                    identifier,
+                    item_files,
+                    output_folder,
+                    hash_file,
+                    resume_flag,
+                    split_count,
+                    file_filters,
+                    invert_file_filtering,
+                    cache_parent_folder,
+                    task_id,
+                    status_lock,
+                    download_status,
+                    session,
+                    connection_budget,
+                    retry_policy,
+                    hash_pool,
+                    file_download_queue,
+                    completed_item_callback,
+                )
+            # Keep enough files queued for every download thread to have one waiting, but only
+            # add the next item's files once the queue has drained to that point
+            file_download_queue.wait(max_active_count=download_thread_count * 2)
+        file_download_queue.wait()
+        log.debug("Waiting for download pool to complete")
+        file_download_queue.close()
+
     if hash_pool is not None:
         log.debug("Waiting for hash tasks to complete")
         hash_pool.close()
         hash_pool.join()  # Blocks until hashing processes are complete
+    if owned_session:
+        log_session_stats(session)
 
 
 def verify(
@@ -1419,8 +4158,17 @@ def verify(
     file_filters: typing.Optional[typing.List[str]] = None,
     invert_file_filtering: bool = False,
     quiet: bool = False,
+    hash_processes: typing.Optional[int] = None,
+    rehash_percent: float = 0,
+    hash_algorithm: str = "md5",
 ) -> bool:
-    """Verify that previously-downloaded files are complete"""
+    """Verify that previously-downloaded files are complete (comparing hash values of the
+    hash_algorithm if hash_flag is set, otherwise file sizes)
+
+    Data folders are verified concurrently; if hashing, files are hashed by a shared pool of
+    hash_processes processes (one per CPU if not provided). Files that haven't changed since they
+    were last hashed use their recorded hash value, other than rehash_percent of them
+    """
     if quiet:
         log = logging.getLogger("quiet")
     else:
@@ -1433,390 +4181,719 @@ def verify(
             log.error("Folder '%s' does not exist", data_folder)
             return False
 
-    errors = 0
-    for data_folder in data_folders:
-        # Get comparable dictionaries from both the hash metadata file (i.e. IA-side metadata)
-        # and local folder of files (i.e. local-side metadata of previously-downloaded files)
-        missing_metadata_items = []
-        if hash_file is not None:
-            try:
-                hashfile_metadata = get_metadata_from_hashfile(
-                    hash_file, hash_flag, identifiers, file_filters, invert_file_filtering
-                )
-            except ValueError:
-                log.error(
+    if hash_file is not None and hash_flag and hash_algorithm != "md5":
+        log.error(
+            (
+                "Hash file '%s' only contains MD5 hash values - %s verification requires cached"
+                " metadata (don't use the hash file option)"
+            ),
+            hash_file,
+            hash_algorithm.upper(),
+        )
+        return False
+
+    hash_pool = None
+    progress_bar = None
+    if hash_flag:
+        hash_pool = multiprocessing.Pool(
+            hash_processes if hash_processes is not None else get_hash_process_count(),
+            initializer=hash_pool_initializer,
+        )
+        progress_bar = tqdm.tqdm(
+            total=0, unit="B", unit_scale=True, unit_divisor=1024, disable=quiet
+        )
+
+    def verify_folder(data_folder: str) -> int:
+        return verify_data_folder(
+            data_folder,
+            hash_file,
+            no_paths_flag,
+            hash_flag,
+            cache_parent_folder,
+            identifiers,
+            file_filters,
+            invert_file_filtering,
+            quiet,
+            hash_pool,
+            progress_bar,
+            rehash_percent,
+            hash_algorithm,
+        )
+
+    try:
+        if len(data_folders) == 1:
+            errors = verify_folder(data_folders[0])
+        else:
+            with multiprocessing.pool.ThreadPool(len(data_folders)) as verify_pool:
+                errors = sum(verify_pool.map(verify_folder, data_folders))
+    finally:
+        if hash_pool is not None:
+            hash_pool.terminate()
+        if progress_bar is not None:
+            progress_bar.close()
+    if errors > 0:
+        return False
+    return True
+
+
+def verify_data_folder(
+    data_folder: str,
+    hash_file: typing.Optional[str],
+    no_paths_flag: bool,
+    hash_flag: bool,
+    cache_parent_folder: str,
+    identifiers: typing.Optional[typing.List[str]],
+    file_filters: typing.Optional[typing.List[str]],
+    invert_file_filtering: bool,
+    quiet: bool,
+    hash_pool: typing.Optional[multiprocessing.pool.Pool],
+    progress_bar: typing.Optional[tqdm.tqdm],
+    rehash_percent: float,
+    hash_algorithm: str,
+) -> int:
+    """Verify the previously-downloaded files in a data folder against metadata from the hash
+    file (or the cache, if hash_file is None), returning the number of issues found
+
+    Metadata is streamed from the hash file or cache and compared against a sorted walk of each
+    item's folder, so memory use doesn't grow with the size of the collection
+    """
+    if quiet:
+        log = logging.getLogger("quiet")
+    else:
+        log = logging.getLogger(__name__)
+    metadata_store = get_metadata_store(cache_parent_folder)
+    missing_metadata_items = []
+    cached_identifiers = []  # type: typing.List[str]
+    if hash_file is None:
+        subfolders = [
+            item
+            for item in os.listdir(data_folder)
+            if os.path.isdir(os.path.join(data_folder, item))
+        ]
+        if len(subfolders) == 0:
+            log.warning(
+                (
+                    "No item folders were found in provided data folder '%s' -"
+                    " make sure the parent download folder was provided rather than the"
+                    " item subfolder (e.g. provide '/downloads/' rather than"
+                    " '/downloads/item/'"
+                ),
+                data_folder,
+            )
+        if identifiers is not None:
+            subfolders = [subfolder for subfolder in subfolders if subfolder in identifiers]
+        # Find cache data for the subfolders (items) in question
+        cached_identifiers = sorted(metadata_store.get_cached_identifiers(subfolders))
+        for subfolder in subfolders:
+            if subfolder not in cached_identifiers:
+                log.warning(
                     (
-                        "Hash file '%s' does not match expected format - cannot be used for"
-                        " verification"
+                        "Cache data not found for subfolder/item '%s' - files for this item"
+                        " will not be checked"
                     ),
-                    hash_file,
+                    subfolder,
                 )
-                return False
+                missing_metadata_items.append(subfolder)
+
+    def iter_metadata() -> typing.Iterator[typing.Tuple[str, str, str]]:
+        """Yield (identifier, file path, hash/size) for the IA-side metadata of each file, from the
+        hash metadata file or cache - grouped by item, and excluding [identifier]_files.xml files
+        (as these regularly give false positives - see README Known Issues)
+
+        """
+        if hash_file is not None:
+            metadata = iter_metadata_from_hashfile(
+                hash_file, hash_flag, identifiers, file_filters, invert_file_filtering
+            )
         else:
-            subfolders = [
-                item
-                for item in os.listdir(data_folder)
-                if os.path.isdir(os.path.join(data_folder, item))
-            ]
-            hashfile_metadata = {}
-            if len(subfolders) == 0:
+            # Files without a hash/size value in IA metadata are noted but not counted as issues
+            metadata = (
+                (
+                    identifier,
+                    os.path.join(identifier, os.path.normpath(file_path)),
+                    (hash_value.lower().strip() if hash_value else "-1")
+                    if hash_flag
+                    else (str(size) if size is not None else "-1"),
+                )
+                for identifier, file_path, size, hash_value in metadata_store.get_files(
+                    cached_identifiers, file_filters, invert_file_filtering, hash_algorithm
+                )
+            )
+        for identifier, file_path, value in metadata:
+            if os.path.basename(file_path) != "{}_files.xml".format(identifier):
+                yield identifier, file_path, value
+
+    if hash_flag:
+        md5_or_size_str = hash_algorithm.upper()
+    else:
+        md5_or_size_str = "Size"
+
+    if identifiers is None:
+        log.info(
+            "Verification of %s metadata for files in folder '%s' begun%s",
+            md5_or_size_str,
+            data_folder,
+            " (using hash file '{}')".format(hash_file) if hash_file is not None else "",
+        )
+
+    else:
+        log.info(
+            "Verification of %s metadata for item(s) %s files in folder '%s' begun",
+            md5_or_size_str,
+            ", ".join(["'{}'".format(identifier) for identifier in identifiers]),
+            data_folder,
+        )
+
+    try:
+        if no_paths_flag:
+            metadata_count, mismatch_count = verify_data_folder_without_paths(
+                data_folder,
+                iter_metadata,
+                md5_or_size_str,
+                hash_flag,
+                quiet,
+                hash_pool,
+                progress_bar,
+                metadata_store,
+                rehash_percent,
+                hash_algorithm,
+            )
+        else:
+            metadata_count, mismatch_count = verify_data_folder_with_paths(
+                data_folder,
+                iter_metadata(),
+                md5_or_size_str,
+                hash_flag,
+                quiet,
+                hash_pool,
+                progress_bar,
+                metadata_store,
+                rehash_percent,
+                hash_algorithm,
+            )
+    except ValueError:
+        log.error(
+            "Hash file '%s' does not match expected format - cannot be used for verification",
+            hash_file,
+        )
+        return 1
+
+    if metadata_count == 0:
+        log.error(
+            "Hash file '{}' is empty - check correct file has been provided".format(hash_file)
+            if hash_file is not None
+            else "No metadata found in cache - verification cannot be performed"
+        )
+        return 1
+
+    issue_message = ""
+    if len(missing_metadata_items) > 0:
+        issue_message += "cached metadata missing for items {}; ".format(
+            ", ".join(["'{}'".format(item) for item in missing_metadata_items])
+        )
+    if mismatch_count > 0:
+        issue_message += (
+            "{} files were not present or did not match Internet Archive {} metadata; ".format(
+                mismatch_count, md5_or_size_str
+            )
+        )
+    if issue_message == "":
+        issue_message = (
+            "all files were verified against Internet Archive {} data with no issues identified"
+            .format(md5_or_size_str)
+        )
+    else:
+        issue_message = issue_message[:-2]
+    if identifiers is None:
+        log.info("Verification of folder '%s' complete: %s", data_folder, issue_message)
+    else:
+        log.info(
+            "Verification of item(s) %s in folder '%s' complete: %s",
+            ", ".join(["'{}'".format(identifier) for identifier in identifiers]),
+            data_folder,
+            issue_message,
+        )
+    return len(missing_metadata_items) + mismatch_count
+
+
+def verify_data_folder_with_paths(
+    data_folder: str,
+    metadata: typing.Iterator[typing.Tuple[str, str, str]],
+    md5_or_size_str: str,
+    hash_flag: bool,
+    quiet: bool,
+    hash_pool: typing.Optional[multiprocessing.pool.Pool],
+    progress_bar: typing.Optional[tqdm.tqdm],
+    metadata_store: MetadataStore,
+    rehash_percent: float,
+    hash_algorithm: str,
+) -> typing.Tuple[int, int]:
+    """Check that each file in the metadata (identifier, file path, hash/size) is present at its
+    relative path in the data folder with a matching hash/size, returning the number of files in
+    the metadata and the number of issues found
+
+    Each item's files are merge-joined against a sorted walk of the item's folder, and files are
+    compared as soon as their hash/size is available
+    """
+    if quiet:
+        log = logging.getLogger("quiet")
+    else:
+        log = logging.getLogger(__name__)
+    metadata_count = 0
+    mismatch_count = 0
+    # Files waiting to be hashed, with their hash value from IA metadata
+    pending_files = {}  # type: typing.Dict[str, typing.Tuple[str, str]]
+
+    def compare_values(file_path: str, value: str, local_value: str) -> None:
+        """Log and count a mismatch between the IA-side and local hash/size of a file"""
+        nonlocal mismatch_count
+        if value != local_value:
+            log.warning(
+                "File '%s' %s does not match ('%s' in IA metadata, '%s' in data folder)",
+                file_path,
+                md5_or_size_str,
+                value,
+                local_value,
+            )
+            mismatch_count += 1
+
+    def iter_files_to_hash() -> typing.Iterator[typing.Tuple[str, os.stat_result]]:
+        """Find each item's files in the data folder, comparing sizes (or yielding files to be
+        hashed) for files that are present and logging files that aren't
+
+        """
+        nonlocal metadata_count, mismatch_count
+        for identifier, item_metadata in itertools.groupby(
+            metadata, key=lambda file_metadata: file_metadata[0]
+        ):
+            expected_files = [(file_path, value) for _, file_path, value in item_metadata]
+            metadata_count += len(expected_files)
+            # Group warnings for each file in a non-existent item folder into one unified warning
+            if not os.path.isdir(os.path.join(data_folder, identifier)):
                 log.warning(
                     (
-                        "No item folders were found in provided data folder '%s' -"
+                        "Expected item folder '%s' was not found in provided data folder '%s' -"
                         " make sure the parent download folder was provided rather than the"
                         " item subfolder (e.g. provide '/downloads/' rather than"
                         " '/downloads/item/'"
                     ),
+                    identifier,
                     data_folder,
                 )
-            for subfolder in subfolders:
-                if identifiers is not None:
-                    if subfolder not in identifiers:
-                        continue
-                # Find cache data for the subfolder (item) in question
-                cache_folder = os.path.join(cache_parent_folder, subfolder)
-                if os.path.isdir(cache_folder):
-                    # Get most recent cache file in folder
-                    cache_files = sorted(
-                        [
-                            f.path
-                            for f in os.scandir(cache_folder)
-                            if f.is_file() and f.name.endswith("metadata.txt")
-                        ]
+                log.warning(
+                    "Files in non-existent folder '%s' not found: %s",
+                    identifier,
+                    ", ".join(["'{}'".format(file_path) for file_path, _ in expected_files]),
+                )
+                mismatch_count += len(expected_files)
+                continue
+            for file_path, value, entry in merge_join_item_files(
+                data_folder, identifier, expected_files
+            ):
+                if entry is None:
+                    log.warning("File '%s' not found in data folder '%s'", file_path, data_folder)
+                    mismatch_count += 1
+                elif value == "-1" and hash_flag and hash_algorithm != "md5":
+                    log_missing_checksum(log, file_path, md5_or_size_str)
+                    mismatch_count += 1
+                elif value == "-1":
+                    log.debug(
+                        (
+                            "File '%s' %s is not available in IA metadata, so verification not"
+                            " performed on this file"
+                        ),
+                        file_path,
+                        md5_or_size_str,
                     )
-                    if len(cache_files) > 0:
-                        cache_file = cache_files[-1]
-                        try:
-                            hashfile_metadata.update(
-                                get_metadata_from_hashfile(
-                                    cache_file,
-                                    hash_flag,
-                                    identifiers,
-                                    file_filters,
-                                    invert_file_filtering,
-                                )
-                            )
-                        except ValueError:
-                            log.warning(
-                                (
-                                    "Cache file '%s' does not match expected format - cannot be"
-                                    " used for verification"
-                                ),
-                                cache_file,
-                            )
-                            missing_metadata_items.append(subfolder)
-                    else:
+                else:
+                    try:
+                        file_stat = entry.stat()
+                    except OSError:
                         log.warning(
                             (
-                                "Cache data not found for subfolder/item '%s' - files for this item"
-                                " will not be checked"
+                                "PermissionError/OSError occurred when accessing file '%s' - try"
+                                " running script as admin"
                             ),
-                            subfolder,
+                            entry.path,
                         )
-                        missing_metadata_items.append(subfolder)
-                else:
-                    log.warning(
-                        (
-                            "Cache data not found for subfolder/item '%s' - files for this item"
-                            " will not be checked"
-                        ),
-                        subfolder,
-                    )
-                    missing_metadata_items.append(subfolder)
+                        mismatch_count += 1
+                        continue
+                    if hash_flag:
+                        pending_files[entry.path] = (file_path, value)
+                        yield entry.path, file_stat
+                    else:
+                        compare_values(file_path, value, str(file_stat.st_size))
 
-        if len(hashfile_metadata) == 0:
-            log.error(
-                "Hash file '{}' is empty - check correct file has been provided".format(hash_file)
-                if hash_file is not None
-                else "No metadata found in cache - verification cannot be performed"
-            )
-            errors += 1
-            continue
+    if hash_flag:
+        for local_file_path, local_value in iter_file_hash_values(
+            iter_files_to_hash(),
+            hash_pool,  # type: ignore
+            progress_bar,  # type: ignore
+            metadata_store,
+            rehash_percent,
+            hash_algorithm,
+        ):
+            file_path, value = pending_files.pop(local_file_path)
+            if local_value is None:
+                mismatch_count += 1  # Warning has already been logged
+            else:
+                compare_values(file_path, value, local_value)
+    else:
+        for _ in iter_files_to_hash():
+            pass
+    return metadata_count, mismatch_count
 
-        relative_paths_from_ia_metadata = list(hashfile_metadata.keys())
 
-        if hash_flag:
-            md5_or_size_str = "MD5"
-        else:
-            md5_or_size_str = "Size"
+def log_missing_checksum(log: logging.Logger, file_path: str, hash_name: str) -> None:
+    """Warn that a file can't be verified because its cached metadata has no value for the chosen
+    hash algorithm (e.g. metadata imported from a cache file written by an earlier version, which
+    only recorded MD5 values)
 
-        if identifiers is None:
-            log.info(
-                "Verification of %s metadata for files in folder '%s' begun%s",
-                md5_or_size_str,
-                data_folder,
-                " (using hash file '{}')".format(hash_file) if hash_file is not None else "",
-            )
+    """
+    log.warning(
+        (
+            "File '%s' has no %s value in cached metadata, so has not been verified - verify using"
+            " MD5, or refresh the item's metadata (e.g. by downloading it with '--cacherefresh')"
+        ),
+        file_path,
+        hash_name,
+    )
 
-        else:
-            log.info(
-                "Verification of %s metadata for item(s) %s files in folder '%s' begun",
+
+def verify_data_folder_without_paths(
+    data_folder: str,
+    iter_metadata: typing.Callable[[], typing.Iterator[typing.Tuple[str, str, str]]],
+    md5_or_size_str: str,
+    hash_flag: bool,
+    quiet: bool,
+    hash_pool: typing.Optional[multiprocessing.pool.Pool],
+    progress_bar: typing.Optional[tqdm.tqdm],
+    metadata_store: MetadataStore,
+    rehash_percent: float,
+    hash_algorithm: str,
+) -> typing.Tuple[int, int]:
+    """Check that each hash/size in the metadata is present somewhere in the data folder (for
+    files that have been moved from their original relative paths), returning the number of files
+    in the metadata and the number of issues found
+
+    The number of local files with each hash/size is compared against the number of files with
+    that hash/size in the metadata, so deleted duplicate copies of a file are flagged. Only these
+    counts are held in memory - the metadata (from iter_metadata) is read a second time to find
+    the original file paths of any hashes/sizes that are missing
+    """
+    if quiet:
+        log = logging.getLogger("quiet")
+    else:
+        log = logging.getLogger(__name__)
+    metadata_count = 0
+    missing_checksum_count = 0
+    expected_value_counts = collections.Counter()  # type: typing.Counter[str]
+    for _, file_path, value in iter_metadata():
+        metadata_count += 1
+        if value == "-1" and hash_flag and hash_algorithm != "md5":
+            log_missing_checksum(log, file_path, md5_or_size_str)
+            missing_checksum_count += 1
+        elif value == "-1":
+            log.debug(
+                (
+                    "File '%s' %s is not available in IA metadata, so verification not performed"
+                    " on this file"
+                ),
+                file_path,
                 md5_or_size_str,
-                ", ".join(["'{}'".format(identifier) for identifier in identifiers]),
-                data_folder,
             )
-
-        mismatch_count = 0
-        if no_paths_flag:
-            folder_metadata = get_metadata_from_files_in_folder(data_folder, hash_flag)
         else:
-            unique_identifier_dirs_from_ia_metadata = sorted(
-                list(
-                    set(
-                        [
-                            pathlib.Path(relative_path).parts[0]
-                            for relative_path in relative_paths_from_ia_metadata
-                        ]
-                    )
-                )
-            )
-            # Print warnings for item folders referenced in IA metadata that aren't found in
-            # the provided data folder
-            nonexistent_dirs = []
-            for identifier_dir in unique_identifier_dirs_from_ia_metadata:
-                if not os.path.isdir(os.path.join(data_folder, identifier_dir)):
-                    log.warning(
-                        (
-                            "Expected item folder '%s' was not found in provided data folder '%s' -"
-                            " make sure the parent download folder was provided rather than the"
-                            " item subfolder (e.g. provide '/downloads/' rather than"
-                            " '/downloads/item/'"
-                        ),
-                        identifier_dir,
-                        data_folder,
-                    )
-                    nonexistent_dirs.append(identifier_dir)
-
-            folder_metadata = get_metadata_from_files_in_folder(
-                data_folder, hash_flag, relative_paths_from_ia_metadata
-            )
+            expected_value_counts[value] += 1
 
-            # Group warnings for each file in a non-existent folder into one unified warning
-            for nonexistent_dir in nonexistent_dirs:
-                nonexistent_files = [
-                    relative_path
-                    for relative_path in relative_paths_from_ia_metadata
-                    if pathlib.Path(relative_path).parts[0] == nonexistent_dir
-                ]
+    def iter_local_files() -> typing.Iterator[typing.Tuple[str, os.stat_result]]:
+        """Yield (file path, stat result) for each file in the data folder"""
+        for _, entry in iter_sorted_folder_files(data_folder):
+            try:
+                yield entry.path, entry.stat()
+            except OSError:
                 log.warning(
-                    "Files in non-existent folder '%s' not found: %s",
-                    nonexistent_dir,
-                    ", ".join(
-                        ["'{}'".format(nonexistent_file) for nonexistent_file in nonexistent_files]
+                    (
+                        "PermissionError/OSError occurred when accessing file '%s' - try"
+                        " running script as admin"
                     ),
+                    entry.path,
                 )
 
-                mismatch_count += len(nonexistent_files)
-                # Delete non-existent files from the hashfile_metadata so we don't end up
-                # iterating these later and printing more warning messages than necessary
-                for nonexistent_file in nonexistent_files:
-                    if nonexistent_file in hashfile_metadata:
-                        del hashfile_metadata[nonexistent_file]
-
-        # Don't consider the [identifier]_files.xml files, as these regularly gives false
-        # positives (see README Known Issues)
-        xml_files_to_be_removed = [
-            relative_path
-            for relative_path in relative_paths_from_ia_metadata
-            if os.path.basename(relative_path)
-            == "{}_files.xml".format(pathlib.Path(relative_path).parts[0])
-        ]
-        for xml_file_to_be_removed in xml_files_to_be_removed:
-            if xml_file_to_be_removed in hashfile_metadata:
-                del hashfile_metadata[xml_file_to_be_removed]
-
-        # If user has moved files, so they're no longer in the same relative file paths, they
-        # will need to set the 'nopaths' flag so that only hash/size metadata is checked rather
-        # than path data as well
-        # Disadvantage of this approach is that, if a file is stored in multiple locations, the
-        # unique hash/size will only be checked for once - so any deletions of multiple copies
-        # of the file will not be flagged
-        if no_paths_flag:
-            # Iterate only for hashes/sizes in the IA metadata that are not present in the local
-            # folder of downloaded files
-            for value in [
-                value
-                for value in hashfile_metadata.values()
-                if value not in folder_metadata.values()
-            ]:
-                log.warning(
-                    "%s '%s' (original filename(s) '%s') not found in data folder",
-                    md5_or_size_str,
-                    value,
-                    [k for k, v in hashfile_metadata.items() if v == value],
-                )
-                mismatch_count += 1
+    if hash_flag:
+        local_value_counts = collections.Counter(
+            local_value
+            for _, local_value in iter_file_hash_values(
+                iter_local_files(),
+                hash_pool,  # type: ignore
+                progress_bar,  # type: ignore
+                metadata_store,
+                rehash_percent,
+                hash_algorithm,
+            )
+            if local_value is not None
+        )
+    else:
+        local_value_counts = collections.Counter(
+            str(file_stat.st_size) for _, file_stat in iter_local_files()
+        )
 
+    # Report only hashes/sizes in the IA metadata with fewer copies in the local folder of
+    # downloaded files than expected
+    missing_counts = {
+        value: expected_count - local_value_counts[value]
+        for value, expected_count in expected_value_counts.items()
+        if expected_count > local_value_counts[value]
+    }
+    expected_file_paths = {}  # type: typing.Dict[str, typing.List[str]]
+    if len(missing_counts) > 0:
+        for _, file_path, value in iter_metadata():
+            if value in missing_counts:
+                expected_file_paths.setdefault(value, []).append(file_path)
+    for value, file_paths in expected_file_paths.items():
+        if missing_counts[value] == len(file_paths):
+            log.warning(
+                "%s '%s' (original filename(s) '%s') not found in data folder",
+                md5_or_size_str,
+                value,
+                file_paths,
+            )
         else:
-            for file_path, value in hashfile_metadata.items():
-                if file_path not in folder_metadata:
-                    log.warning("File '%s' not found in data folder '%s'", file_path, data_folder)
-                    mismatch_count += 1
-                else:
-                    if value != folder_metadata[file_path]:
-                        if value != "-1":
-                            log.warning(
-                                (
-                                    "File '%s' %s does not match ('%s' in IA metadata, '%s' in data"
-                                    " folder)"
-                                ),
-                                file_path,
-                                md5_or_size_str,
-                                value,
-                                folder_metadata[file_path],
-                            )
+            log.warning(
+                (
+                    "%s '%s' (original filename(s) '%s') found in data folder %s times, but"
+                    " expected %s times"
+                ),
+                md5_or_size_str,
+                value,
+                file_paths,
+                len(file_paths) - missing_counts[value],
+                len(file_paths),
+            )
+    return metadata_count, sum(missing_counts.values()) + missing_checksum_count
 
-                            mismatch_count += 1
-                        else:
-                            log.debug(
-                                (
-                                    "File '%s' %s is not available in IA metadata, so verification"
-                                    " not performed on this file"
-                                ),
-                                file_path,
-                                md5_or_size_str,
-                            )
 
-        issue_message = ""
-        if len(missing_metadata_items) > 0:
-            issue_message += "cached metadata missing for items {}; ".format(
-                ", ".join(["'{}'".format(item) for item in missing_metadata_items])
+def scrape_search_pages(
+    session: requests.Session,
+    search: str,
+    query: str,
+    cursor: typing.Optional[str],
+    retry_policy: RetryPolicy,
+) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yield pages of results (identifier and 'addeddate' of each item) for a query from the
+    Internet Archive scrape API, starting from the page at the provided cursor
+
+    The final page has no 'cursor' value; if pages stop before then, the reason has been logged
+    """
+    log = logging.getLogger(__name__)
+    search_host = get_url_host(session.host)  # type: ignore
+    scrape_url = "{}//{}/services/search/v1/scrape".format(
+        session.protocol, session.host  # type: ignore
+    )
+    connection_retry_counter = 0
+    while True:
+        retry_policy.wait_for_host(search_host)
+        scrape_params = {"q": query, "fields": "identifier,addeddate", "count": 10000}
+        if cursor is not None:
+            scrape_params["cursor"] = cursor
+        try:
+            response = session.post(
+                scrape_url, params=scrape_params, auth=get_session_auth(session), timeout=60
             )
-        if mismatch_count > 0:
-            issue_message += (
-                "{} files were not present or did not match Internet Archive {} metadata; ".format(
-                    mismatch_count, md5_or_size_str
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.exceptions.HTTPError(response=response)
+            search_page = response.json()
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ReadTimeout,
+            requests.exceptions.HTTPError,
+            ValueError,
+        ) as exception:
+            retry_policy.record_failure(search_host)
+            if connection_retry_counter < retry_policy.max_retries:
+                wait_time = retry_policy.wait_time(
+                    connection_retry_counter, getattr(exception, "response", None)
                 )
+                log.info(
+                    (
+                        "Connection error occurred when attempting to connect to Internet"
+                        " Archive to get info for search term '%s' - is internet connection"
+                        " active? Waiting %s minutes before retrying (will retry %s more times)"
+                    ),
+                    search,
+                    int(wait_time / 60),
+                    retry_policy.max_retries - connection_retry_counter,
+                )
+
+                time.sleep(wait_time)
+                connection_retry_counter += 1
+                continue
+            log.warning(
+                (
+                    "Connection error persisted when attempting to connect to Internet"
+                    " Archive - is internet connection active? Download of search term '%s'"
+                    " items have failed (the search will resume from this point next time)"
+                ),
+                search,
             )
-        if issue_message == "":
-            issue_message = (
-                "all files were verified against Internet Archive {} data with no issues identified"
-                .format(md5_or_size_str)
-            )
-        else:
-            issue_message = issue_message[:-2]
-        if identifiers is None:
-            log.info("Verification of folder '%s' complete: %s", data_folder, issue_message)
-        else:
-            log.info(
-                "Verification of item(s) %s in folder '%s' complete: %s",
-                ", ".join(["'{}'".format(identifier) for identifier in identifiers]),
-                data_folder,
-                issue_message,
+            return
+        retry_policy.record_success(search_host)
+        connection_retry_counter = 0
+
+        if search_page.get("error"):
+            log.warning(
+                "Internet Archive search term '%s' could not be searched: %s",
+                search,
+                search_page["error"],
             )
-        errors += len(missing_metadata_items) + mismatch_count
-    if errors > 0:
-        return False
-    return True
+            return
+        yield search_page
+        cursor = search_page.get("cursor")
+        if cursor is None:
+            return
+
+
+def get_search_page_details(
+    search_page: typing.Dict[str, typing.Any]
+) -> typing.Tuple[typing.List[str], typing.Optional[str]]:
+    """Return the identifiers in a page of scrape API results, and the page's newest 'addeddate'"""
+    identifiers = [item["identifier"] for item in search_page.get("items", [])]
+    added_dates = [
+        item["addeddate"] for item in search_page.get("items", []) if item.get("addeddate")
+    ]
+    return identifiers, max(added_dates) if len(added_dates) > 0 else None
 
 
 def get_identifiers_from_search_term(
-    search: str, cache_parent_folder: str, cache_refresh: bool
-) -> typing.List[str]:
+    search: str,
+    cache_parent_folder: str,
+    cache_refresh: bool,
+    retry_policy: typing.Optional[RetryPolicy] = None,
+    session: typing.Optional[requests.Session] = None,
+    incremental: bool = False,
+) -> typing.Iterator[str]:
+    """Yield the identifiers of the items matching an Internet Archive search as each page of
+    results arrives, so that downloads can start before the search has been fully enumerated
+
+    Each page is stored in the metadata cache along with the cursor for the next page, so an
+    interrupted enumeration resumes from where it stopped. If incremental (and the cache isn't
+    being refreshed), a cached search is updated by only searching for items added since the
+    newest item it contains, and only those new items are yielded
+    """
     log = logging.getLogger(__name__)
-    MAX_RETRIES = 5
-    identifiers = []
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+    if session is None:
+        session = internetarchive.get_session()
     # See if the search exists in the cache
-    cache_folder = os.path.join(cache_parent_folder, f"search-{get_safe_path_name(search)}")
-    if not cache_refresh and os.path.isdir(cache_folder):
-        cache_files = sorted(
-            [
-                f.path
-                for f in os.scandir(cache_folder)
-                if f.is_file() and f.name.endswith("items.txt")
-            ]
+    metadata_store = get_metadata_store(cache_parent_folder)
+    newest_added_date = None
+    if incremental and not cache_refresh:
+        newest_added_date = metadata_store.get_newest_added_date(search)
+    if newest_added_date is not None:
+        identifiers = metadata_store.get_search_identifiers(search)
+        if identifiers is not None and len(identifiers) > 0:
+            yield from get_new_identifiers_from_search_term(
+                search, newest_added_date, metadata_store, retry_policy, session
+            )
+            return
+    if not cache_refresh:
+        identifiers = metadata_store.get_search_identifiers(
+            search, max_age=datetime.timedelta(weeks=1)
         )
-        if len(cache_files) > 0:
-            cache_file = cache_files[-1]
-            # Get datetime from filename
-            datetime_str = "_".join(os.path.basename(cache_file).split("_", 2)[:2])
-            file_datetime = datetime.datetime.strptime(datetime_str, "%Y%m%d_%H%M%S")
-            now_datetime = datetime.datetime.now()
-            if now_datetime - datetime.timedelta(weeks=1) <= file_datetime <= now_datetime:
-                log.debug(
-                    "Cached data from %s will be used for search term '%s'", datetime_str, search
-                )
-
-                with open(cache_file, "r", encoding="utf-8") as file_handler:
-                    for line in file_handler:
-                        identifiers.append(line.strip())
-    if len(identifiers) == 0:
-        connection_retry_counter = 0
-        connection_wait_timer = 600
-        while True:
-            try:
-                search_results = internetarchive.search_items(
-                    search, fields=["identifier"], max_retries=3
+        if identifiers is not None and len(identifiers) > 0:
+            yield from identifiers
+            return
+
+    # Resume an interrupted enumeration of the search, or otherwise start a new one
+    search_progress = None
+    if not cache_refresh:
+        search_progress = metadata_store.get_search_progress(
+            search, max_age=datetime.timedelta(weeks=1)
+        )
+    if search_progress is not None and search_progress[1] > 0:
+        cursor, result_count = search_progress
+        log.info(
+            (
+                "Resuming enumeration of search term '%s' - %s items were found before it was"
+                " interrupted"
+            ),
+            search,
+            result_count,
+        )
+        yield from metadata_store.iter_search_results(search)
+        if cursor is None:
+            metadata_store.finish_search(search)
+            return
+    else:
+        metadata_store.start_search(search)
+        cursor = None
+
+    total_logged = False
+    for search_page in scrape_search_pages(session, search, search, cursor, retry_policy):
+        if not total_logged:
+            total = int(search_page.get("total") or 0)
+            if total == 0:
+                log.warning(
+                    (
+                        "No items associated with search term '%s' were identified - was the"
+                        " search term entered correctly?"
+                    ),
+                    search,
                 )
-                for search_result in search_results:
-                    identifiers.append(search_result["identifier"])
-                if len(identifiers) > 0:
-                    log.info(
-                        (
-                            "Internet Archive search term '%s' contains %s individual Internet"
-                            " Archive items; each will be downloaded"
-                        ),
-                        search,
-                        len(identifiers),
-                    )
-                    # Create cache folder for search if it doesn't already exist
-                    pathlib.Path(cache_folder).mkdir(parents=True, exist_ok=True)
-
-                    # Write search's identifiers to metadata file
-                    with open(
-                        os.path.join(
-                            cache_folder,
-                            "{}_{}_items.txt".format(
-                                datetime.datetime.now().strftime("%Y%m%d_%H%M%S"),
-                                get_safe_path_name(search),
-                            ),
-                        ),
-                        "w",
-                        encoding="utf-8",
-                    ) as file_handler:
-                        for identifier in identifiers:
-                            file_handler.write("{}\n".format(identifier))
-                else:
-                    log.warning(
-                        (
-                            "No items associated with search term '%s' were identified - was the"
-                            " search term entered correctly?"
-                        ),
-                        search,
-                    )
-                    return []
-            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
-                if connection_retry_counter < MAX_RETRIES:
-                    log.info(
-                        (
-                            "Connection error occurred when attempting to connect to Internet"
-                            " Archive to get info for search term '%s' - is internet connection"
-                            " active? Waiting %s minutes before retrying (will retry %s more times)"
-                        ),
-                        search,
-                        int(connection_wait_timer / 60),
-                        MAX_RETRIES - connection_retry_counter,
-                    )
-
-                    time.sleep(connection_wait_timer)
-                    connection_retry_counter += 1
-                    connection_wait_timer *= (
-                        2  # Add some delay for each retry in case connection issue is ongoing
-                    )
-                else:
-                    log.warning(
-                        (
-                            "Connection error persisted when attempting to connect to Internet"
-                            " Archive - is internet connection active? Download of search term '%s'"
-                            " items have failed"
-                        ),
-                        search,
-                    )
-                    return []
-            # If no further errors, break from the True loop
-            else:
-                break
-    return identifiers
+                return
+            log.info(
+                (
+                    "Internet Archive search term '%s' contains %s individual Internet"
+                    " Archive items; each will be downloaded"
+                ),
+                search,
+                total,
+            )
+            total_logged = True
+
+        page_identifiers, page_newest_added_date = get_search_page_details(search_page)
+        cursor = search_page.get("cursor")
+        metadata_store.add_search_page(search, page_identifiers, cursor, page_newest_added_date)
+        if cursor is None:
+            metadata_store.finish_search(search)
+        yield from page_identifiers
+
+
+def get_new_identifiers_from_search_term(
+    search: str,
+    newest_added_date: str,
+    metadata_store: MetadataStore,
+    retry_policy: RetryPolicy,
+    session: requests.Session,
+) -> typing.Iterator[str]:
+    """Yield identifiers of items matching a cached search that were added to Internet Archive
+    since the newest item in the cache (adding them to the cached search)
+    """
+    log = logging.getLogger(__name__)
+    log.info(
+        "Checking for items added to search term '%s' since %s", search, newest_added_date
+    )
+    new_identifier_count = 0
+    for search_page in scrape_search_pages(
+        session,
+        search,
+        "({}) AND addeddate:[{} TO null]".format(search, newest_added_date),
+        None,
+        retry_policy,
+    ):
+        page_identifiers, page_newest_added_date = get_search_page_details(search_page)
+        new_identifiers = metadata_store.add_new_search_results(
+            search, page_identifiers, page_newest_added_date
+        )
+        new_identifier_count += len(new_identifiers)
+        if search_page.get("cursor") is None:
+            metadata_store.finish_search(search)
+            log.info(
+                "%s items have been added to search term '%s' since it was last searched",
+                new_identifier_count,
+                search,
+            )
+        yield from new_identifiers
 
 
 def main() -> None:
@@ -1882,8 +4959,8 @@ def main() -> None:
         type=check_argument_int_greater_than_one,
         default=5,
         help=(
-            "Number of download threads (i.e. how many downloads to perform simultaneously)"
-            " (default is 5)"
+            "Number of download threads (i.e. how many files to download simultaneously, within"
+            " the connection budget) (default is 5)"
         ),
     )
     download_parser.add_argument(
@@ -1907,8 +4984,96 @@ def main() -> None:
         type=check_argument_int_greater_than_one,
         default=1,
         help=(
-            "To increase per-file download speeds, split files above 10MB into provided number of"
-            " chunks, and reconstruct on completion"
+            "To increase per-file download speeds, download files above 10MB using up to the"
+            " provided number of connections each (within the connection budget)"
+        ),
+    )
+    download_parser.add_argument(
+        "--connections",
+        type=check_argument_int_greater_than_one,
+        default=5,
+        help=(
+            "Maximum number of simultaneous download connections, shared between files being"
+            " downloaded simultaneously and split file downloads (default is 5)"
+        ),
+    )
+    download_parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help=(
+            "Number of times to retry a download, metadata request or search after a connection"
+            " error or temporary server error (default is 5)"
+        ),
+    )
+    download_parser.add_argument(
+        "--retrywait",
+        type=check_argument_int_greater_than_one,
+        default=600,
+        help=(
+            "Seconds to wait before the first retry; the wait doubles for each further retry, with"
+            " random jitter (default is 600). A Retry-After time sent by the server is used instead"
+            " where given"
+        ),
+    )
+    download_parser.add_argument(
+        "--breakerthreshold",
+        type=check_argument_int_greater_than_one,
+        default=3,
+        help=(
+            "Number of consecutive failures for a host (e.g. an Internet Archive datanode) before"
+            " all requests to it are paused (default is 3)"
+        ),
+    )
+    download_parser.add_argument(
+        "--breakercooldown",
+        type=check_argument_int_greater_than_one,
+        default=300,
+        help="Seconds to pause requests to a failing host for (default is 300)",
+    )
+    download_parser.add_argument(
+        "--ratelimit",
+        type=check_argument_rate,
+        help=(
+            "Maximum combined download rate across all downloads, in bytes per second with an"
+            " optional K/M/G suffix (e.g. '2M')"
+        ),
+    )
+    download_parser.add_argument(
+        "--ratelimitschedule",
+        type=check_argument_rate_schedule_entry,
+        nargs="+",
+        help=(
+            "One or more (space separated) time-of-day rate limits of the form"
+            " 'HH:MM-HH:MM=RATE' (e.g. '08:00-18:00=1M 18:00-08:00=unlimited'), overriding"
+            " --ratelimit during those times"
+        ),
+    )
+    download_parser.add_argument(
+        "--poolsize",
+        type=check_argument_int_greater_than_one,
+        help=(
+            "Maximum number of keep-alive connections to hold open for reuse across downloads (if"
+            " not specified, this will be the connection budget plus one per metadata prefetch"
+            " thread, and one for searches)"
+        ),
+    )
+    download_parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=4,
+        help=(
+            "Number of upcoming items to fetch Internet Archive metadata for in the background"
+            " while the current item downloads (0 to fetch metadata as each item is reached)"
+        ),
+    )
+    download_parser.add_argument(
+        "--globalqueue",
+        action="store_true",
+        help=(
+            "Download files from several items at once using a single queue of files (rather than"
+            " finishing each item before starting the next) - useful where many items each contain"
+            " only a few files"
         ),
     )
     download_parser.add_argument(
@@ -1956,6 +5121,16 @@ def main() -> None:
         action="store_true",
         help="Flag to update any cached Internet Archive metadata from previous script executions",
     )
+    download_parser.add_argument(
+        "--incrementalsearch",
+        default=False,
+        action="store_true",
+        help=(
+            "Flag to update cached search results by only searching for items added to Internet"
+            " Archive since the newest cached result, rather than repeating the whole search; only"
+            " the newly added items are downloaded (ignored if '--cacherefresh' is used)"
+        ),
+    )
 
     verify_parser = subparsers.add_parser("verify")
     verify_parser.add_argument(
@@ -2014,6 +5189,39 @@ def main() -> None:
             " files are stored)"
         ),
     )
+    verify_parser.add_argument(
+        "--hashprocesses",
+        type=check_argument_int_greater_than_one,
+        default=get_hash_process_count(),
+        help=(
+            "Number of processes used to hash files in parallel (by default, one per CPU core"
+            " other than the core running the script); lower this if verification is slowing"
+            " down other work on the same disks"
+        ),
+    )
+    verify_parser.add_argument(
+        "--rehashpercent",
+        type=check_argument_percentage,
+        default=0,
+        help=(
+            "Files that haven't changed (by size, modification time and inode) since they were"
+            " last hashed use their recorded hash value; this percentage of them (those hashed"
+            " longest ago) will be re-hashed anyway, to detect silent data corruption - use 100 to"
+            " re-hash every file"
+        ),
+    )
+    verify_parser.add_argument(
+        "--hashalgorithm",
+        type=str.lower,
+        choices=HASH_ALGORITHMS,
+        default="md5",
+        help=(
+            "Hash values to compare against Internet Archive metadata: 'crc32' is several times"
+            " faster to calculate, so is suited to routine checks, while 'md5' (default) or"
+            " 'sha1' give a stronger check (not 'crc32' or 'sha1' if --hashfile is used, as hash"
+            " files only contain MD5 values)"
+        ),
+    )
 
     args = parser.parse_args()
 
@@ -2054,36 +5262,67 @@ def main() -> None:
                 log.info(
                     "Internet Archive metadata will be written to hash file at '%s'", args.hashfile
                 )
-            if args.threads > 5 or args.split > 5:
+            if args.connections > 5:
                 log.info(
-                    "Reducing download threads to 5, to optimise script performance and reduce"
-                    " Internet Archive server load"
+                    "Using a budget of %s connections - please consider Internet Archive server"
+                    " load when using more than 5 connections",
+                    args.connections,
                 )
-                args.threads = min(args.threads, 5)
-                args.split = min(args.split, 5)
-            if args.split > 1:
-                if args.threads > 1:
-                    log.info(
-                        "While using file splitting, only one file will be downloaded at a time so"
-                        " as to not overwhelm Internet Archive servers"
-                    )
-                    args.threads = 1
+            # Threads and split count are limits within a single connection budget for the whole
+            # run: large files are given extra connections as they become free, while other files
+            # are downloaded using the remaining connections
+            connection_budget = ConnectionBudget(args.connections)
+            bandwidth_limiter.set_limits(args.ratelimit, args.ratelimitschedule)
+            retry_policy = RetryPolicy(
+                max_retries=max(args.retries, 0),
+                initial_wait=args.retrywait,
+                breaker_threshold=args.breakerthreshold,
+                breaker_cooldown=args.breakercooldown,
+            )
+            # One connection pool is shared by every download thread (and file split thread) for
+            # the whole run, so that TCP/TLS connections are reused between files; by default it
+            # also has room for the metadata prefetch threads and the main thread's search and
+            # metadata requests, so that their connections aren't discarded as the pool overflows
+            session = get_download_session(
+                args.poolsize
+                if args.poolsize is not None
+                else connection_budget.size + max(args.prefetch, 0) + 1
+            )
             hashfile_file_handler = None
             if args.hashfile:
                 hashfile_file_handler = open(args.hashfile, "w", encoding="utf-8")
-            identifiers = args.identifiers if args.identifiers is not None else []
-            if args.search:
-                for search in args.search:
-                    identifiers.extend(
-                        get_identifiers_from_search_term(
-                            search=search,
-                            cache_parent_folder=os.path.join(args.logfolder, log_subfolders[1]),
-                            cache_refresh=args.cacherefresh,
-                        )
+            # Search results are passed on to be downloaded as each page of results arrives
+            identifiers = itertools.chain(
+                args.identifiers if args.identifiers is not None else [],
+                itertools.chain.from_iterable(
+                    get_identifiers_from_search_term(
+                        search=search,
+                        cache_parent_folder=os.path.join(args.logfolder, log_subfolders[1]),
+                        cache_refresh=args.cacherefresh,
+                        retry_policy=retry_policy,
+                        session=session,
+                        incremental=args.incrementalsearch,
                     )
-            for identifier in identifiers:
-                download(
-                    identifier=identifier,
+                    for search in (args.search if args.search is not None else [])
+                ),
+            )
+            # Metadata for upcoming items is fetched while the current item downloads; items whose
+            # metadata couldn't be fetched are skipped (this is logged when the fetch fails)
+            items = (
+                (identifier, item_files)
+                for identifier, item_files in prefetch_item_file_metadata(
+                    identifiers=identifiers,
+                    prefetch_count=max(args.prefetch, 0),
+                    session=session,
+                    cache_parent_folder=os.path.join(args.logfolder, log_subfolders[1]),
+                    cache_refresh=args.cacherefresh,
+                    retry_policy=retry_policy,
+                )
+                if item_files is not None
+            )
+            if args.globalqueue:
+                download_items(
+                    items=items,
                     output_folder=args.output,
                     hash_file=hashfile_file_handler,
                     thread_count=args.threads,
@@ -2094,13 +5333,36 @@ def main() -> None:
                     invert_file_filtering=args.invertfilefiltering,
                     cache_parent_folder=os.path.join(args.logfolder, log_subfolders[1]),
                     cache_refresh=args.cacherefresh,
-                    task_id="download_{}".format(identifier),
-                    status_lock=None,
-                    download_status=None
+                    session=session,
+                    connection_budget=connection_budget,
+                    retry_policy=retry_policy,
                 )
+            else:
+                for identifier, item_files in items:
+                    download(
+                        identifier=identifier,
+                        output_folder=args.output,
+                        hash_file=hashfile_file_handler,
+                        thread_count=args.threads,
+                        resume_flag=args.resume,
+                        verify_flag=args.verify,
+                        split_count=args.split,
+                        file_filters=args.filefilters,
+                        invert_file_filtering=args.invertfilefiltering,
+                        cache_parent_folder=os.path.join(args.logfolder, log_subfolders[1]),
+                        cache_refresh=args.cacherefresh,
+                        task_id="download_{}".format(identifier),
+                        status_lock=None,
+                        download_status=None,
+                        session=session,
+                        connection_budget=connection_budget,
+                        retry_policy=retry_policy,
+                        item_files=item_files,
+                    )
 
             if hashfile_file_handler is not None:
                 hashfile_file_handler.close()
+            log_session_stats(session)
 
         elif args.command == "verify":
             verify(
@@ -2112,6 +5374,9 @@ def main() -> None:
                 identifiers=args.identifiers,
                 file_filters=args.filefilters,
                 invert_file_filtering=args.invertfilefiltering,
+                hash_processes=args.hashprocesses,
+                rehash_percent=args.rehashpercent,
+                hash_algorithm=args.hashalgorithm,
             )
 
         if counter_handler.count["WARNING"] > 0 or counter_handler.count["ERROR"] > 0: